@@ -0,0 +1,317 @@
+# app.py
+#
+# The application: the asyncio tasks that make up the main loop, and
+# build_app, which assembles the UI and logger around whatever hardware
+# (real, or the host simulation in sim/) it is given.
+
+import asyncio
+import gc
+
+import displayio
+
+from displays import DataDisplay, TimeDisplay
+from export import ExportServer
+from localclock import log
+from logdata import MultiRateLog, Stream
+from logstore import FlushPolicy
+from profiler import NO_PROFILER, TICKS_MASK, ticks_ms
+from quantize import Linear, LogScale
+from sampler import SensorSampler
+
+
+class ClockApp(object):
+  """The main loop, as cooperative asyncio tasks.
+
+  Each concern runs as its own task and sleeps until it next has work:
+    clock_task: once a second, redraws the clock face;
+    clock.resync_task: periodically realigns the clock with the RTC;
+    sampler_task: wakes at each data_log.interval_secs boundary to log
+      whatever read_sensor(channels) returns for the channels that are
+      due (e.g. SensorSampler.take_interval);
+    button_task and pir_task: poll their inputs;
+    screensaver_task: sleeps until the idle timeout could expire;
+    watchdog_task: if reset_free_bytes is set, saves the log and calls reset
+      when free memory stays below it even after a collection.
+
+  The steady state doesn't allocate, so there is no scheduled reset; the
+  watchdog is a backstop.
+
+  Startup is staged so the panel isn't dark while history loads: the clock
+  face is drawn at once, then on each following tick one history file is
+  read (if data_log was built with defer_load) or one plot drawn, and only
+  then do logging and the other tasks start.  The milliseconds from
+  boot_ms (a ticks_ms value; 0 is power-on on the device) to the first
+  frame and to the full UI are kept in first_frame_ms and full_ui_ms.
+
+  Clock face updates and display refreshes are timed as profiler spans
+  'face' and 'refresh'.
+  """
+  def __init__(self, clock, read_sensor, data_log, time_disp, display, master_group,
+               debounced_button, pir_sensor, reset=None, screensaver_secs=300,
+               reset_free_bytes=None, watchdog_secs=60, tasks=(), profiler=None, boot_ms=0,
+               data_displays=(), sensor_sampler=None, export_server=None):
+    self.clock = clock
+    self.now = clock.now
+    self.read_sensor = read_sensor
+    self.data_log = data_log
+    self.time_disp = time_disp
+    self.display = display
+    self.master_group = master_group
+    # For blanking
+    self.blank_group = displayio.Group()
+    self.debounced_button = debounced_button
+    self.pir_sensor = pir_sensor
+    self.reset = reset
+    # How long until screen blanks?
+    self.screensaver_secs = screensaver_secs
+    # Free memory below which to reset, and how often to check it.
+    self.reset_free_bytes = reset_free_bytes
+    self.watchdog_secs = watchdog_secs
+    self.display_on = True
+    self.display_was_on = False
+    # Timer for screen dim
+    self.last_action_secs = self.now()
+    self.button_poll_secs = 0.02
+    self.pir_poll_secs = 0.05
+    # Other coroutine functions to run alongside ours, e.g. the sensor sampler's.
+    self.tasks = tasks
+    # The plots, the sampler behind read_sensor and the export server, if
+    # any, for whoever inspects the running app (e.g. sim.runner).
+    self.data_displays = data_displays
+    self.sensor_sampler = sensor_sampler
+    self.export_server = export_server
+    profiler = profiler or NO_PROFILER
+    self.face_span = profiler.span('face')
+    self.refresh_span = profiler.span('refresh')
+    # Startup metrics.
+    self.boot_ms = boot_ms
+    self.first_frame_ms = None
+    self.full_ui_ms = None
+
+  def ms_since_boot(self):
+    return (ticks_ms() - self.boot_ms) & TICKS_MASK
+
+  def action(self, display_on):
+    """User activity: set the display state and restart the screensaver timer."""
+    self.display_on = display_on
+    self.last_action_secs = self.now()
+    self.show_display()
+
+  def show_display(self, secs=None):
+    """Bring the panel in line with display_on."""
+    if self.display_on:
+      if secs is not None:
+        with self.face_span:
+          self.time_disp.update_time_display(secs)
+      self.display.show(self.master_group)
+      with self.refresh_span:
+        self.display.refresh()
+      self.display_was_on = True
+      if self.first_frame_ms is None:
+        self.first_frame_ms = self.ms_since_boot()
+        log("first frame after " + str(self.first_frame_ms) + " ms")
+    elif self.display_was_on:
+      self.display.show(self.blank_group)
+      self.display.refresh()
+      self.display_was_on = False
+
+  async def clock_task(self):
+    last_secs = 0
+    while True:
+      secs = self.now()
+      if secs != last_secs:
+        last_secs = secs
+        self.show_display(secs)
+      # Sleep until just after the next second starts.
+      await asyncio.sleep(self.clock.secs_to_next_second() + 0.002)
+
+  async def sampler_task(self):
+    interval_secs = self.data_log.interval_secs
+    while True:
+      secs = self.now()
+      channels = self.data_log.channels_to_log(secs)
+      if channels:
+        self.data_log.log_data(self.read_sensor(channels), secs)
+      await asyncio.sleep(interval_secs - secs % interval_secs)
+
+  async def button_task(self):
+    while True:
+      self.debounced_button.update()
+      if self.debounced_button.rose:
+        self.action(not self.display_on)
+        log("button rose; display=" + str(self.display_on))
+      await asyncio.sleep(self.button_poll_secs)
+
+  async def pir_task(self):
+    pir_was_active = False
+    while True:
+      if self.pir_sensor.value is not pir_was_active:
+        pir_was_active = self.pir_sensor.value
+        if pir_was_active:
+          self.action(True)
+        log("pir=" + str(pir_was_active) + " display=" + str(self.display_on))
+      await asyncio.sleep(self.pir_poll_secs)
+
+  async def screensaver_task(self):
+    while True:
+      remaining = self.last_action_secs + self.screensaver_secs - self.now()
+      if remaining >= 0:
+        await asyncio.sleep(remaining + 1)
+      elif self.display_on:
+        # System is idle, blank the screen.
+        self.display_on = False
+        log("screensaver timeout")
+        self.show_display()
+      else:
+        # Already blank; wait for activity.
+        await asyncio.sleep(1)
+
+  async def watchdog_task(self):
+    while True:
+      await asyncio.sleep(self.watchdog_secs)
+      if gc.mem_free() >= self.reset_free_bytes:
+        continue
+      # Only a collection tells whether the memory is really gone.
+      gc.collect()
+      mem_free = gc.mem_free()
+      if mem_free < self.reset_free_bytes:
+        log("only " + str(mem_free) + " B free; resetting")
+        self.data_log.flush()
+        self.reset()
+
+  async def next_tick(self):
+    """Sleep until just after clock_task has drawn the next second."""
+    await asyncio.sleep(self.clock.secs_to_next_second() + 0.01)
+
+  async def staged_boot(self):
+    """Bring in the history and the plots one step per tick after the first frame."""
+    # Let clock_task draw the face before anything else.
+    await asyncio.sleep(0)
+    for _ in self.data_log.load_steps():
+      await self.next_tick()
+    for data_display in self.data_log.registered_displays:
+      if data_display.drawn_pixel is None:
+        await self.next_tick()
+        data_display.display_log()
+    self.full_ui_ms = self.ms_since_boot()
+    log("full UI after " + str(self.full_ui_ms) + " ms")
+
+  async def main(self):
+    # The face and inputs first...
+    ui_tasks = [
+        asyncio.create_task(self.clock_task()),
+        asyncio.create_task(self.button_task()),
+        asyncio.create_task(self.pir_task()),
+        asyncio.create_task(self.screensaver_task())]
+    await self.staged_boot()
+    # ...and logging once the history it appends to is in.
+    tasks = list(self.tasks)
+    if self.reset and self.reset_free_bytes:
+      tasks.append(self.watchdog_task)
+    await asyncio.gather(
+        *(ui_tasks + [asyncio.create_task(task()) for task in tasks] + [
+            asyncio.create_task(self.clock.resync_task()),
+            asyncio.create_task(self.sampler_task())]))
+
+  def run(self):
+    asyncio.run(self.main())
+
+
+FIELDS = ["°F", "%H", "Pa", "Go"]
+# How each field is held in RAM: °F and %RH to 0.01, hPa to 1 Pa, and gas
+# resistance to 3 significant figures.
+QUANTIZERS = [Linear(0.01), Linear(0.01), Linear(0.01, offset=1000.0), LogScale(0.001)]
+# Temperature, humidity and pressure change slowly, and are kept for 40
+# hours at 12 minutes plus hourly and daily tiers; gas resistance moves
+# within minutes, and is kept for 5 hours at 2 minutes.  Both go to the one
+# log file.  The rings and tiers take 8.2 KB, against 9.1 KB with gas in
+# the first stream, leaving room for the records waiting to be written.
+# The first stream's tiers keep the files they always had (data-3600.csv),
+# and those from before gas had its own stream lose their gas columns.
+STREAMS = [Stream([0, 1, 2], 60 * 12, max_len=200, tier_secs=(60 * 60, 24 * 60 * 60)),
+           Stream([3], 60 * 2, max_len=150, name="gas")]
+# Flash for the whole log directory (see logstore.SegmentPolicy): half for
+# the log's monthly segments, and half for the tiers, shared by how often
+# each writes.  Past its share the log's oldest segments are reduced to
+# hourly means, then deleted, keeping the last LOG_FULL_RATE_SECS as
+# logged; a tier's oldest are deleted.
+# The streams write 720 records a day, 600 of them gas alone padded with
+# NaN: 23 KB a day as CSV, 14 KB as binary.  Two weeks of that is 322 KB,
+# and a segment (a quarter of the log's 512 KB) may be open on top, so
+# the log keeps 15 days at full rate and 80 days of hourly means as CSV,
+# or 21 days and a year as binary.  The hourly tier's 491 KB holds about a
+# year of min, mean and max.  Compaction's copy of a segment is the only
+# flash beyond the budget, and the directory never held more than 1025 KB
+# (bench/bench_budget.py).
+LOG_BUDGET_BYTES = 1024 * 1024
+LOG_COMPACT_SECS = 60 * 60
+LOG_FULL_RATE_SECS = 14 * 24 * 60 * 60
+
+
+def build_app(clock, reader, display, debounced_button, pir_sensor, reset=None,
+              filename="data.csv", sample_secs=30, profiler=None, reset_free_bytes=None,
+              segments=None, export_port=None, staged_boot=True, boot_ms=0):
+  """Assemble the logger, clock face, plots and tasks around the given hardware.
+
+  clock provides now(), secs_to_next_second() and resync_task() (an RtcClock);
+  reader is a sampler-style start/poll/read sensor reader for FIELDS.
+  profiler, if given, times the hot paths and reports periodically.
+  reset is called if free memory drops below reset_free_bytes.
+  segments (a logstore.SegmentPolicy) splits the log files by month and
+  bounds their size.  History is served over export_port (e.g.
+  usb_cdc.data), if given; see export.py.
+  With staged_boot, history is read and plotted after the first frame (see
+  ClockApp) rather than before; boot_ms is passed on for the startup metrics.
+  """
+  log("data_logger_clock")
+
+  # Two hours of records (one every 2 minutes) wait in RAM, so the file is
+  # flushed every 2 hours, as with a single 12-minute stream.
+  data_log = MultiRateLog(FIELDS, STREAMS, filename=filename, flush_policy=FlushPolicy(max_records=60),
+                          max_pending=60, profiler=profiler, segments=segments, quantizers=QUANTIZERS,
+                          defer_load=staged_boot)
+  air_log, gas_log = data_log.streams
+
+  time_disp = TimeDisplay(left_x=2)
+  disp_left = 97
+  temp_disp = DataDisplay(disp_left, 0, 128, 15, logger=air_log, channel=0, show_time_legend=True, units='°',
+                          profiler=profiler)
+  humi_disp = DataDisplay(disp_left, 16, 128, 15, logger=air_log, channel=1, legend_parity=1, units='%',
+                          profiler=profiler)
+  pres_disp = DataDisplay(disp_left, 32, 128, 15, logger=air_log, channel=2, units='Pa', signficant_figures=4,
+                          profiler=profiler)
+  # Hour bands at the gas stream's 2 minutes per pixel.
+  gaso_disp = DataDisplay(disp_left, 48, 128, 15, logger=gas_log, channel=0, secs_per_pixel=60 * 2,
+                          secs_per_legend=60 * 60, legend_parity=1, units='Ω', signficant_figures=4,
+                          profiler=profiler)
+  if not staged_boot:
+    data_log.update_displays()
+
+  master_group = displayio.Group()
+  master_group.append(time_disp.display_group())
+  master_group.append(temp_disp.display_group())
+  master_group.append(humi_disp.display_group())
+  master_group.append(pres_disp.display_group())
+  master_group.append(gaso_disp.display_group())
+
+  display.show(master_group)
+
+  #scroller = SideScrollBitmap(128, 0, 128, 64)
+  #master_group.append(scroller.tile_grid)
+
+  # Read the sensor every sample_secs and log each interval's mean.
+  sensor_sampler = SensorSampler(reader, sample_secs=sample_secs, log=log, profiler=profiler)
+
+  tasks = [sensor_sampler.task]
+  export_server = None
+  if export_port is not None:
+    export_server = ExportServer(data_log, export_port, log=log, profiler=profiler)
+    tasks.append(export_server.task)
+  if profiler:
+    tasks.append(profiler.task)
+  app = ClockApp(clock, sensor_sampler.take_interval, data_log, time_disp, display, master_group,
+                 debounced_button, pir_sensor, reset=reset, reset_free_bytes=reset_free_bytes,
+                 tasks=tasks, profiler=profiler, boot_ms=boot_ms,
+                 data_displays=[temp_disp, humi_disp, pres_disp, gaso_disp], sensor_sampler=sensor_sampler,
+                 export_server=export_server)
+  return app
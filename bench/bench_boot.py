@@ -0,0 +1,104 @@
+# bench_boot.py
+#
+# Host benchmark: startup, staged against all-at-once.
+#
+#   python bench/bench_boot.py [--years 1]
+#
+# The application boots under sim.runner on top of a synthetic history, in
+# each log format, with staged_boot off (history read and all plots drawn
+# before the first frame, as before) and on.  For each the table gives
+# the app's startup metrics: host milliseconds from the start of
+# build_app to the first frame and to the full UI, and the simulated
+# seconds (clock ticks) until the full UI, which staging spends showing
+# the clock.  Each boot is run a few times and the best kept.  On the
+# device the metrics count from power-on and include imports, font
+# loading and the panel's power-up wait, which the host can't show.
+
+import argparse
+import array
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import sim  # noqa: E402
+sim.install()
+
+import localclock  # noqa: E402
+from app import FIELDS, STREAMS  # noqa: E402
+from logdata import tier_filename  # noqa: E402
+from logstore import SegmentPolicy, open_log_file  # noqa: E402
+from sim.runner import DEFAULT_START, Simulation  # noqa: E402
+
+INTERVAL = 12 * 60
+DAY = 24 * 60 * 60
+BATCH = 256
+
+
+def write_history(filename, records, segments):
+    """records samples of every field ending just before DEFAULT_START, with the streams' tiers."""
+    start = DEFAULT_START - records * INTERVAL
+    stores = [(open_log_file(filename, FIELDS, INTERVAL, segments), len(FIELDS), INTERVAL)]
+    for stream in STREAMS:
+        for span in stream.tier_secs:
+            tier_fields = []
+            for channel in stream.channels:
+                tier_fields.extend([FIELDS[channel] + ' min', FIELDS[channel], FIELDS[channel] + ' max'])
+            # As MultiRateLog names them.
+            tier_name = tier_filename(tier_filename(filename, stream.name) if stream.name else filename, span)
+            stores.append((open_log_file(tier_name, tier_fields, span, segments and SegmentPolicy()),
+                           len(tier_fields), span))
+    for store, num_columns, step in stores:
+        times = array.array('l', [0] * BATCH)
+        columns = [array.array('f', [0.0] * BATCH) for _ in range(num_columns)]
+        count = 0
+        for t in range(start - start % step, DEFAULT_START - step, step):
+            times[count] = t
+            for channel, column in enumerate(columns):
+                column[count] = 40.0 + (t // step) % 50 + channel
+            count += 1
+            if count == BATCH:
+                store.append(times, columns, 0, count)
+                count = 0
+        if count:
+            store.append(times, columns, 0, count)
+
+
+def boot(filename, segments, staged):
+    s = Simulation(filename=filename, segments=segments, staged_boot=staged)
+    while s.app.full_ui_ms is None:
+        s.run(1)
+    result = s.app.first_frame_ms, s.app.full_ui_ms, s.elapsed_secs
+    s.close()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--years', type=float, default=1)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    localclock.DO_LOG = False
+    records = int(args.years * 365 * DAY / INTERVAL)
+    print("{:>14s} {:>8s} {:>16s} {:>13s} {:>14s}".format(
+        "log", "staged", "first frame ms", "full UI ms", "full UI ticks"))
+    for name, segments in (("data.csv", None), ("data.bin", None), ("data.csv", SegmentPolicy())):
+        tempdir = tempfile.mkdtemp(prefix='dlc-bench-')
+        try:
+            filename = os.path.join(tempdir, name)
+            write_history(filename, records, segments)
+            for staged in (False, True):
+                runs = [boot(filename, segments, staged) for _ in range(args.repeat)]
+                first = min(run[0] for run in runs)
+                full = min(run[1] for run in runs)
+                ticks = runs[0][2]
+                print("{:>14s} {:>8s} {:16d} {:13d} {:14.0f}".format(
+                    name + (" seg" if segments else ""), "yes" if staged else "no", first, full, ticks))
+        finally:
+            shutil.rmtree(tempdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+# bench_budget.py
+#
+# Host check of the flash budget for the app's streams.
+#
+#   python bench/bench_budget.py [--days 400] [--budget-kb N]
+#
+# The app's MultiRateLog (its STREAMS, merged into one log file) logs
+# --days of readings, in each format, with the segments the device uses:
+# the app's LOG_BUDGET_BYTES, LOG_COMPACT_SECS and LOG_FULL_RATE_SECS,
+# the budget shared by the raw log and its tiers (SegmentPolicy.split).
+# The table gives the raw log's bytes for the first day, the most flash
+# the log directory ever held (every file, manifests included), and at
+# the end the days of history left at each resolution: the full-rate
+# records, the compacted hourly means, and the hourly and daily tiers.
+# The exit status is 1 if the directory ever held more than the budget
+# allows (plus a segment of the raw log's while compaction writes its
+# copy), or if less than LOG_FULL_RATE_SECS of full-rate records or 48
+# weeks of hourly history is left.
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import sim  # noqa: E402
+sim.install()
+
+import localclock  # noqa: E402
+from app import FIELDS, LOG_BUDGET_BYTES, LOG_COMPACT_SECS, LOG_FULL_RATE_SECS, QUANTIZERS, STREAMS  # noqa: E402
+from logdata import MultiRateLog  # noqa: E402
+from logstore import FlushPolicy, SegmentPolicy  # noqa: E402
+from sim.runner import DEFAULT_START  # noqa: E402
+
+DAY = 24 * 60 * 60
+
+
+def directory_bytes(directory):
+    return sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+
+
+def history_days(segments, full_rate):
+    """Days spanned by the segments at (or, if not full_rate, coarser than) their log's interval."""
+    chosen = [segment for segment in segments if (segment.step <= segments[-1].step) == full_rate]
+    if not chosen:
+        return 0.0
+    return (chosen[-1].last - chosen[0].first) / DAY
+
+
+def run(name, days, budget_bytes):
+    tempdir = tempfile.mkdtemp(prefix='dlc-bench-')
+    try:
+        filename = os.path.join(tempdir, name)
+        segments = SegmentPolicy(budget_bytes=budget_bytes, compact_secs=LOG_COMPACT_SECS,
+                                 full_rate_secs=LOG_FULL_RATE_SECS)
+        # As build_app makes it.
+        data_log = MultiRateLog(FIELDS, STREAMS, filename=filename, flush_policy=FlushPolicy(max_records=60),
+                                max_pending=60, segments=segments, quantizers=QUANTIZERS)
+        values = [0.0] * len(FIELDS)
+        max_bytes = 0
+        first_day_bytes = None
+        for step in range(0, days * DAY, data_log.interval_secs):
+            secs = DEFAULT_START + step
+            if step % DAY == 0:
+                max_bytes = max(max_bytes, directory_bytes(tempdir))
+                if step == DAY:
+                    first_day_bytes = data_log.store.total_size()
+            channels = data_log.channels_to_log(secs)
+            if channels is None:
+                continue
+            for channel in channels:
+                values[channel] = [70.0, 40.0, 1010.0, 50000.0][channel] + (step // 30) % (7 + channel) * 0.37
+            data_log.log_data(values, secs)
+        data_log.flush()
+        max_bytes = max(max_bytes, directory_bytes(tempdir))
+
+        raw = data_log.store.segments
+        tiers = [tier for stream in data_log.streams for tier in stream.tiers]
+        tier_days = [(tier.span_secs, history_days(tier.store.segments, True)) for tier in tiers]
+        # The log and its tiers share the budget; compaction briefly holds a copy of a segment.
+        allowed = budget_bytes + data_log.store.policy.segment_bytes
+        raw_days = history_days(raw, True)
+        compacted_days = history_days(raw, False)
+        hourly_days = max([compacted_days + raw_days] + [days for span, days in tier_days if span == 60 * 60])
+        print("{:>10s} {:10.0f} {:10.0f} {:10.0f} {:9.1f} {:9.1f} {:>16s}".format(
+            name, first_day_bytes, max_bytes / 1024, allowed / 1024, raw_days, compacted_days,
+            ' '.join('{:d}:{:.0f}'.format(span // 3600, days) for span, days in tier_days)))
+        failures = 0
+        if max_bytes > allowed:
+            print(name, "held more than the budgets allow")
+            failures += 1
+        if raw_days < min(LOG_FULL_RATE_SECS / DAY, days - 1):
+            print(name, "keeps less than LOG_FULL_RATE_SECS at full rate")
+            failures += 1
+        if hourly_days < min(48 * 7, days - 1):
+            print(name, "keeps less than 48 weeks of hourly history")
+            failures += 1
+        return failures
+    finally:
+        shutil.rmtree(tempdir)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--days', type=int, default=400)
+    parser.add_argument('--budget-kb', type=int, default=LOG_BUDGET_BYTES // 1024)
+    args = parser.parse_args()
+    localclock.DO_LOG = False
+    print("{:>10s} {:>10s} {:>10s} {:>10s} {:>9s} {:>9s} {:>16s}".format(
+        "log", "B/day", "max KB", "allowed KB", "raw days", "mean days", "tier h:days"))
+    failures = 0
+    for name in ("data.csv", "data.bin"):
+        failures += run(name, args.days, args.budget_kb * 1024)
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
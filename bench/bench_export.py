@@ -0,0 +1,221 @@
+# bench_export.py
+#
+# Host test of the serial export protocol over a pseudo-terminal.
+#
+#   python bench/bench_export.py [--years 1]
+#
+# The whole application runs under sim.runner on top of a synthetic
+# history, with its ExportServer on the device end of a pty and an
+# ExportClient on the other.  For CSV and binary, the whole history and
+# one month are exported, and one export is broken off part way and
+# resumed from the client's last complete chunk.  Each is checked against
+# LogData.range, and the table gives the records the server read from
+# data_log.range for it (a resumed export must not read again what it
+# has sent, beyond the chunks in flight), the extra peak heap (tracemalloc)
+# over the same stretch of simulated time without an export, the
+# longest 'export' span, and the longest gap between clock face updates
+# in simulated seconds, which should stay 1.  The exit status is 1 on
+# any mismatch or stall.  The extra peak should not depend on how much is
+# exported; on the host it is mostly CPython's file buffer, plus the
+# client's 1 KB reads.
+
+import argparse
+import array
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import sim  # noqa: E402
+sim.install()
+
+from export import ExportClient  # noqa: E402
+from logstore import CsvLogFile  # noqa: E402
+from profiler import Profiler  # noqa: E402
+from sim.hardware import PtySerial  # noqa: E402
+from sim.runner import DEFAULT_START, Simulation  # noqa: E402
+
+FIELDS = ["°F", "%H", "Pa", "Go"]
+INTERVAL = 12 * 60
+DAY = 24 * 60 * 60
+BATCH = 256
+
+
+def write_history(filename, start, records):
+    store = CsvLogFile(filename, FIELDS, INTERVAL)
+    times = array.array('l', [0] * BATCH)
+    columns = [array.array('f', [0.0] * BATCH) for _ in FIELDS]
+    for first in range(0, records, BATCH):
+        count = min(BATCH, records - first)
+        for j in range(count):
+            i = first + j
+            times[j] = start + i * INTERVAL
+            columns[0][j] = 70 + (i % 97) * 0.1
+            columns[1][j] = 40 + (i % 53) * 0.3
+            columns[2][j] = 1000 + (i % 31) * 0.2
+            columns[3][j] = 50000 + (i % 89) * 123
+        store.append(times, columns, 0, count)
+
+
+class FaceWatch(object):
+    """Wraps TimeDisplay.update_time_display to find the longest gap between updates."""
+
+    def __init__(self, time_disp):
+        self.update = time_disp.update_time_display
+        time_disp.update_time_display = self
+        self.last = None
+        self.max_gap = 0
+
+    def __call__(self, secs):
+        if self.last is not None and secs - self.last > self.max_gap:
+            self.max_gap = secs - self.last
+        self.last = secs
+        self.update(secs)
+
+
+class Bench(object):
+
+    def __init__(self, years):
+        self.tempdir = tempfile.mkdtemp(prefix='dlc-bench-')
+        filename = os.path.join(self.tempdir, 'data.csv')
+        records = int(years * 365 * DAY / INTERVAL)
+        self.first_time = DEFAULT_START - records * INTERVAL
+        write_history(filename, self.first_time, records)
+        port, self.client_fd = PtySerial.open()
+        os.set_blocking(self.client_fd, False)
+        self.profiler = Profiler(report_secs=10 ** 9)
+        self.sim = Simulation(filename=filename, export_port=port, profiler=self.profiler)
+        # Keep the face drawing, so gaps in its updates show.
+        self.sim.app.screensaver_secs = 10 ** 9
+        self.span = self.profiler.span('export')
+        self.watch = FaceWatch(self.sim.app.time_disp)
+        self.records_read = 0
+        self.range = self.sim.app.data_log.range
+        self.sim.app.data_log.range = self.counted_range
+        self.sim.run(10 * 60)
+
+    def counted_range(self, t0, t1, channels=None):
+        for record in self.range(t0, t1, channels):
+            self.records_read += 1
+            yield record
+
+    def drain(self, client):
+        while True:
+            try:
+                data = os.read(self.client_fd, 1024)
+            except BlockingIOError:
+                return
+            if client is not None:
+                client.feed(data)
+
+    def export(self, t0, t1, channels, file_format, break_at=None):
+        """Run one export to the end; returns (spool file, wall secs).
+
+        Payloads go to the spool file so that they don't count in the heap.
+        """
+        spool = tempfile.TemporaryFile()
+        client = ExportClient(spool.write)
+        self.records_read = 0
+        self.records_lost = 0
+        os.write(self.client_fd, client.command(t0, t1, channels, file_format))
+        started = time.perf_counter()
+        while not client.done:
+            self.sim.run(0.05)
+            self.drain(client)
+            if client.error:
+                raise RuntimeError(client.error)
+            if break_at is not None and client.received >= break_at:
+                # Drop the connection mid-stream: lose what's in flight, then resume.
+                break_at = None
+                self.drain(None)
+                # Read by the server but not received; the only records a resume may read again.
+                self.records_lost = self.records_read - client.received
+                os.write(self.client_fd, client.command(t0, t1, channels, file_format))
+        return spool, time.perf_counter() - started
+
+    def expected(self, t0, t1, channels):
+        return list(self.range(t0, t1, channels))
+
+    def close(self):
+        self.sim.close()
+        os.close(self.client_fd)
+        shutil.rmtree(self.tempdir)
+
+
+def decode(payload, file_format, num_channels):
+    if file_format == 'csv':
+        records = []
+        for line in payload.decode().splitlines():
+            fields = line.split(',')
+            records.append((int(fields[0]), [float(x) for x in fields[1:]]))
+        return records
+    record_format = '<l' + 'f' * num_channels
+    return [(record[0], list(record[1:])) for record in struct.iter_unpack(record_format, payload)]
+
+
+def same(got, expected):
+    """Equal times, and values to float32 precision; NaN (a channel not in the record) matches NaN."""
+    if [t for t, _ in got] != [t for t, _ in expected]:
+        return False
+    return all(abs(a - b) <= 1e-6 * abs(b) or (a != a and b != b)
+               for (_, xs), (_, ys) in zip(got, expected) for a, b in zip(xs, ys))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--years', type=float, default=1)
+    args = parser.parse_args()
+    bench = Bench(args.years)
+    end = int(bench.sim.app.data_log.last_time()) + 1
+    month_start = end - 30 * DAY
+    cases = [
+        ("all, csv", bench.first_time, end, '*', 'csv', None),
+        ("all, bin", bench.first_time, end, '*', 'bin', None),
+        ("month 0,2, csv", month_start, end, '0,2', 'csv', None),
+        ("resumed, csv", bench.first_time, end, '*', 'csv', 5000),
+        ("resumed, bin", bench.first_time, end, '*', 'bin', 5000),
+    ]
+    failures = 0
+    print("{:>16s} {:>8s} {:>8s} {:>9s} {:>8s} {:>10s} {:>11s} {:>8s} {:>6s}".format(
+        "export", "records", "read", "KB", "wall s", "+peak KB", "max span ms", "max gap", "ok"))
+    try:
+        for name, t0, t1, channels, file_format, break_at in cases:
+            channel_list = list(range(len(FIELDS))) if channels == '*' else [int(c) for c in channels.split(',')]
+            tracemalloc.start()
+            bench.sim.run(60)
+            # The same stretch of simulated time with and without the export.
+            tracemalloc.reset_peak()
+            bench.sim.run(60)
+            idle_peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.reset_peak()
+            bench.span.reset()
+            bench.watch.max_gap = 0
+            export_started = bench.sim.sim_time.secs
+            spool, wall = bench.export(t0, t1, channels, file_format, break_at)
+            bench.sim.run(max(0, 60 - (bench.sim.sim_time.secs - export_started)))
+            export_peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            spool.seek(0)
+            payload = spool.read()
+            spool.close()
+            got = decode(payload, file_format, len(channel_list))
+            records_read = bench.records_read
+            ok = (same(got, bench.expected(t0, t1, channel_list)) and bench.watch.max_gap <= 1
+                  and records_read - bench.records_lost <= len(got))
+            failures += not ok
+            print("{:>16s} {:8d} {:8d} {:9.1f} {:8.2f} {:10.1f} {:11d} {:8d} {:>6s}".format(
+                name, len(got), records_read, len(payload) / 1024, wall, (export_peak - idle_peak) / 1024,
+                bench.span.max_ms, bench.watch.max_gap, "yes" if ok else "NO"))
+    finally:
+        bench.close()
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+# bench_legend.py
+#
+# Host benchmark: plot legend and text drawing, per-pixel against GlyphAtlas.
+#
+#   python bench/bench_legend.py [--redraws 200]
+#
+# "before" is the drawing code as it was: each plot column filled pixel by
+# pixel, and each legend column's glyph looked up in the font and read
+# pixel by pixel.  "after" is DataDisplay.draw_column with LEGEND_GLYPHS.
+# Both redraw every column of a plot with hour legends, at every offset,
+# into separate bitmaps that must come out identical; then the same is
+# done for print_on_bitmap with a font and with a GlyphAtlas.
+#
+# On the device fill_region is a single native call, so the figure that
+# carries over is the number of bitmap calls made from Python (pixel
+# reads, pixel writes and fill_region calls).  Times are host
+# microseconds with fill_region unavailable, so both sides run in Python.
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import sim  # noqa: E402
+sim.install()
+
+import displays  # noqa: E402
+from logdata import LogData  # noqa: E402
+from sim import fakes  # noqa: E402
+
+
+def legacy_paste_bitmap(glyph, x, y, bitmap, color):
+    for g_x in range(glyph.width):
+        for g_y in range(glyph.height):
+            if glyph.bitmap[g_x, g_y] and ((x + g_x) < bitmap.width) and ((y + g_y) < bitmap.height):
+                bitmap[x + g_x, y + g_y] = color
+
+
+def legacy_paste_glyph_column(glyph, g_x, x, y, bitmap, color):
+    for g_y in range(min(glyph.height, bitmap.height - y)):
+        if glyph.bitmap[g_x, g_y]:
+            bitmap[x, y + g_y] = color
+
+
+def legacy_draw_column(plot, x, local_time_in_pixels):
+    """DataDisplay.draw_column as it was."""
+    pixels_per_legend = plot.secs_per_legend // plot.secs_per_pixel
+    bg_pixel = ((local_time_in_pixels // pixels_per_legend) + plot.legend_parity) % 2
+    col = plot.scroller.column(x)
+    for y in range(plot.scroller.height):
+        plot.bitmap[col, y] = bg_pixel
+    text_x = local_time_in_pixels % pixels_per_legend - 1
+    if text_x < 0:
+        return
+    legend_pixel = local_time_in_pixels - text_x - 1
+    text = displays.HOUR_LEGENDS[((legend_pixel * plot.secs_per_pixel) // 3600) % 24]
+    for c in text:
+        glyph = plot.tiny_font.get_glyph(ord(c))
+        if text_x < glyph.width:
+            if text_x >= 0:
+                legacy_paste_glyph_column(glyph, text_x, col, 0, plot.bitmap, 1 - bg_pixel)
+            return
+        text_x -= glyph.width + 1
+
+
+def redraw(plot, draw, offset):
+    for x in range(plot.plot_w):
+        draw(x, offset + x)
+
+
+def python_calls():
+    return (fakes.STATS['pixel_reads'] + fakes.STATS['pixel_writes'] - fakes.STATS['region_pixels']
+            + fakes.STATS['region_fills'])
+
+
+def measure(fn, repeat):
+    """(Python-level bitmap calls per run with fill_region, host us per run without)."""
+    fakes.reset_stats()
+    fn()
+    calls = python_calls()
+    saved = displays.fill_region
+    displays.fill_region = None
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    elapsed = time.perf_counter() - started
+    displays.fill_region = saved
+    return calls, elapsed * 1e6 / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--redraws', type=int, default=200)
+    args = parser.parse_args()
+    data_log = LogData(["°F"], interval_secs=12 * 60, max_len=10)
+    before = displays.DataDisplay(0, 0, 128, 15, logger=data_log, channel=0, show_time_legend=True)
+    after = displays.DataDisplay(0, 16, 128, 15, logger=data_log, channel=0, show_time_legend=True)
+    pixels_per_legend = before.secs_per_legend // before.secs_per_pixel
+    offsets = range(0, 24 * pixels_per_legend, 7)
+    mismatches = 0
+    for offset in offsets:
+        redraw(before, lambda x, t: legacy_draw_column(before, x, t), offset)
+        redraw(after, after.draw_column, offset)
+        if before.bitmap.data != after.bitmap.data:
+            mismatches += 1
+    print("{:>28s} {:>14s} {:>12s}".format("", "bitmap calls", "host us"))
+    rows = []
+    rows.append(("plot redraw, before",) + measure(
+        lambda: redraw(before, lambda x, t: legacy_draw_column(before, x, t), 123), args.redraws))
+    rows.append(("plot redraw, after",) + measure(lambda: redraw(after, after.draw_column, 123), args.redraws))
+
+    text = "12:34 56.7"
+    atlas = displays.GlyphAtlas(displays.TTH_FONT, "0123456789:.")
+    target = fakes.Bitmap(64, 8, 2)
+    check = fakes.Bitmap(64, 8, 2)
+
+    def legacy_print():
+        x = 0
+        for c in text:
+            glyph = displays.TTH_FONT.get_glyph(ord(c))
+            legacy_paste_bitmap(glyph, x, 1, check, 1)
+            x += glyph.width + 1
+
+    legacy_print()
+    displays.print_on_bitmap(target, 0, 1, text, atlas, 1)
+    if target.data != check.data:
+        mismatches += 1
+    rows.append(("print_on_bitmap, before",) + measure(legacy_print, args.redraws * 10))
+    rows.append(("print_on_bitmap, font",) + measure(
+        lambda: displays.print_on_bitmap(target, 0, 1, text, displays.TTH_FONT, 1), args.redraws * 10))
+    rows.append(("print_on_bitmap, atlas",) + measure(
+        lambda: displays.print_on_bitmap(target, 0, 1, text, atlas, 1), args.redraws * 10))
+    for name, calls, usecs in rows:
+        print("{:>28s} {:14d} {:12.1f}".format(name, calls, usecs))
+    print("offsets compared: {:d}; differing: {:d}".format(len(offsets) + 1, mismatches))
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+# bench_load.py
+#
+# Host benchmark: LogData.load time against log file size.
+#
+#   python bench/bench_load.py [--years 1 2 4]
+#
+# Synthetic logs at the 12-minute interval are written in CSV and binary,
+# then loaded by LogData (tail read) and by the original loader, which
+# read the whole file twice.  Each file is loaded a few times and the
+# best time kept, so this measures parsing, not the host's disk.
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import localclock  # noqa: E402
+from logdata import LogData  # noqa: E402
+from logstore import csv_to_binary  # noqa: E402
+
+FIELDS = ["°F", "%H", "Pa", "Go"]
+INTERVAL = 12 * 60
+START = 1640995200  # 2022-01-01
+
+
+def legacy_load(filename, max_len):
+    """The original LogData.load: count the lines, then parse the last max_len."""
+    times = []
+    data = []
+    num_lines = 0
+    with open(filename, "r") as fp:
+        for line in fp:
+            num_lines += 1
+    lines_read = 0
+    with open(filename, "r") as fp:
+        for line in fp:
+            if lines_read >= num_lines - max_len:
+                fields = [s.strip() for s in line.strip().split(',')]
+                times.append(int(fields[0]))
+                data.append([float(s) for s in fields[1:]])
+            lines_read += 1
+    return times[-max_len:], data[-max_len:]
+
+
+def write_csv(filename, records):
+    with open(filename, "w") as fp:
+        for i in range(records):
+            fp.write("{:d},{:.7g},{:.7g},{:.7g},{:.7g}\n".format(
+                START + i * INTERVAL, 70 + (i % 97) * 0.1, 40 + (i % 53) * 0.3, 1000 + (i % 31) * 0.2,
+                50000 + (i % 89) * 123))
+
+
+def best_of(fn, repeat=3):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - started
+        if best is None or elapsed < best:
+            best = elapsed
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--years', type=float, nargs='+', default=[0.25, 1, 2, 4])
+    args = parser.parse_args()
+    localclock.DO_LOG = False
+    tempdir = tempfile.mkdtemp(prefix='dlc-bench-')
+    try:
+        print("{:>6s} {:>9s} {:>10s} {:>10s} {:>10s} {:>10s}".format(
+            "years", "records", "CSV KB", "legacy ms", "CSV ms", "binary ms"))
+        for years in args.years:
+            records = int(years * 365 * 24 * 60 * 60 / INTERVAL)
+            csv_name = os.path.join(tempdir, "data.csv")
+            bin_name = os.path.join(tempdir, "data.bin")
+            write_csv(csv_name, records)
+            if os.path.exists(bin_name):
+                os.remove(bin_name)
+            csv_to_binary(csv_name, bin_name, FIELDS, INTERVAL)
+            legacy = best_of(lambda: legacy_load(csv_name, 120))
+            tail_csv = best_of(lambda: LogData(FIELDS, INTERVAL, max_len=120, filename=csv_name))
+            tail_bin = best_of(lambda: LogData(FIELDS, INTERVAL, max_len=120, filename=bin_name))
+            print("{:6.2f} {:9d} {:10.0f} {:10.1f} {:10.2f} {:10.2f}".format(
+                years, records, os.path.getsize(csv_name) / 1024, legacy, tail_csv, tail_bin))
+    finally:
+        shutil.rmtree(tempdir)
+
+
+if __name__ == '__main__':
+    main()
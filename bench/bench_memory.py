@@ -0,0 +1,88 @@
+# bench_memory.py
+#
+# Host benchmark: heap growth over a simulated month.
+#
+#   python bench/bench_memory.py [--days 30] [--trace]
+#
+# The whole application runs under sim.runner and the heap is sampled once
+# per simulated day, after a collection: live objects tracked by gc, which
+# counts what the application keeps, and allocated blocks, which also
+# counts the interpreter's own caches.  With --trace (several times slower)
+# tracemalloc's byte count is added.  After the first day, when the rings,
+# tiers and display state have filled up, a leak-free build should stay
+# flat: the exit status is 1 if the object count grew by more than
+# --tolerance between the end of day 2 and the last day.  With --trace the
+# largest growth by source line is listed at the end.
+
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import sim  # noqa: E402
+sim.install()
+
+from sim.runner import Simulation  # noqa: E402
+
+DAY = 24 * 60 * 60
+REPO = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+
+def heap():
+    gc.collect()
+    traced = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+    return len(gc.get_objects()), sys.getallocatedblocks(), traced
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--trace', action='store_true', help="also trace bytes with tracemalloc")
+    parser.add_argument('--top', type=int, default=5, help="source lines to list by growth")
+    parser.add_argument('--tolerance', type=int, default=32, help="objects of growth still called flat")
+    args = parser.parse_args()
+
+    if args.trace:
+        tracemalloc.start()
+    # Someone walks past every three hours.
+    s = Simulation(pir_active=[(t, t + 5) for t in range(0, args.days * DAY, 3 * 60 * 60)])
+    started = time.perf_counter()
+    s.run(DAY)
+    baseline = tracemalloc.take_snapshot() if args.trace else None
+    first_objects, first_blocks, first_bytes = heap()
+    day2_objects = None
+    print("{:>4s} {:>9s} {:>9s} {:>9s} {:>9s} {:>10s} {:>9s}".format(
+        "day", "objects", "vs day 1", "blocks", "vs day 1", "traced B", "vs day 1"))
+    for day in range(1, args.days + 1):
+        if day > 1:
+            s.run(DAY)
+        objects, blocks, traced = heap()
+        if day == 2:
+            day2_objects = objects
+        print("{:4d} {:9d} {:9d} {:9d} {:9d} {:10d} {:9d}".format(
+            day, objects, objects - first_objects, blocks, blocks - first_blocks, traced, traced - first_bytes))
+    wall = time.perf_counter() - started
+    print("log bytes written: {:d}; wall secs: {:.1f}".format(s.app.data_log.bytes_written, wall))
+    if args.trace:
+        final = tracemalloc.take_snapshot()
+        repo_only = [tracemalloc.Filter(True, os.path.join(REPO, '*'))]
+        growth = final.filter_traces(repo_only).compare_to(baseline.filter_traces(repo_only), 'lineno')
+        print("largest growth since day 1:")
+        for stat in growth[:args.top]:
+            print("  ", stat)
+        tracemalloc.stop()
+    s.close()
+    if day2_objects is not None:
+        growth = objects - day2_objects
+        print("growth from day 2 to day {:d}: {:d} objects: {:s}".format(
+            args.days, growth, "flat" if growth <= args.tolerance else "GROWING"))
+        if growth > args.tolerance:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
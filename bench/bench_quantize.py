@@ -0,0 +1,112 @@
+# bench_quantize.py
+#
+# Host check of the int16 field encodings in app.QUANTIZERS.
+#
+#   python bench/bench_quantize.py
+#
+# Each field's encoding is swept over the whole range the sensor can
+# report, and every round trip must be within the encoding's max_error
+# (half a step, absolute or relative).  Then a day of simulated readings
+# goes through LogData with and without quantizers, and the raw ring and
+# the hourly tier must agree to within the same bounds.  The exit status
+# is 1 if anything is out of bounds.  Last, the RAM held by the rings'
+# arrays is given per sample for both.
+
+import math
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import sim  # noqa: E402
+sim.install()
+
+from app import FIELDS, QUANTIZERS  # noqa: E402
+from logdata import LogData  # noqa: E402
+from sim.hardware import FakeBME680, FakeBME680Reader, SimTime  # noqa: E402
+from sim.runner import DEFAULT_START  # noqa: E402
+
+# What each field can be (°F, %RH, hPa, ohms), linearly or by decades.
+RANGES = [(-40.0, 185.0, False), (0.0, 100.0, False), (700.0, 1100.0, False), (100.0, 1e7, True)]
+# Room for float32 arithmetic on the device, relative to the value.
+FLOAT_SLACK = 1e-6
+
+
+def sweep(low, high, logarithmic, count=100000):
+    rand = random.Random(1)
+    values = [low, high]
+    for _ in range(count):
+        if logarithmic:
+            values.append(math.exp(rand.uniform(math.log(low), math.log(high))))
+        else:
+            values.append(rand.uniform(low, high))
+    return values
+
+
+def within(quantizer, value, decoded):
+    return abs(decoded - value) <= quantizer.max_error(value) + FLOAT_SLACK * abs(value)
+
+
+def ring_bytes(logger):
+    """Bytes of the ring's arrays on the device, where array('l') is 32-bit."""
+    num_bytes = 4 * len(logger.times)
+    for column in logger.columns:
+        num_bytes += column.itemsize * len(column)
+    return num_bytes
+
+
+def main():
+    failures = 0
+    print("{:>4s} {:>22s} {:>12s} {:>12s}".format("field", "range", "max error", "bound"))
+    for field, quantizer, (low, high, logarithmic) in zip(FIELDS, QUANTIZERS, RANGES):
+        worst = 0.0
+        worst_bound = 0.0
+        for value in sweep(low, high, logarithmic):
+            decoded = quantizer.decode(quantizer.encode(value))
+            if not within(quantizer, value, decoded):
+                failures += 1
+            if logarithmic:
+                error = abs(decoded - value) / value
+                bound = quantizer.max_error(value) / value
+            else:
+                error = abs(decoded - value)
+                bound = quantizer.max_error(value)
+            worst = max(worst, error)
+            worst_bound = max(worst_bound, bound)
+        print("{:>4s} {:>22s} {:>11.3g}{:1s} {:>11.3g}{:1s}".format(
+            field, "{:g} to {:g}".format(low, high), worst, "x" if logarithmic else "",
+            worst_bound, "x" if logarithmic else ""))
+
+    # A day of simulated readings through both kinds of ring.
+    sim_time = SimTime()
+    secs = [DEFAULT_START]
+    reader = FakeBME680Reader(FakeBME680(lambda: secs[0]), sim_time)
+    plain = LogData(FIELDS, 12 * 60, max_len=120, tier_secs=(60 * 60,))
+    packed = LogData(FIELDS, 12 * 60, max_len=120, tier_secs=(60 * 60,), quantizers=QUANTIZERS)
+    values = [0.0] * len(FIELDS)
+    for step in range(120):
+        secs[0] = DEFAULT_START + step * 12 * 60
+        reader.start()
+        sim_time.advance(reader.measure_secs)
+        reader.read(values)
+        plain.append(secs[0], values)
+        packed.append(secs[0], values)
+    for channel, quantizer in enumerate(QUANTIZERS):
+        pairs = list(zip(plain.column_views[channel], packed.column_views[channel]))
+        pairs += list(zip(plain.tiers[0].mean_views[channel], packed.tiers[0].mean_views[channel]))
+        bad = [pair for pair in pairs if not within(quantizer, pair[0], pair[1])]
+        failures += len(bad)
+        print("{:>4s} through LogData: {:d} values, {:d} out of bounds".format(FIELDS[channel], len(pairs), len(bad)))
+
+    plain_bytes = ring_bytes(plain) / plain.max_len
+    packed_bytes = ring_bytes(packed) / packed.max_len
+    print("ring bytes per sample: {:.0f} float32, {:.0f} int16 ({:.2f}x the samples in the same RAM)".format(
+        plain_bytes, packed_bytes, plain_bytes / packed_bytes))
+    if failures:
+        print(failures, "values out of bounds")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
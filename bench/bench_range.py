@@ -0,0 +1,113 @@
+# bench_range.py
+#
+# Host benchmark: LogData.range against a full scan of the log.
+#
+#   python bench/bench_range.py [--years 2]
+#
+# A synthetic log at the 12-minute interval is written in CSV and binary,
+# plain and segmented by month, and LogData queried for one day at a time
+# across its whole history: from RAM for the last day, and from the file
+# for the rest.  Every answer is checked against filtering iter_records(),
+# which is also what is timed as the full scan.  Decimated queries (step)
+# are checked to return exactly one sample per step that has any.
+
+import argparse
+import array
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import localclock  # noqa: E402
+from logdata import LogData  # noqa: E402
+from logstore import SegmentPolicy, open_log_file  # noqa: E402
+
+FIELDS = ["°F", "%H", "Pa", "Go"]
+INTERVAL = 12 * 60
+START = 1640995200  # 2022-01-01
+DAY = 24 * 60 * 60
+BATCH = 256
+
+
+def write_log(filename, records, segments):
+    store = open_log_file(filename, FIELDS, INTERVAL, segments)
+    times = array.array('l', [0] * BATCH)
+    columns = [array.array('f', [0.0] * BATCH) for _ in FIELDS]
+    for start in range(0, records, BATCH):
+        count = min(BATCH, records - start)
+        for j in range(count):
+            i = start + j
+            times[j] = START + i * INTERVAL
+            columns[0][j] = 70 + (i % 97) * 0.1
+            columns[1][j] = 40 + (i % 53) * 0.3
+            columns[2][j] = 1000 + (i % 31) * 0.2
+            columns[3][j] = 50000 + (i % 89) * 123
+        store.append(times, columns, 0, count)
+    return store
+
+
+def full_scan(store, t0, t1, channels):
+    return [(t, [values[c] for c in channels]) for t, values in store.iter_records() if t0 <= t < t1]
+
+
+def same(got, expected):
+    """Equal times, and values equal to float32 precision (RAM holds float32, CSV text)."""
+    if [t for t, _ in got] != [t for t, _ in expected]:
+        return False
+    return all(abs(a - b) <= 1e-6 * abs(b) for (_, xs), (_, ys) in zip(got, expected) for a, b in zip(xs, ys))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--years', type=float, default=2)
+    parser.add_argument('--queries', type=int, default=20)
+    args = parser.parse_args()
+    localclock.DO_LOG = False
+    records = int(args.years * 365 * DAY / INTERVAL)
+    end = START + records * INTERVAL
+    rand = random.Random(1)
+    days = [rand.randrange(START, end - DAY) for _ in range(args.queries)] + [end - DAY]
+    channels = [0, 2]
+    failures = 0
+    print("{:>10s} {:>9s} {:>12s} {:>12s} {:>8s}".format("log", "records", "range ms/q", "scan ms/q", "step ok"))
+    for name, segments in (("data.csv", None), ("data.bin", None),
+                           ("data.csv", SegmentPolicy()), ("data.bin", SegmentPolicy())):
+        tempdir = tempfile.mkdtemp(prefix='dlc-bench-')
+        try:
+            filename = os.path.join(tempdir, name)
+            store = write_log(filename, records, segments)
+            logger = LogData(FIELDS, INTERVAL, max_len=120, filename=filename, segments=segments)
+            range_secs = scan_secs = 0.0
+            for t0 in days:
+                started = time.perf_counter()
+                got = list(logger.range(t0, t0 + DAY, channels))
+                range_secs += time.perf_counter() - started
+                started = time.perf_counter()
+                expected = full_scan(store, t0, t0 + DAY, channels)
+                scan_secs += time.perf_counter() - started
+                if not same(got, expected):
+                    failures += 1
+                    print("MISMATCH", name, t0, len(got), len(expected))
+            step_ok = True
+            for t0 in days:
+                got = [t // 3600 for t, _ in logger.range(t0, t0 + 7 * DAY, channels, step=3600)]
+                hours = set(t // 3600 for t, _ in logger.range(t0, t0 + 7 * DAY, channels))
+                if got != sorted(hours):
+                    step_ok = False
+            failures += not step_ok
+            label = name + (" seg" if segments else "")
+            print("{:>10s} {:9d} {:12.2f} {:12.2f} {:>8s}".format(
+                label, records, range_secs * 1000 / len(days), scan_secs * 1000 / len(days),
+                "yes" if step_ok else "NO"))
+        finally:
+            shutil.rmtree(tempdir)
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
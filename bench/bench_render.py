@@ -0,0 +1,74 @@
+# bench_render.py
+#
+# Host benchmark: DataDisplay.display, full redraw against incremental.
+#
+#   python bench/bench_render.py [--updates 500]
+#
+# Two plots watch the same LogData, one with incremental=False.  Each log
+# interval appends a sample and both redraw; the cost of each is timed
+# and its bitmap writes counted, and the two bitmaps are checked to show
+# the same image on screen.
+
+import argparse
+import math
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import sim  # noqa: E402
+sim.install()
+
+import localclock  # noqa: E402
+from sim import fakes  # noqa: E402
+from sim.runner import DEFAULT_START  # noqa: E402
+
+
+def screen(display):
+    """The plot's pixels as seen through its tile grid, left to right."""
+    scroller = display.scroller
+    return [[scroller.bitmap[scroller.column(x), y] for y in range(scroller.height)]
+            for x in range(scroller.width)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--updates', type=int, default=500)
+    args = parser.parse_args()
+    localclock.DO_LOG = False
+    from displays import DataDisplay
+    from logdata import LogData
+
+    interval = 12 * 60
+    data_log = LogData(["°F"], interval_secs=interval, max_len=120)
+    full = DataDisplay(0, 0, 128, 15, logger=data_log, channel=0, show_time_legend=True, incremental=False)
+    incremental = DataDisplay(0, 16, 128, 15, logger=data_log, channel=0, show_time_legend=True)
+    data_log.registered_displays = []
+    costs = {full: [0.0, 0, []], incremental: [0.0, 0, []]}
+    mismatches = 0
+    for step in range(args.updates):
+        secs = DEFAULT_START + step * interval
+        # A slow daily cycle, so the scale changes now and then.
+        data_log.append(secs, [70 + 5 * math.sin(step / 40.0) + 0.3 * math.sin(step * 1.7)])
+        for display in (full, incremental):
+            pixels = fakes.STATS['pixel_writes']
+            started = time.perf_counter()
+            display.display_log()
+            cost = costs[display]
+            cost[0] += time.perf_counter() - started
+            cost[2].append(fakes.STATS['pixel_writes'] - pixels)
+        if screen(full) != screen(incremental):
+            mismatches += 1
+
+    print("{:12s} {:>12s} {:>14s} {:>14s}".format("", "us/update", "median writes", "mean writes"))
+    for name, display in (("full", full), ("incremental", incremental)):
+        total, _, writes = costs[display]
+        writes.sort()
+        print("{:12s} {:12.0f} {:14d} {:14.0f}".format(
+            name, total / args.updates * 1e6, writes[len(writes) // 2], sum(writes) / len(writes)))
+    print("updates:", args.updates, "screens differing:", mismatches)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,248 @@
+# bench_streams.py
+#
+# Host check of MultiRateLog: the app's streams against separate logs.
+#
+#   python bench/bench_streams.py [--days 2]
+#
+# First the whole application runs under sim.runner, with every sensor
+# reading recorded, and each sample each stream logs must be the mean of
+# the readings since that stream's previous sample (to within its
+# quantizer's error): one stream being collected must not restart
+# another's interval.  The stream intervals must hold too.
+#
+# Then the same values are logged over the same days by the app's
+# MultiRateLog and, for comparison, by one LogData per stream, each with
+# its own file (what it took before): the table gives, for each, the files
+# written, flushes, bytes written and the RAM held by the rings, tiers and
+# pending records.  The merged log must flush no more often than the
+# slowest of the separate ones alone, and each stream must read back from
+# it the same samples as from its own file, to within its quantizers'
+# error.
+#
+# Last, tier files left by a LogData of every field (before the streams)
+# must come back, cut to the unnamed stream's fields, as that stream's
+# tiers, and be rewritten only once.  The exit status is 1 if anything
+# fails.
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import sim  # noqa: E402
+sim.install()
+
+import localclock  # noqa: E402
+from app import FIELDS, QUANTIZERS, STREAMS  # noqa: E402
+from logdata import LogData, MultiRateLog, tier_filename  # noqa: E402
+from logstore import FlushPolicy, SegmentPolicy  # noqa: E402
+from sim.runner import DEFAULT_START, Simulation  # noqa: E402
+
+DAY = 24 * 60 * 60
+
+
+class Recorder(object):
+    """Wraps the app's sensor reads and log_data calls to keep what went in."""
+
+    def __init__(self, app):
+        self.readings = []
+        self.logged = []
+        reader = app.sensor_sampler.reader
+        self.read = reader.read
+        reader.read = self.on_read
+        self.log_data = app.data_log.log_data
+        app.data_log.log_data = self.on_log_data
+
+    def on_read(self, values):
+        self.read(values)
+        self.readings.append(list(values))
+
+    def on_log_data(self, values, time_secs):
+        self.logged.append((time_secs, len(self.readings)))
+        self.log_data(values, time_secs)
+
+
+def label(spec):
+    return spec.name or ','.join(FIELDS[channel] for channel in spec.channels)
+
+
+def check_means(days):
+    """Each stream's samples against the readings; returns the failures."""
+    s = Simulation()
+    recorder = Recorder(s.app)
+    s.run(days * DAY)
+    s.close()
+    failures = 0
+    print("{:>8s} {:>8s} {:>10s} {:>10s} {:>8s}".format("stream", "samples", "interval s", "readings", "ok"))
+    for spec, stream in zip(STREAMS, s.app.data_log.streams):
+        times = list(stream.time_view)
+        values = [list(view) for view in stream.column_views]
+        # The readings index at each of this stream's samples.
+        marks = dict((t, n) for t, n in recorder.logged if t in set(times))
+        bad = 0
+        gaps = set()
+        readings_per_sample = []
+        for index in range(1, len(times)):
+            gaps.add(times[index] - times[index - 1])
+            first = marks[times[index - 1]]
+            last = marks[times[index]]
+            readings_per_sample.append(last - first)
+            for position, channel in enumerate(spec.channels):
+                readings = [reading[channel] for reading in recorder.readings[first:last]]
+                mean = sum(readings) / len(readings)
+                quantizer = QUANTIZERS[channel]
+                if abs(values[position][index] - mean) > quantizer.max_error(mean) + 1e-5 * abs(mean):
+                    bad += 1
+        ok = not bad and gaps == {spec.interval_secs}
+        failures += not ok
+        print("{:>8s} {:8d} {:>10s} {:10.1f} {:>8s}".format(
+            label(spec), len(times), ','.join(str(gap) for gap in sorted(gaps)),
+            sum(readings_per_sample) / len(readings_per_sample), "yes" if ok else "NO"))
+    return failures
+
+
+def ram_bytes(logger):
+    """Bytes of a LogData's ring and tiers on the device, where array('l') is 32-bit."""
+    num_bytes = 4 * len(logger.times)
+    for column in logger.columns:
+        num_bytes += column.itemsize * len(column)
+    for tier in logger.tiers:
+        num_bytes += 4 * len(tier.times)
+        for columns in (tier.mins, tier.means, tier.maxs):
+            for column in columns:
+                num_bytes += column.itemsize * len(column)
+    return num_bytes
+
+
+def close(got, expected, quantizers):
+    """Equal times, and values within the quantizers' error (a LogData writes its
+    decoded int16 values, the merged writer the readings' means)."""
+    if [t for t, _ in got] != [t for t, _ in expected]:
+        return False
+    return all(abs(a - b) <= quantizer.max_error(b) + 1e-5 * abs(b)
+               for (_, xs), (_, ys) in zip(got, expected) for a, b, quantizer in zip(xs, ys, quantizers))
+
+
+def compare_writers(days, name):
+    """MultiRateLog against one LogData per stream; returns the failures."""
+    tempdir = tempfile.mkdtemp(prefix='dlc-bench-')
+    try:
+        merged_name = os.path.join(tempdir, name)
+        # As build_app makes it.
+        merged = MultiRateLog(FIELDS, STREAMS, filename=merged_name, flush_policy=FlushPolicy(max_records=60),
+                              max_pending=60, quantizers=QUANTIZERS)
+        separate = []
+        for spec in STREAMS:
+            separate.append(LogData([FIELDS[channel] for channel in spec.channels], spec.interval_secs,
+                                    spec.max_len, tier_filename(merged_name, 'own' + str(len(separate))),
+                                    tier_secs=spec.tier_secs, tier_len=spec.tier_len,
+                                    quantizers=[QUANTIZERS[channel] for channel in spec.channels]))
+        values = [0.0] * len(FIELDS)
+        for step in range(0, days * DAY, merged.interval_secs):
+            secs = DEFAULT_START + step
+            for channel in range(len(FIELDS)):
+                values[channel] = [70.0, 40.0, 1010.0, 50000.0][channel] + (step // 30) % (7 + channel)
+            if merged.channels_to_log(secs):
+                merged.log_data(values, secs)
+            for spec, logger in zip(STREAMS, separate):
+                logger.log_data([values[channel] for channel in spec.channels], secs)
+        merged.flush()
+        for logger in separate:
+            logger.flush()
+
+        merged_ram = sum(ram_bytes(stream) for stream in merged.streams)
+        merged_ram += 4 * len(merged.times) + sum(column.itemsize * len(column) for column in merged.columns)
+        rows = [("merged " + name, 1, merged.flush_count, merged.bytes_written, merged_ram)]
+        for spec, logger in zip(STREAMS, separate):
+            rows.append(("  " + label(spec) + " alone", 1, logger.flush_count, logger.bytes_written, ram_bytes(logger)))
+        rows.append(("  separate total", len(separate), sum(row[2] for row in rows[1:]),
+                     sum(row[3] for row in rows[1:]), sum(row[4] for row in rows[1:])))
+        for row in rows:
+            print("{:>18s} {:6d} {:8d} {:10d} {:9d}".format(*row))
+
+        failures = 0
+        slowest = max(separate, key=lambda logger: logger.interval_secs)
+        if merged.flush_count > slowest.flush_count:
+            print("merged log flushes more often than the slowest stream alone")
+            failures += 1
+        # Each stream reads back the same from the merged file as from its own.
+        for spec, logger in zip(STREAMS, separate):
+            reread = MultiRateLog(FIELDS, STREAMS, filename=merged_name, quantizers=QUANTIZERS)
+            stream = reread.streams[STREAMS.index(spec)]
+            own = LogData(logger.fields, logger.interval_secs, logger.max_len, logger.filename,
+                          quantizers=logger.quantizers)
+            quantizers = logger.quantizers
+            got = list(zip(stream.time_view, zip(*stream.column_views)))
+            expected = list(zip(own.time_view, zip(*own.column_views)))
+            if not close(got, expected, quantizers):
+                print(label(spec), "reads back differently from the merged file")
+                failures += 1
+            t0 = DEFAULT_START + DAY // 2
+            if not close(list(stream.range(t0, t0 + DAY)), list(own.range(t0, t0 + DAY)), quantizers):
+                print(label(spec), "range differs between the merged file and its own")
+                failures += 1
+        return failures
+    finally:
+        shutil.rmtree(tempdir)
+
+
+def check_old_tiers(days, name, segments):
+    """Tier files of every field, as a MultiRateLog's unnamed stream reads them; returns the failures."""
+    spec = [spec for spec in STREAMS if not spec.name][0]
+    tempdir = tempfile.mkdtemp(prefix='dlc-bench-')
+    try:
+        filename = os.path.join(tempdir, name)
+        old = LogData(FIELDS, spec.interval_secs, spec.max_len, filename, tier_secs=spec.tier_secs,
+                      tier_len=spec.tier_len, segments=segments, quantizers=QUANTIZERS)
+        for step in range(0, days * DAY, spec.interval_secs):
+            old.log_data([70.0 + step % 7, 40.0 + step % 11, 1010.0 + step % 13, 50000.0 + step % 17],
+                         DEFAULT_START + step)
+        old.flush()
+        expected = [[(t, [tier.mean_views[channel][index] for channel in spec.channels])
+                     for index, t in enumerate(tier.time_view)] for tier in old.tiers]
+        sizes = []
+        failures = 0
+        for attempt in range(2):
+            merged = MultiRateLog(FIELDS, STREAMS, filename=filename, segments=segments, quantizers=QUANTIZERS)
+            stream = merged.streams[STREAMS.index(spec)]
+            got = [list(zip(tier.time_view, zip(*tier.mean_views))) for tier in stream.tiers]
+            quantizers = [QUANTIZERS[channel] for channel in spec.channels]
+            if not all(close(g, e, quantizers) for g, e in zip(got, expected)):
+                print(name, "tiers read back differently after", attempt + 1, "opens")
+                failures += 1
+            sizes.append(sorted((entry, os.path.getsize(os.path.join(tempdir, entry)))
+                                for entry in os.listdir(tempdir)))
+        if sizes[0] != sizes[1]:
+            print(name, "tier files rewritten more than once")
+            failures += 1
+        print("{:>18s} {:>10s} {:6d} spans".format(name + (" seg" if segments else ""),
+                                                   "ok" if not failures else "NO", sum(len(e) for e in expected)))
+        return failures
+    finally:
+        shutil.rmtree(tempdir)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--days', type=int, default=2)
+    args = parser.parse_args()
+    failures = check_means(args.days)
+    localclock.DO_LOG = False
+    print()
+    print("{:>18s} {:>6s} {:>8s} {:>10s} {:>9s}".format("log", "files", "flushes", "bytes", "RAM B"))
+    for name in ("data.csv", "data.bin"):
+        failures += compare_writers(args.days, name)
+    print()
+    print("{:>18s} {:>10s}".format("old tier files", "read back"))
+    for name in ("data.csv", "data.bin"):
+        for segments in (None, SegmentPolicy(budget_bytes=256 * 1024)):
+            failures += check_old_tiers(args.days, name, segments)
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
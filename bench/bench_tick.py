@@ -0,0 +1,106 @@
+# bench_tick.py
+#
+# Host benchmark: what one clock tick costs, and how fast the simulation runs.
+#
+#   python bench/bench_tick.py [--hours 6]
+#
+# First the clock face alone: TimeDisplay.update_time_display over an hour
+# of consecutive seconds.  Then the whole application under sim.runner with
+# the display kept on (the PIR triggered regularly), reporting wall time
+# and display writes per simulated second.  Write counts are what the fake
+# displayio saw, so they carry over to the device even though the host
+# timings do not.  Last, the profiler's own cost: time and allocation per
+# span, and as a share of a one-second tick at the span rate the
+# simulation produces.
+
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import sim  # noqa: E402
+sim.install()
+
+from profiler import Profiler  # noqa: E402
+from sim import fakes  # noqa: E402
+from sim.runner import DEFAULT_START, Simulation  # noqa: E402
+
+
+def per_second(stats, before, secs):
+    return ["{:.2f}".format((stats[key] - before[key]) / secs)
+            for key in ('pixel_writes', 'tile_writes', 'label_texts')]
+
+
+def bench_face(ticks):
+    from displays import TimeDisplay
+    time_disp = TimeDisplay(left_x=2)
+    time_disp.update_time_display(DEFAULT_START)
+    before = dict(fakes.STATS)
+    gc.collect()
+    blocks = sys.getallocatedblocks()
+    started = time.perf_counter()
+    for secs in range(DEFAULT_START + 1, DEFAULT_START + 1 + ticks):
+        time_disp.update_time_display(secs)
+    elapsed = time.perf_counter() - started
+    gc.collect()
+    blocks = sys.getallocatedblocks() - blocks
+    print("clock face, {:d} ticks: {:.1f} us/tick; pixel, tile, label writes per tick: {}; net blocks {:d}".format(
+        ticks, elapsed / ticks * 1e6, ", ".join(per_second(fakes.STATS, before, ticks)), blocks))
+
+
+def bench_app(hours, profiler):
+    secs = hours * 60 * 60
+    # Motion every two minutes keeps the screensaver from blanking the display.
+    s = Simulation(pir_active=[(t, t + 5) for t in range(0, secs + 60, 120)], profiler=profiler)
+    # Past start-up, so the initial full draws don't count.
+    s.run(60)
+    before = dict(fakes.STATS)
+    refreshes = s.display.refreshes
+    started = time.perf_counter()
+    s.run(secs)
+    elapsed = time.perf_counter() - started
+    s.close()
+    print("application, {:d} h, display on: {:.1f} us/simulated sec ({:.0f} simulated secs/sec)".format(
+        hours, elapsed / secs * 1e6, secs / elapsed))
+    print("  per simulated sec: pixel, tile, label writes {}; refreshes {:.2f}".format(
+        ", ".join(per_second(fakes.STATS, before, secs)), (s.display.refreshes - refreshes) / secs))
+
+
+def bench_profiler(profiler, secs, repeat=100000):
+    spans = sum(span.count for span in profiler.spans)
+    span = Profiler().span('bench')
+    tracemalloc.start()
+    for _ in range(2):
+        # The second pass shows what a span keeps, once its fields exist.
+        before = tracemalloc.get_traced_memory()[0]
+        for _ in range(1000):
+            with span:
+                pass
+    allocated = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        with span:
+            pass
+    per_span_us = (time.perf_counter() - started) / repeat * 1e6
+    print("profiler: {:.2f} us per span, {:d} B retained per 1000; {:.2f} spans per simulated sec = {:.4f}% of a 1 s tick".format(
+        per_span_us, allocated, spans / secs, spans / secs * per_span_us / 1e4))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--hours', type=int, default=6)
+    args = parser.parse_args()
+    bench_face(60 * 60)
+    # Long enough that no report empties the spans.
+    profiler = Profiler(report_secs=args.hours * 60 * 60 * 2)
+    bench_app(args.hours, profiler)
+    bench_profiler(profiler, args.hours * 60 * 60 + 60)
+
+
+if __name__ == '__main__':
+    main()
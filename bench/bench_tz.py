@@ -0,0 +1,119 @@
+# bench_tz.py
+#
+# Host benchmark: tz.TimeZone against the original is_dst / my_localtime.
+#
+#   python bench/bench_tz.py
+#
+# The original functions are reproduced below with calendar.timegm and
+# time.gmtime standing in for CircuitPython's mktime and localtime, which
+# have no notion of a host time zone.  Results are also checked against the
+# host's zoneinfo database, which is the ground truth for civil time.
+
+import calendar
+import datetime
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from tz import TimeZone  # noqa: E402
+
+########## The original implementation ##########
+
+days_in_month = [31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
+
+
+def day_of_century(year, month, day):
+    days = 365 * (year - 2000) + max(0, year - 1997) // 4
+    days += sum(days_in_month[:(month - 1)])
+    if (year % 4) == 0 and month > 2:
+        days += 1
+    days += day - 1
+    return days
+
+
+def day_of_week(year, month, day):
+    return (6 + day_of_century(year, month, day)) % 7
+
+
+def first_sunday(year, month):
+    weekday_of_first_day = day_of_week(year, month, 1)
+    return 1 + ((7 - weekday_of_first_day) % 7)
+
+
+def legacy_is_dst(secs_in_utc):
+    year = (time.gmtime(secs_in_utc)).tm_year
+    HHMarch = calendar.timegm((year, 3, 7 + first_sunday(year, 3), 2, 0, 0, 0, 0, 0))
+    HHNovember = calendar.timegm((year, 11, first_sunday(year, 11), 2, 0, 0, 0, 0, 0))
+    return HHMarch <= secs_in_utc < HHNovember
+
+
+TZ_HOURS = -5
+
+
+def legacy_localtime(secs_in_utc):
+    t = time.gmtime(secs_in_utc + 3600 * TZ_HOURS)
+    if legacy_is_dst(secs_in_utc):
+        t = time.gmtime(secs_in_utc + 3600 * (TZ_HOURS + 1))
+    return t
+
+##################################################
+
+
+def fields(t):
+    return (t.tm_year, t.tm_mon, t.tm_mday, t.tm_hour, t.tm_min, t.tm_sec, t.tm_wday, t.tm_yday)
+
+
+def timed(fn, secs_list):
+    start = time.perf_counter()
+    for secs in secs_list:
+        fn(secs)
+    return (time.perf_counter() - start) / len(secs_list) * 1e6
+
+
+def main():
+    start = calendar.timegm((2020, 1, 1, 0, 0, 0, 0, 0, 0))
+    end = calendar.timegm((2030, 1, 1, 0, 0, 0, 0, 0, 0))
+    # The decade at 7-minute steps, plus three days of consecutive seconds
+    # (what the clock face actually asks for).
+    sparse = list(range(start, end, 7 * 60))
+    ticks = list(range(start + 100 * 86400, start + 103 * 86400))
+
+    zone = TimeZone(std_hours=TZ_HOURS, rule='US')
+    print("{:28s} {:>10s} {:>10s}".format("us per call", "original", "tz"))
+    for name, secs_list in (("decade, 7 min steps", sparse), ("3 days, 1 s steps", ticks)):
+        print("{:28s} {:10.2f} {:10.2f}".format(
+            name, timed(legacy_localtime, secs_list), timed(zone.localtime, secs_list)))
+
+    # Exactness.  The original switches at 02:00 UTC rather than 02:00 local,
+    # so it disagrees for a few hours on each transition day.
+    try:
+        import zoneinfo
+        truth = zoneinfo.ZoneInfo('America/New_York')
+    except Exception:  # zoneinfo or tzdata not available
+        truth = None
+    all_secs = sparse + ticks
+    vs_truth = 0
+    vs_legacy = 0
+    outside_windows = 0
+    for secs in all_secs:
+        ours = fields(zone.localtime(secs))
+        if truth is not None:
+            if ours != fields(datetime.datetime.fromtimestamp(secs, truth).timetuple()):
+                vs_truth += 1
+        if ours != fields(legacy_localtime(secs)):
+            vs_legacy += 1
+            start_utc, end_utc = zone.transitions(time.gmtime(secs).tm_year)
+            # Original transitions are 5 h (March) and 4 h (November) early.
+            if not (start_utc - 5 * 3600 <= secs < start_utc or end_utc - 4 * 3600 <= secs < end_utc):
+                outside_windows += 1
+    print("timestamps checked:", len(all_secs))
+    if truth is not None:
+        print("mismatches vs zoneinfo America/New_York:", vs_truth)
+    print("mismatches vs original:", vs_legacy, "(outside the original's early-switch windows:",
+          str(outside_windows) + ")")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,9 @@
+# boot.py
+#
+# Runs before USB is set up.  Enables the second USB serial port
+# (usb_cdc.data), on which data_logger_clock serves history exports;
+# the REPL stays on the first.
+
+import usb_cdc
+
+usb_cdc.enable(console=True, data=True)
@@ -0,0 +1,169 @@
+# clock.py
+#
+# Wall-clock time without reading the DS3231 on every call.
+#
+# RtcClock reads the RTC once at startup, catching the moment its seconds
+# register ticks over, and from then on serves now() from the local
+# monotonic counter.  A periodic resync measures how far the local counter
+# has drifted from the RTC and corrects for it.  Optionally the DS3231's
+# 1 Hz square-wave output, counted by a countio.Counter, provides the
+# seconds instead, and the RTC only has to be read to check for missed edges.
+
+import time
+
+from profiler import monotonic_ns
+
+try:
+    import asyncio
+except ImportError:  # Only resync_task needs it.
+    asyncio = None
+
+_DS3231_CONTROL = 0x0E
+_DS3231_INTCN = 0x04
+_DS3231_RS_MASK = 0x18
+
+# An RTC edge is only used for drift measurement if it was pinned down to within this.
+EDGE_TOLERANCE_NS = 20000000
+
+
+def enable_square_wave(rtc):
+    """Switch the DS3231 INT/SQW pin from alarm interrupts to a 1 Hz square wave."""
+    buf = bytearray(2)
+    buf[0] = _DS3231_CONTROL
+    with rtc.i2c_device as i2c:
+        i2c.write_then_readinto(buf, buf, out_end=1, in_start=1)
+        buf[1] &= ~(_DS3231_INTCN | _DS3231_RS_MASK) & 0xFF
+        i2c.write(buf)
+
+
+class RtcClock(object):
+    """UTC seconds from the monotonic counter, disciplined against a DS3231.
+
+    rtc is an adafruit_ds3231.DS3231 (anything with a .datetime struct_time).
+    If sqw_counter is given (e.g. countio.Counter on the pin wired to the
+    DS3231's SQW output, after enable_square_wave), seconds are counted from
+    it instead of the monotonic clock.
+
+    rtc_reads counts I2C reads of the RTC; drift_ppm is the most recent
+    measured rate error of the local counter, which now() corrects for.
+    Each resync is reported through log, if given.
+    """
+
+    def __init__(self, rtc, resync_secs=60 * 60, sqw_counter=None, log=None):
+        self.rtc = rtc
+        self.log = log
+        self.resync_secs = resync_secs
+        self.sqw_counter = sqw_counter
+        self.rtc_reads = 0
+        self.syncs = 0
+        # Most recent correction applied at a resync, and the rate error.
+        self.last_error_ms = 0
+        self.drift_ppm = 0
+        self.rate_ppb = 0
+        self.base_secs = 0
+        self.base_ns = 0
+        self.base_count = 0
+        self.sync()
+
+    def read_rtc(self):
+        self.rtc_reads += 1
+        return time.mktime(self.rtc.datetime)
+
+    def _catch_edge(self):
+        """Poll until the RTC's seconds tick over; return (secs, monotonic_ns) at the edge."""
+        first = self.read_rtc()
+        while True:
+            secs = self.read_rtc()
+            now_ns = monotonic_ns()
+            if secs != first:
+                return secs, now_ns
+            time.sleep(0.005)
+
+    def _rebase(self, secs, now_ns):
+        if self.syncs:
+            elapsed_ns = now_ns - self.base_ns
+            error_ns = (secs - self.base_secs) * 1000000000 - elapsed_ns
+            # Measure the rate error of the raw counter, so add back what we were correcting.
+            if elapsed_ns > 0:
+                self.last_error_ms = (error_ns - elapsed_ns * self.rate_ppb // 1000000000) // 1000000
+                self.rate_ppb = error_ns * 1000000000 // elapsed_ns
+                self.drift_ppm = self.rate_ppb / 1000
+            self.report()
+        self.base_secs = secs
+        self.base_ns = now_ns
+        self.syncs += 1
+
+    def report(self):
+        if self.log:
+            self.log("clock sync: error {:d} ms, drift {:.2f} ppm, {:d} RTC reads".format(
+                self.last_error_ms, self.drift_ppm, self.rtc_reads))
+
+    def sync(self):
+        """Blocking (up to a second) alignment to the RTC."""
+        if self.sqw_counter is not None:
+            count = self.sqw_counter.count
+            while self.sqw_counter.count == count:
+                time.sleep(0.005)
+            self.base_count = self.sqw_counter.count
+            self.base_secs = self.read_rtc()
+            self.syncs += 1
+            return
+        self._rebase(*self._catch_edge())
+
+    def now_ns(self):
+        """Current UTC time in nanoseconds."""
+        if self.sqw_counter is not None:
+            return (self.base_secs + self.sqw_counter.count - self.base_count) * 1000000000
+        elapsed_ns = monotonic_ns() - self.base_ns
+        return self.base_secs * 1000000000 + elapsed_ns + elapsed_ns * self.rate_ppb // 1000000000
+
+    def now(self):
+        """Current UTC time in whole seconds, like time.mktime(rtc.datetime)."""
+        if self.sqw_counter is not None:
+            return self.base_secs + self.sqw_counter.count - self.base_count
+        return self.now_ns() // 1000000000
+
+    def secs_to_next_second(self):
+        if self.sqw_counter is not None:
+            # No phase information; poll at 20 Hz.
+            return 0.05
+        return (1000000000 - self.now_ns() % 1000000000) / 1000000000
+
+    async def resync_task(self):
+        """Re-align to the RTC every resync_secs without blocking other tasks."""
+        while True:
+            await asyncio.sleep(self.resync_secs)
+            if self.sqw_counter is not None:
+                await self._check_sqw()
+            else:
+                await self._resync_monotonic()
+
+    async def _check_sqw(self):
+        if self.read_rtc() == self.now():
+            return
+        # Could be a race with an edge; look again away from it.
+        await asyncio.sleep(0.5)
+        secs = self.read_rtc()
+        if secs != self.now():
+            # Missed or extra edges: realign to the RTC.
+            self.last_error_ms = (secs - self.now()) * 1000
+            self.base_secs = secs
+            self.base_count = self.sqw_counter.count
+            self.syncs += 1
+            self.report()
+
+    async def _resync_monotonic(self):
+        # Other tasks may delay our wakeups, so only accept an edge seen within
+        # EDGE_TOLERANCE_NS of the last read before it.  Give up after a few seconds.
+        before_ns = monotonic_ns()
+        first = self.read_rtc()
+        for _ in range(1000):
+            await asyncio.sleep(0.005)
+            secs = self.read_rtc()
+            now_ns = monotonic_ns()
+            if secs != first:
+                if now_ns - before_ns <= EDGE_TOLERANCE_NS:
+                    self._rebase(secs, now_ns)
+                    return
+                first = secs
+            before_ns = now_ns
@@ -0,0 +1,512 @@
+# displays.py
+#
+# The clock face and the scrolling data plots.
+
+import gc
+import math
+
+import displayio
+import terminalio
+from adafruit_display_text import label
+from adafruit_display_shapes.rect import Rect
+from adafruit_bitmap_font import bitmap_font
+
+from localclock import LOCAL_TZ
+from logdata import bisect_right
+from profiler import NO_PROFILER
+from tz import dayname, day_of_week
+
+try:
+  from bitmaptools import fill_region
+except ImportError:  # Not built into every board; spans are then filled pixel by pixel.
+  fill_region = None
+
+# Preformatted two-digit numbers, so per-second updates don't build strings.
+TWO_DIGITS = ['{:02d}'.format(n) for n in range(60)]
+
+DIGITS = '0123456789'
+FONT_CACHE = {}
+
+
+def load_font(path, chars=''):
+  """Load each font file once, however many displays use it.
+
+  A font only holds the glyphs that have been asked for; chars are loaded
+  now, in one pass over the file, and anything else on first use.
+  """
+  font = FONT_CACHE.get(path)
+  if font is None:
+    font = FONT_CACHE[path] = bitmap_font.load_font(path, displayio.Bitmap)
+  if chars:
+    font.load_glyphs(chars)
+  return font
+
+class TimeDisplay(object):
+  """Date, HH:MM, a seconds bar and free memory.
+
+  update_time_display only touches what changed since the last call: labels
+  are rewritten when their value changes, the colon blinks by hiding it, and
+  the seconds bar is a row of one-pixel tiles whose indices are flipped
+  in place.  Free memory is sampled every mem_interval_secs, with a full
+  gc.collect() first only if collect_for_mem is set, and shown with
+  NumberTiles.  Outside of date changes, a tick allocates nothing.
+  """
+  def __init__(self, left_x=0, top_y=0, mem_interval_secs=10, collect_for_mem=False):
+    self.date_label = label.Label(terminalio.FONT, text="Wed 2022-05-18", x=left_x + 4, y=top_y + 4)
+    big_font = load_font("fonts/CalBlk36.pcf", DIGITS + ':')
+    self.hour_label = label.Label(big_font, text="22", anchored_position=(left_x + 39, top_y + 28), anchor_point=(1.0, 0.5))
+    self.colon_label = label.Label(big_font, text=":", anchored_position=(left_x + 44, top_y + 28), anchor_point=(0.5, 0.5))
+    self.min_label = label.Label(big_font, text="22", anchored_position=(left_x + 50, top_y + 28), anchor_point=(0.0, 0.5))
+    # Memory display: the number is drawn as tiles so that updating it builds no strings.
+    # Free memory can't exceed the heap, so that sets the width (7 for 192 KB,
+    # 9 for 8 MB of PSRAM).
+    tiny_font = load_font("fonts/tom-thumb.pcf")
+    mem_tiles = NumberTiles.tiles_for(gc.mem_free() + gc.mem_alloc())
+    self.mem_digits = NumberTiles(tiny_font, mem_tiles, left_x, top_y + 59)
+    self.mem_label = label.Label(tiny_font, text=" B free", x=left_x + mem_tiles * self.mem_digits.cell_w, y=top_y + 59)
+    self.mem_interval_secs = mem_interval_secs
+    self.collect_for_mem = collect_for_mem
+    # Make the display context
+    self.time_disp = displayio.Group()
+    # Draw some label text
+    self.time_disp.append(self.date_label)
+    self.time_disp.append(self.hour_label)
+    self.time_disp.append(self.min_label)
+    self.time_disp.append(self.colon_label)
+    self.time_disp.append(self.mem_digits.tile_grid)
+    self.time_disp.append(self.mem_label)
+
+    self.sec_total_w = 60
+    self.sec_left_x = left_x + 15
+    self.sec_top_y = top_y + 44
+    sec_frame = Rect(self.sec_left_x, self.sec_top_y, self.sec_total_w + 4, 8, outline=0xFFFFFF)
+    # Seconds bar: tile 0 is a blank column, tile 1 a lit one.
+    sec_bitmap = displayio.Bitmap(2, 4, 2)
+    for y in range(4):
+      sec_bitmap[1, y] = 1
+    sec_palette = displayio.Palette(2)
+    sec_palette[0] = 0x000000
+    sec_palette[1] = 0xFFFFFF
+    self.sec_fill = displayio.TileGrid(bitmap=sec_bitmap, pixel_shader=sec_palette, width=self.sec_total_w, height=1,
+                                       tile_width=1, tile_height=4, default_tile=0,
+                                       x=self.sec_left_x + 2, y=self.sec_top_y + 2)
+    self.time_disp.append(sec_frame)
+    self.time_disp.append(self.sec_fill)
+    # What is currently shown.
+    self.shown_date = None
+    self.shown_hour = None
+    self.shown_min = None
+    self.shown_mem = None
+    self.sec_start = 0
+    self.sec_stop = 0
+    self.last_mem_secs = None
+
+  def display_group(self):
+    return self.time_disp
+
+  def _set_sec_columns(self, lo, hi, start, stop):
+    for x in range(lo, hi):
+      self.sec_fill[x] = 1 if start <= x < stop else 0
+
+  def set_sec_bar(self, start, stop):
+    """Light columns [start, stop) of the seconds bar, changing only the differences."""
+    # Only columns between the old and new starts, or old and new stops, can differ.
+    self._set_sec_columns(min(start, self.sec_start), max(start, self.sec_start), start, stop)
+    self._set_sec_columns(min(stop, self.sec_stop), max(stop, self.sec_stop), start, stop)
+    self.sec_start = start
+    self.sec_stop = stop
+
+  def update_time_display(self, secs_in_utc):
+    # No struct_time per tick: the minute's fields are cached in LOCAL_TZ.
+    tm_sec = LOCAL_TZ.second_of_minute(secs_in_utc)
+    fields = LOCAL_TZ.minute_fields
+    year = fields[0]
+    month = fields[1]
+    day = fields[2]
+    hour = fields[3]
+    minute = fields[4]
+    date = (year * 100 + month) * 100 + day
+    if date != self.shown_date:
+      wday = day_of_week(year, month, day)
+      self.date_label.text = '{:s} {:04}-{:02}-{:02}'.format(dayname[wday], year, month, day)
+      self.shown_date = date
+    if hour != self.shown_hour:
+      self.hour_label.text = TWO_DIGITS[hour]
+      self.shown_hour = hour
+    if minute != self.shown_min:
+      self.min_label.text = TWO_DIGITS[minute]
+      self.shown_min = minute
+    self.colon_label.hidden = bool(tm_sec & 1)
+    bar_secs = 1 + ((tm_sec + 59) % 60)  # 0 reads as 60
+    sec_mid_x = (self.sec_total_w * bar_secs + 30) // 60
+    if ((secs_in_utc - 1) // 60) & 1:
+      self.set_sec_bar(sec_mid_x, self.sec_total_w)
+    else:
+      self.set_sec_bar(0, sec_mid_x)
+    # Memory display
+    if self.last_mem_secs is None or secs_in_utc - self.last_mem_secs >= self.mem_interval_secs:
+      self.last_mem_secs = secs_in_utc
+      if self.collect_for_mem:
+        gc.collect()
+      mem_free = gc.mem_free()
+      if mem_free != self.shown_mem:
+        self.mem_digits.show(mem_free)
+        self.shown_mem = mem_free
+
+
+def paste_bitmap(glyph, x, y, bitmap, color):
+  """Copy a glyph directly onto a bitmap, clipped to its right and bottom edges."""
+  width = min(glyph.width, bitmap.width - x)
+  height = min(glyph.height, bitmap.height - y)
+  for g_x in range(width):
+    for g_y in range(height):
+      if glyph.bitmap[g_x, g_y]:
+        bitmap[x + g_x, y + g_y] = color
+
+
+def fill_span(bitmap, x, y_start, y_stop, color):
+  """Set rows [y_start, y_stop) of column x."""
+  if fill_region:
+    fill_region(bitmap, x, y_start, x + 1, y_stop, color)
+  else:
+    for y in range(y_start, y_stop):
+      bitmap[x, y] = color
+
+
+class AtlasGlyph(object):
+  """A glyph as vertical runs of set pixels, for drawing without reading its bitmap.
+
+  runs[g_x] is a flat tuple of y_start, y_stop pairs for column g_x.
+  """
+  def __init__(self, glyph):
+    self.width = glyph.width
+    self.height = glyph.height
+    runs = []
+    for g_x in range(glyph.width):
+      column = []
+      start = None
+      for g_y in range(glyph.height + 1):
+        lit = g_y < glyph.height and glyph.bitmap[g_x, g_y]
+        if lit and start is None:
+          start = g_y
+        elif not lit and start is not None:
+          column.append(start)
+          column.append(g_y)
+          start = None
+      runs.append(tuple(column))
+    self.runs = tuple(runs)
+
+  def paste_column(self, g_x, x, y, bitmap, color, bottom=None):
+    """Draw column g_x of the glyph onto column x of bitmap, clipped at row bottom."""
+    if bottom is None:
+      bottom = bitmap.height
+    column = self.runs[g_x]
+    for index in range(0, len(column), 2):
+      stop = min(y + column[index + 1], bottom)
+      start = y + column[index]
+      if start < stop:
+        fill_span(bitmap, x, start, stop, color)
+
+  def paste(self, x, y, bitmap, color):
+    """Draw the whole glyph with its top left at (x, y), clipped to the bitmap."""
+    bottom = bitmap.height
+    for g_x in range(max(0, -x), min(self.width, bitmap.width - x)):
+      self.paste_column(g_x, x + g_x, y, bitmap, color, bottom)
+
+
+class GlyphAtlas(object):
+  """AtlasGlyphs for a font, built up front for chars and otherwise on first use.
+
+  Looks like a font to print_on_bitmap.
+  """
+  def __init__(self, font, chars=''):
+    self.font = font
+    self.glyphs = {}
+    for c in chars:
+      self.get_glyph(ord(c))
+
+  def get_glyph(self, code):
+    glyph = self.glyphs.get(code)
+    if glyph is None:
+      glyph = self.glyphs[code] = AtlasGlyph(self.font.get_glyph(code))
+    return glyph
+
+
+def print_on_bitmap(bitmap, x, y, text, font, color):
+  """Directly render text onto a bitmap, in a font or, faster, a GlyphAtlas of one."""
+  for c in text:
+    glyph = font.get_glyph(ord(c))
+    if isinstance(glyph, AtlasGlyph):
+      glyph.paste(x, y, bitmap, color)
+    else:
+      paste_bitmap(glyph, x, y, bitmap, color)
+    x += glyph.width + 1
+
+
+def tiles_for_digits(digits, thousands=True):
+  """Tiles taken by a number of that many digits, with its commas."""
+  if thousands:
+    return digits + (digits - 1) // 3
+  return digits
+
+
+class NumberTiles(object):
+  """A right-aligned integer drawn as tiles from a small glyph atlas.
+
+  The atlas of digits, comma, plus and blank is rendered once from font, so
+  show() only changes tile indices: no strings are built and nothing is
+  allocated.  (x, y) is the left end of the row, vertically centred on y
+  like a Label's.  A number too wide for num_tiles (see tiles_for) is shown
+  as the largest that fits after a '+', rather than losing its top digits.
+  """
+  CHARS = " 0123456789,+"
+  BLANK = 0
+  COMMA = 11
+  OVERFLOW = 12
+
+  @staticmethod
+  def tiles_for(max_number, thousands=True):
+    """Tiles needed to show every number up to max_number."""
+    return tiles_for_digits(len(str(max_number)), thousands)
+
+  def __init__(self, font, num_tiles, x, y, thousands=True, color=0xFFFFFF):
+    glyphs = [font.get_glyph(ord(c)) for c in self.CHARS]
+    _, box_h, _, box_dy = font.get_bounding_box()
+    cell_w = max(glyph.shift_x for glyph in glyphs)
+    ascent = box_h + box_dy
+    atlas = displayio.Bitmap(cell_w * len(glyphs), box_h, 2)
+    for index, glyph in enumerate(glyphs):
+      if glyph.width:
+        paste_bitmap(glyph, index * cell_w + glyph.dx, ascent - glyph.height - glyph.dy, atlas, 1)
+    palette = displayio.Palette(2)
+    palette.make_transparent(0)
+    palette[1] = color
+    self.cell_w = cell_w
+    self.thousands = thousands
+    # The largest number that fits, and that fits after the '+'.
+    digits = 0
+    while tiles_for_digits(digits + 1, thousands) <= num_tiles:
+      digits += 1
+    self.max_number = 10 ** digits - 1
+    while digits and tiles_for_digits(digits, thousands) > num_tiles - 1:
+      digits -= 1
+    self.clamped_number = 10 ** digits - 1
+    self.tile_grid = displayio.TileGrid(atlas, pixel_shader=palette, width=num_tiles, height=1,
+                                        tile_width=cell_w, tile_height=box_h, default_tile=self.BLANK,
+                                        x=x, y=y - box_h // 2)
+
+  def show(self, number):
+    """Display a non-negative integer, with commas every three digits if thousands."""
+    tiles = self.tile_grid
+    overflow = number > self.max_number
+    if overflow:
+      number = self.clamped_number
+    digits = 0
+    comma_next = False
+    for pos in range(tiles.width - 1, -1, -1):
+      if comma_next:
+        tile = self.COMMA
+        comma_next = False
+      elif number or not digits:
+        tile = 1 + number % 10
+        number //= 10
+        digits += 1
+        comma_next = self.thousands and number and digits % 3 == 0
+      elif overflow and pos == 0:
+        tile = self.OVERFLOW
+      else:
+        tile = self.BLANK
+      if tiles[pos] != tile:
+        tiles[pos] = tile
+
+
+# Glyphs for plot values and units, legends, field names and free memory.
+TER_FONT = load_font("fonts/ter-u12n.pcf", DIGITS + '.-e+°%PaΩ')
+TTH_FONT = load_font("fonts/tom-thumb.pcf", DIGITS + ' -,°%FHPaGoBfre')
+
+class SideScrollBitmap(object):
+    """Class to manage a flat bitmap with side-scrolling.
+
+    The bitmap is shown through a row of one-pixel-wide tiles, so scrolling
+    only changes which bitmap column each tile shows; no pixels are copied.
+    x coordinates below are screen columns, 0 at the left.
+    """
+    def __init__(self, x, y, width, height, colors=(0x000000, 0xFFFFFF)):
+        self.width = width
+        self.height = height
+        self.bitmap = displayio.Bitmap(width, height, len(colors))
+        self.palette = displayio.Palette(len(colors))
+        for i, color in enumerate(colors):
+            self.palette[i] = color
+        self.tile_grid = displayio.TileGrid(bitmap=self.bitmap, pixel_shader=self.palette, width=width, height=1,
+                           tile_width=1, tile_height=height, default_tile=0, x=x, y=y)
+        self.display_at(0)
+
+    def display_at(self, origin=0):
+        self.origin = origin % self.width
+        for tile in range(self.width):
+            self.tile_grid[tile] = (self.origin + tile) % self.width
+
+    def column(self, x):
+        """Bitmap column currently shown at screen column x."""
+        return (self.origin + x) % self.width
+
+    def fill_column(self, x, val=0):
+        fill_span(self.bitmap, self.column(x), 0, self.height, val)
+
+    def set_pixel(self, x, y, val=1):
+        self.bitmap[self.column(x), y] = val
+
+    def set_rh_pixel(self, y, val=1):
+        self.set_pixel(self.width - 1, y, val)
+
+    def scroll_left(self, steps=1):
+        self.display_at(self.origin + steps)
+        # Clear the newly-exposed RH edge.
+        for x in range(max(0, self.width - steps), self.width):
+            self.fill_column(x, 0)
+
+
+HOUR_LEGENDS = TWO_DIGITS[:24]
+# The hour legends' glyphs, as runs.  (TER_FONT is only drawn by Labels.)
+LEGEND_ATLAS = GlyphAtlas(TTH_FONT, DIGITS)
+LEGEND_GLYPHS = [[LEGEND_ATLAS.get_glyph(ord(c)) for c in text] for text in HOUR_LEGENDS]
+
+
+class DataDisplay(object):
+    """Plot the results of one sequence.
+
+    The plot is a SideScrollBitmap.  When a new sample only moves the trace
+    along and the autoscaled range is unchanged, the existing columns are
+    scrolled and only the newly-exposed columns are drawn; otherwise the whole
+    plot is redrawn.  Each redraw is timed as profiler span 'plot:<field>'.
+    """
+    def __init__(self, x, y, w, h, logger, channel,
+                 secs_per_pixel=12 * 60, secs_per_legend=6 * 60 * 60, legend_parity=0,
+                 show_time_legend=False, units='', signficant_figures=3, incremental=True,
+                 profiler=None):
+        self.x = x
+        self.y = y
+        self.w = w
+        self.h = h
+        self.logger = logger
+        logger.register_display(self)
+        self.channel = channel
+        self.secs_per_pixel = secs_per_pixel
+        self.secs_per_legend = secs_per_legend
+        self.legend_parity = legend_parity
+        self.show_time_legend = show_time_legend
+        self.units = units
+        self.significant_figures = signficant_figures
+        # Built once rather than on every update.
+        self.value_format = '{:.' + str(signficant_figures) + 'g}' + units
+        self.incremental = incremental
+        self.span = (profiler or NO_PROFILER).span('plot:' + logger.fields[channel])
+        self.legend_w = 8
+        # Bitmap for line display
+        self.plot_w = w - self.legend_w
+        self.scroller = SideScrollBitmap(self.x + self.legend_w, self.y, self.plot_w, h,
+                                         colors=(0x000000, 0x888888, 0xFFFFFF))
+        self.bitmap = self.scroller.bitmap
+        self.tile_grid = self.scroller.tile_grid
+        self.disp_group = displayio.Group()
+        self.disp_group.append(self.tile_grid)
+        # Legends
+        self.plot_x = x + self.legend_w
+        self.tiny_font = TTH_FONT
+        self.max_label = label.Label(self.tiny_font, text="123", anchored_position=(x, y), anchor_point=(0.0, 0.0))
+        self.min_label = label.Label(self.tiny_font, text="123", anchored_position=(x, y + h), anchor_point=(0.0, 1.0))
+        self.val_label = label.Label(TER_FONT, text="1234" + units, anchored_position=(x + w + 1, y + h // 2), anchor_point=(0.0, 0.5))
+        name_label = label.Label(self.tiny_font, text=logger.fields[channel], anchored_position=(x, y + h//2), anchor_point=(0.0, 0.5))
+        self.disp_group.append(self.min_label)
+        self.disp_group.append(self.max_label)
+        self.disp_group.append(name_label)
+        self.disp_group.append(self.val_label)
+        # What is currently drawn: local time (in pixels) of the RH column, and the scale.
+        self.drawn_pixel = None
+        self.drawn_min = None
+        self.drawn_max = None
+        self.drawn_tz_secs = None
+
+    def display_group(self):
+        return self.disp_group
+
+    def draw_column(self, x, local_time_in_pixels):
+        """Paint background and time legend for one screen column."""
+        pixels_per_legend = self.secs_per_legend // self.secs_per_pixel
+        bg_pixel = ((local_time_in_pixels // pixels_per_legend) + self.legend_parity) % 2
+        self.scroller.fill_column(x, bg_pixel)
+        if not self.show_time_legend:
+            return
+        # Legend text starts one pixel after the start of each legend band.
+        text_x = local_time_in_pixels % pixels_per_legend - 1
+        if text_x < 0:
+            return
+        legend_pixel = local_time_in_pixels - text_x - 1
+        for glyph in LEGEND_GLYPHS[((legend_pixel * self.secs_per_pixel) // 3600) % 24]:
+            if text_x < glyph.width:
+                # text_x is -1 in the gap between characters.
+                if text_x >= 0:
+                    glyph.paste_column(text_x, self.scroller.column(x), 0, self.bitmap, 1 - bg_pixel)
+                return
+            text_x -= glyph.width + 1
+
+    def plot_point(self, x, datum, data_min, data_range):
+        data_y = round((self.h - 1) * (1.0 - (datum - data_min) / data_range))
+        self.scroller.set_pixel(x, data_y, 2)
+
+    def display(self, times, data):
+        """Draw a trace with the provided data."""
+        # We only plot the items that fall within the plot width.
+        if not len(data):
+            return
+        latest_time = times[-1]
+        earliest_time = latest_time - self.plot_w * self.secs_per_pixel
+        first_index = min(bisect_right(times, earliest_time), len(data) - 1)
+        data_min = data_max = data[first_index]
+        for index in range(first_index + 1, len(data)):
+            datum = data[index]
+            if datum < data_min:
+                data_min = datum
+            elif datum > data_max:
+                data_max = datum
+        data_min = math.floor(data_min)
+        data_max = math.ceil(data_max)
+        data_min = min(data_min, data_max - 1.0)
+        data_max = max(data_min + 1.0, data_max)
+        data_range = data_max - data_min
+        tz_secs = LOCAL_TZ.utc_offset(latest_time)
+        latest_pixel = (latest_time + tz_secs) // self.secs_per_pixel
+        if (self.incremental and self.drawn_pixel is not None and tz_secs == self.drawn_tz_secs
+                and data_min == self.drawn_min and data_max == self.drawn_max
+                and 0 <= latest_pixel - self.drawn_pixel < self.plot_w):
+            # Same scale: scroll and draw just the new columns.
+            steps = latest_pixel - self.drawn_pixel
+            if steps:
+                self.scroller.display_at(self.scroller.origin + steps)
+                for x in range(self.plot_w - steps, self.plot_w):
+                    self.draw_column(x, latest_pixel - (self.plot_w - 1 - x))
+            oldest_new_pixel = self.drawn_pixel if steps == 0 else self.drawn_pixel + 1
+        else:
+            # Redraw everything.
+            for x in range(self.plot_w):
+                self.draw_column(x, latest_pixel - (self.plot_w - 1 - x))
+            oldest_new_pixel = latest_pixel - self.plot_w + 1
+            self.min_label.text = '{:3.0f}'.format(data_min)
+            self.max_label.text = '{:3.0f}'.format(data_max)
+            self.drawn_min = data_min
+            self.drawn_max = data_max
+        self.drawn_pixel = latest_pixel
+        self.drawn_tz_secs = tz_secs
+        # Draw the trace, newest first, stopping at columns that are already drawn.
+        for index in range(len(data) - 1, first_index - 1, -1):
+            sample_pixel = (times[index] + tz_secs) // self.secs_per_pixel
+            if sample_pixel < oldest_new_pixel:
+                break
+            self.plot_point(self.plot_w - 1 - (latest_pixel - sample_pixel), data[index], data_min, data_range)
+        # Update value legend
+        self.val_label.text = self.value_format.format(data[-1])
+
+    def display_log(self):
+        with self.span:
+            self.display(*self.logger.fetch_data(self.channel, self.secs_per_pixel))
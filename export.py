@@ -0,0 +1,325 @@
+# export.py
+#
+# History export over a serial port, so data can be fetched without
+# mounting CIRCUITPY (which makes the log read-only to the firmware).
+#
+# On the device the port is usb_cdc.data, the second USB serial port that
+# boot.py enables; ExportServer.task serves it between clock ticks.
+# Commands are lines of text:
+#   export T0 T1 [CHANNELS [FORMAT [OFFSET]]]
+#       samples with T0 <= time < T1 (UTC seconds); CHANNELS is * (the
+#       default) or channel numbers such as 0,2; FORMAT is csv (the default)
+#       or bin; OFFSET is how many samples were already received, when
+#       resuming an export, and RECORDS counts on from it.
+#   cancel
+# Replies are lines starting with '#':
+#   #export T0 T1 FORMAT OFFSET FIELD,FIELD,...
+#   #data RECORDS NBYTES LAST_TIME    followed by NBYTES of payload
+#   #end RECORDS
+#   #error MESSAGE
+# RECORDS counts the samples sent so far, including OFFSET, and LAST_TIME
+# is the time of the last one.  After a broken transfer, the export from
+# T0=LAST_TIME+1 with OFFSET=RECORDS, both from the last complete #data,
+# continues where it stopped: the server reads on from there rather than
+# reading and skipping what was already sent.  CSV payloads are
+# time,value,... lines and binary ones are packed little-endian int32 time
+# and float32 values.
+#
+# Each chunk is at most chunk_bytes (and at most chunk_records samples),
+# built in a preallocated buffer from data_log.range (a LogData's or
+# MultiRateLog's), which streams the file rather than loading it.  A
+# MultiRateLog's records carry the requested fields, with nan where a
+# stream wasn't due; records with none of them are left out.  A slow
+# reader only makes the writes wait, asleep, for the port.
+#
+# On the host, fetch an export with:
+#   python export.py /dev/ttyACM1 T0 T1 [CHANNELS [FORMAT]] > out.csv
+
+import struct
+
+from logstore import format_value
+from profiler import NO_PROFILER
+
+try:
+    import asyncio
+except ImportError:  # Only ExportServer.task needs it.
+    asyncio = None
+
+CHUNK_BYTES = 512
+LINE_BYTES = 80
+
+
+class ExportServer(object):
+    """Serves export commands from port for data_log.
+
+    port is a usb_cdc.Serial, or anything with in_waiting, readinto(buf) and
+    write(buf) returning the bytes taken.  Building each chunk is timed as
+    profiler span 'export'.
+    """
+
+    def __init__(self, data_log, port, chunk_bytes=CHUNK_BYTES, chunk_records=64, poll_secs=0.1,
+                 log=None, profiler=None):
+        self.data_log = data_log
+        self.port = port
+        self.chunk_records = chunk_records
+        self.poll_secs = poll_secs
+        self.log = log
+        self.chunk = bytearray(chunk_bytes)
+        self.line = bytearray(LINE_BYTES)
+        self.line_len = 0
+        self.span = (profiler or NO_PROFILER).span('export')
+        # The export in progress, if any.
+        self.records = None
+        self.csv = True
+        self.record_format = None
+        self.record_size = 0
+        self.sent = 0
+        self.held = None
+        self.last_time = 0
+        self.exports = 0
+
+    async def send(self, data):
+        """Write all of data, sleeping whenever the port can't take more."""
+        view = memoryview(data)
+        while len(view):
+            num_bytes = self.port.write(view) or 0
+            if num_bytes:
+                view = view[num_bytes:]
+            else:
+                await asyncio.sleep(self.poll_secs)
+
+    def read_line(self):
+        """Next complete command line from the port, or None."""
+        waiting = self.port.in_waiting
+        if waiting:
+            space = len(self.line) - self.line_len
+            if not space:
+                # Too long to be a command; drop it.
+                self.line_len = 0
+                space = len(self.line)
+            view = memoryview(self.line)[self.line_len:self.line_len + min(waiting, space)]
+            self.line_len += self.port.readinto(view) or 0
+        # bytearray has no find() on CircuitPython.
+        end = 0
+        while end < self.line_len and self.line[end] != 10:
+            end += 1
+        if end == self.line_len:
+            return None
+        text = bytes(self.line[:end]).decode().strip()
+        rest = self.line_len - end - 1
+        self.line[:rest] = self.line[end + 1:self.line_len]
+        self.line_len = rest
+        return text
+
+    def start(self, t0, t1, channels, csv, offset):
+        self.records = self.data_log.range(t0, t1, channels)
+        self.csv = csv
+        self.record_format = '<l' + 'f' * len(channels)
+        self.record_size = struct.calcsize(self.record_format)
+        self.sent = offset
+        self.held = None
+        self.last_time = t0
+        self.exports += 1
+
+    def stop(self):
+        if self.records is not None:
+            self.records.close()
+        self.records = None
+        self.held = None
+
+    async def command(self, text):
+        parts = text.split()
+        if not parts:
+            return
+        if parts[0] == 'cancel':
+            self.stop()
+            await self.send(b'#end ' + str(self.sent).encode() + b'\n')
+            return
+        try:
+            if parts[0] != 'export' or not 3 <= len(parts) <= 6:
+                raise ValueError("unknown command")
+            t0 = int(parts[1])
+            t1 = int(parts[2])
+            num_fields = len(self.data_log.fields)
+            if len(parts) < 4 or parts[3] == '*':
+                channels = list(range(num_fields))
+            else:
+                channels = [int(channel) for channel in parts[3].split(',')]
+                for channel in channels:
+                    if not 0 <= channel < num_fields:
+                        raise ValueError("no channel " + str(channel))
+            file_format = parts[4] if len(parts) > 4 else 'csv'
+            if file_format not in ('csv', 'bin'):
+                raise ValueError("format must be csv or bin")
+            offset = int(parts[5]) if len(parts) > 5 else 0
+        except ValueError as e:
+            await self.send(('#error ' + str(e) + '\n').encode())
+            return
+        self.stop()
+        self.start(t0, t1, channels, file_format == 'csv', offset)
+        fields = ','.join(self.data_log.fields[channel] for channel in channels)
+        await self.send('#export {:d} {:d} {:s} {:d} {:s}\n'.format(t0, t1, file_format, offset, fields).encode())
+        if self.log:
+            self.log("export " + text)
+
+    def fill(self):
+        """Put the next records in the chunk buffer; return its length, or -1 at the end."""
+        pos = 0
+        chunk = self.chunk
+        for _ in range(self.chunk_records):
+            if self.held is not None:
+                time_secs, values = self.held
+                self.held = None
+            else:
+                try:
+                    time_secs, values = next(self.records)
+                except StopIteration:
+                    return pos if pos else -1
+            if self.csv:
+                text = (str(time_secs) + ',' + ','.join(format_value(value) for value in values) + '\n').encode()
+                if pos + len(text) > len(chunk):
+                    self.held = (time_secs, values)
+                    break
+                chunk[pos:pos + len(text)] = text
+                pos += len(text)
+            else:
+                if pos + self.record_size > len(chunk):
+                    self.held = (time_secs, values)
+                    break
+                struct.pack_into(self.record_format, chunk, pos, time_secs, *values)
+                pos += self.record_size
+            self.sent += 1
+            self.last_time = time_secs
+        return pos
+
+    async def task(self):
+        while True:
+            text = self.read_line()
+            if text is not None:
+                await self.command(text)
+                continue
+            if self.records is None:
+                await asyncio.sleep(self.poll_secs)
+                continue
+            try:
+                with self.span:
+                    num_bytes = self.fill()
+            except OSError as e:  # e.g. a segment removed under us; the client can resume.
+                self.stop()
+                await self.send(('#error ' + str(e) + '\n').encode())
+                continue
+            if num_bytes < 0:
+                self.stop()
+                await self.send(b'#end ' + str(self.sent).encode() + b'\n')
+                if self.log:
+                    self.log("export done, " + str(self.sent) + " records")
+                continue
+            if num_bytes:
+                await self.send('#data {:d} {:d} {:d}\n'.format(self.sent, num_bytes, self.last_time).encode())
+                await self.send(memoryview(self.chunk)[:num_bytes])
+            # Let the clock and everything else run before the next chunk.
+            await asyncio.sleep(0)
+
+
+class ExportClient(object):
+    """Host side: makes export commands and parses the replies as they arrive.
+
+    Each payload is passed to on_data(payload) once the whole chunk has
+    arrived; received and last_time are then where to resume from.
+    Replies to an earlier command, still in flight, are skipped until the
+    #export line that answers the latest one.
+    """
+
+    def __init__(self, on_data):
+        self.on_data = on_data
+        self.buffer = b''
+        self.chunk = None
+        self.received = 0
+        self.last_time = None
+        self.fields = None
+        self.started = False
+        self.done = False
+        self.error = None
+
+    def command(self, t0, t1, channels='*', file_format='csv'):
+        """The export command, resuming after what has been received so far."""
+        self.started = False
+        self.done = False
+        self.error = None
+        if self.last_time is not None:
+            t0 = self.last_time + 1
+        return 'export {:d} {:d} {:s} {:s} {:d}\n'.format(t0, t1, channels, file_format, self.received).encode()
+
+    def feed(self, data):
+        self.buffer += data
+        while True:
+            if self.chunk is not None:
+                records, num_bytes, last_time = self.chunk
+                if len(self.buffer) < num_bytes:
+                    return
+                payload = self.buffer[:num_bytes]
+                self.buffer = self.buffer[num_bytes:]
+                self.chunk = None
+                if self.started:
+                    self.received = records
+                    self.last_time = last_time
+                    self.on_data(payload)
+                continue
+            end = self.buffer.find(b'\n')
+            if end < 0:
+                return
+            line = self.buffer[:end].decode()
+            self.buffer = self.buffer[end + 1:]
+            parts = line.split()
+            if not parts:
+                continue
+            if parts[0] == '#data':
+                self.chunk = (int(parts[1]), int(parts[2]), int(parts[3]))
+            elif parts[0] == '#export':
+                self.started = int(parts[4]) == self.received
+                self.fields = parts[5].split(',')
+            elif not self.started:
+                continue
+            elif parts[0] == '#end':
+                self.done = True
+            elif parts[0] == '#error':
+                self.error = line[7:]
+
+
+def main():
+    import os
+    import select
+    import sys
+    import tty
+
+    if not 4 <= len(sys.argv) <= 6:
+        print("usage: export.py PORT T0 T1 [CHANNELS [csv|bin]]", file=sys.stderr)
+        sys.exit(2)
+    t0 = int(sys.argv[2])
+    t1 = int(sys.argv[3])
+    channels = sys.argv[4] if len(sys.argv) > 4 else '*'
+    file_format = sys.argv[5] if len(sys.argv) > 5 else 'csv'
+    out = sys.stdout.buffer
+    client = ExportClient(out.write)
+    fd = os.open(sys.argv[1], os.O_RDWR | os.O_NOCTTY)
+    tty.setraw(fd)
+    os.write(fd, client.command(t0, t1, channels, file_format))
+    while not client.done:
+        ready, _, _ = select.select([fd], [], [], 5.0)
+        if not ready:
+            # Stalled: ask again from the last complete chunk.
+            print("resuming at record", client.received, "time", client.last_time, file=sys.stderr)
+            os.write(fd, client.command(t0, t1, channels, file_format))
+            continue
+        client.feed(os.read(fd, 4096))
+        if client.error:
+            print("error:", client.error, file=sys.stderr)
+            sys.exit(1)
+        if client.last_time is not None and t1 > t0:
+            print("\r{:5.1f}%".format(100.0 * (client.last_time - t0) / (t1 - t0)), end='', file=sys.stderr)
+    print("\n{:d} records".format(client.received), file=sys.stderr)
+    os.close(fd)
+
+
+if __name__ == '__main__':
+    main()
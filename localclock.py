@@ -0,0 +1,36 @@
+# localclock.py
+#
+# The device's local time: which clock to read, which time zone it is in,
+# and timestamped console logging.  Shared by all the other modules.
+
+import time
+
+from tz import TimeZone
+
+# Local time zone: US Eastern.
+LOCAL_TZ = TimeZone(std_hours=-5, rule='US')
+
+# Source of UTC seconds for log timestamps; see set_clock.
+now = time.time
+
+def set_clock(clock):
+  """Timestamp log lines with clock.now() (an RtcClock, or a simulated clock)."""
+  global now
+  now = clock.now
+
+def is_dst(secs_in_utc):
+  """True if DST is in effect at this UTC time."""
+  return LOCAL_TZ.is_dst(secs_in_utc)
+
+def my_localtime(secs_in_utc):
+  """Convert utc_secs to a time struct including DST."""
+  return LOCAL_TZ.localtime(secs_in_utc)
+
+def format_time(secs_in_utc):
+  t = my_localtime(secs_in_utc)
+  return '{:4d}-{:02d}-{:02d} {:02d}:{:02d}:{:02d}'.format(t.tm_year, t.tm_mon, t.tm_mday, t.tm_hour, t.tm_min, t.tm_sec)
+
+DO_LOG = True
+def log(msg):
+    if DO_LOG:
+        print(format_time(now()), ":", msg)
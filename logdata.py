@@ -0,0 +1,840 @@
+# logdata.py
+#
+# In-RAM history of logged samples, with optional consolidated tiers, backed
+# by one of the logstore formats.  MultiRateLog runs several such histories,
+# each at its own interval, over one sensor read and one log file.
+
+import array
+
+from localclock import log
+from logstore import NAN, FlushPolicy, open_log_file, select_fields
+from profiler import NO_PROFILER
+
+
+class RingView(object):
+  """Read-only, chronologically-ordered view of one column of a LogData ring.
+
+  If decode is given (a quantizer's decode), stored values pass through it.
+  """
+  def __init__(self, logger, column, decode=None):
+    self.logger = logger
+    self.column = column
+    self.decode = decode
+
+  def __len__(self):
+    return self.logger.count
+
+  def __getitem__(self, index):
+    count = self.logger.count
+    if index < 0:
+      index += count
+    if index < 0 or index >= count:
+      raise IndexError("RingView index out of range")
+    value = self.column[(self.logger.head - count + index) % self.logger.max_len]
+    if self.decode:
+      return self.decode(value)
+    return value
+
+  def __iter__(self):
+    logger = self.logger
+    start = logger.head - logger.count
+    for i in range(logger.count):
+      value = self.column[(start + i) % logger.max_len]
+      if self.decode:
+        value = self.decode(value)
+      yield value
+
+
+def make_column(quantizer, max_len):
+  """Storage for one field: int16 if it has a quantizer, else float32."""
+  if quantizer:
+    return array.array('h', [0] * max_len)
+  return array.array('f', [0.0] * max_len)
+
+
+def make_views(logger, columns, quantizers):
+  return [RingView(logger, column, quantizer and quantizer.decode)
+          for column, quantizer in zip(columns, quantizers)]
+
+
+def bisect_left(seq, value, lo=0, hi=None):
+  """Index of the first item of sorted seq that is >= value (there's no bisect module here)."""
+  if hi is None:
+    hi = len(seq)
+  while lo < hi:
+    mid = (lo + hi) // 2
+    if seq[mid] < value:
+      lo = mid + 1
+    else:
+      hi = mid
+  return lo
+
+
+def bisect_right(seq, value, lo=0, hi=None):
+  """Index of the first item of sorted seq that is > value."""
+  if hi is None:
+    hi = len(seq)
+  while lo < hi:
+    mid = (lo + hi) // 2
+    if value < seq[mid]:
+      hi = mid
+    else:
+      lo = mid + 1
+  return lo
+
+
+def tier_filename(filename, span_secs):
+  """data.csv -> data-3600.csv"""
+  dot = filename.rfind('.')
+  if dot < 0:
+    return filename + '-' + str(span_secs)
+  return filename[:dot] + '-' + str(span_secs) + filename[dot:]
+
+
+class ConsolidatedTier(object):
+  """Min, mean and max of each channel over fixed spans of time.
+
+  Like LogData, completed spans go into a preallocated ring.  The span in
+  progress is accumulated incrementally as samples arrive, and committed
+  when the first sample of the next span is added.  Committed spans wait in
+  the ring until save(), which LogData calls when it flushes its own
+  samples, appends them to the tier's own file, if any.  Buckets are
+  aligned to multiples of span_secs in UTC.  Committed values are quantized
+  like LogData's.
+  """
+  def __init__(self, span_secs, fields, max_len=120, filename=None, segments=None, quantizers=None):
+    self.span_secs = span_secs
+    self.max_len = max_len
+    num_fields = len(fields)
+    quantizers = quantizers or [None] * num_fields
+    self.encoders = [quantizer and quantizer.encode for quantizer in quantizers]
+    self.times = array.array('l', [0] * max_len)
+    self.mins = [make_column(quantizer, max_len) for quantizer in quantizers]
+    self.means = [make_column(quantizer, max_len) for quantizer in quantizers]
+    self.maxs = [make_column(quantizer, max_len) for quantizer in quantizers]
+    self.head = 0
+    self.count = 0
+    self.time_view = RingView(self, self.times)
+    self.min_views = make_views(self, self.mins, quantizers)
+    self.mean_views = make_views(self, self.means, quantizers)
+    self.max_views = make_views(self, self.maxs, quantizers)
+    # Accumulators for the span in progress.
+    self.acc_bucket = 0
+    self.acc_count = 0
+    self.acc_sum = array.array('f', [0.0] * num_fields)
+    self.acc_min = array.array('f', [0.0] * num_fields)
+    self.acc_max = array.array('f', [0.0] * num_fields)
+    # Samples in buckets before this one have already been consolidated.
+    self.next_bucket = 0
+    # Committed spans at the end of the ring not yet written to the file.
+    self.unsaved = 0
+    self.store = None
+    self.store_columns = []
+    if filename:
+      store_fields = []
+      for channel, field in enumerate(fields):
+        store_fields.extend([field + ' min', field, field + ' max'])
+        self.store_columns.extend([self.min_views[channel], self.mean_views[channel], self.max_views[channel]])
+      self.store = open_log_file(filename, store_fields, span_secs, segments)
+
+  def load(self):
+    """Read back previously committed spans."""
+    num_lines = 0
+    try:
+      for time_secs, values in self.store.read_tail(self.max_len):
+        self._commit_row(time_secs, values[0::3], values[1::3], values[2::3])
+        num_lines += 1
+    except (OSError, ValueError) as e:
+      log("Cannot read " + self.store.filename + ": " + str(e))
+    log(str(num_lines) + " lines read from " + self.store.filename)
+
+  def _store(self, channel, index, min_value, mean, max_value):
+    encode = self.encoders[channel]
+    if encode:
+      min_value = encode(min_value)
+      mean = encode(mean)
+      max_value = encode(max_value)
+    self.mins[channel][index] = min_value
+    self.means[channel][index] = mean
+    self.maxs[channel][index] = max_value
+
+  def _commit_row(self, time_secs, mins, means, maxs):
+    index = self.head
+    self.times[index] = time_secs
+    for channel in range(len(self.means)):
+      self._store(channel, index, mins[channel], means[channel], maxs[channel])
+    self.head = (index + 1) % self.max_len
+    if self.count < self.max_len:
+      self.count += 1
+    self.next_bucket = time_secs // self.span_secs + 1
+
+  def commit(self):
+    """Close the span in progress."""
+    if not self.acc_count:
+      return
+    index = self.head
+    self.times[index] = self.acc_bucket * self.span_secs
+    for channel in range(len(self.means)):
+      self._store(channel, index, self.acc_min[channel], self.acc_sum[channel] / self.acc_count,
+                  self.acc_max[channel])
+    self.head = (index + 1) % self.max_len
+    if self.count < self.max_len:
+      self.count += 1
+    self.next_bucket = self.acc_bucket + 1
+    self.acc_count = 0
+    self.unsaved += 1
+
+  def save(self):
+    """Write the spans committed since the last save; return bytes written."""
+    if self.unsaved > self.count:
+      if self.store:
+        log(str(self.unsaved - self.count) + " unsaved spans overwritten")
+      self.unsaved = self.count
+    if not self.unsaved or not self.store:
+      self.unsaved = 0
+      return 0
+    num_bytes = 0
+    try:
+      num_bytes = self.store.append(self.time_view, self.store_columns, self.count - self.unsaved, self.count)
+      self.unsaved = 0
+    except OSError as e:
+      log("Cannot write " + self.store.filename)
+    return num_bytes
+
+  def add(self, time_secs, values):
+    bucket = time_secs // self.span_secs
+    if bucket < self.next_bucket:
+      # Already consolidated, e.g. raw history re-read at boot.
+      return
+    if self.acc_count and bucket != self.acc_bucket:
+      self.commit()
+    if not self.acc_count:
+      self.acc_bucket = bucket
+      for channel in range(len(self.acc_sum)):
+        value = values[channel]
+        self.acc_sum[channel] = value
+        self.acc_min[channel] = value
+        self.acc_max[channel] = value
+    else:
+      for channel in range(len(self.acc_sum)):
+        value = values[channel]
+        self.acc_sum[channel] += value
+        if value < self.acc_min[channel]:
+          self.acc_min[channel] = value
+        if value > self.acc_max[channel]:
+          self.acc_max[channel] = value
+    self.acc_count += 1
+
+
+class LogData(object):
+  """Collected regularly-spaced logging data.
+
+  Samples are held in a preallocated circular buffer: one array of times and
+  one array per field.  Appending overwrites the oldest sample once max_len
+  is reached, so memory use is fixed when the object is constructed.
+  quantizers, if given, has an encoding (see quantize.py) or None for each
+  field; those fields are held as int16 rather than float32, and the views
+  decode them.
+
+  Each entry of tier_secs adds a ConsolidatedTier (e.g. hourly, daily) that
+  is updated as samples arrive, so long time spans can be displayed without
+  keeping the raw samples.
+
+  With segments (a logstore.SegmentPolicy), the file and each tier's file
+  are split by month and held within the policy's budget, which they share
+  (see SegmentPolicy.split; tiers are never compacted, since averaging
+  would lose their min and max).  tier_segments, if given, are the tiers'
+  policies, one per entry of tier_secs, in place of a share of segments.
+
+  range() reads any stretch of time, from RAM and, for anything older
+  than the ring holds, from the file.
+
+  The history in filename is read at construction, unless defer_load is
+  set; then load_steps() reads it a file at a time, e.g. across the first
+  few clock ticks after boot.  store, if given, is read in place of
+  opening filename, which then only names the tiers' files and appears in
+  log messages.  name, if given, goes into the tiers' file names
+  (data-NAME-3600.csv), telling apart LogDatas that share one file.
+
+  log_data and save are timed by profiler, if given.
+  """
+  def __init__(self, fields, interval_secs, max_len=120, filename=None, flush_policy=None,
+               tier_secs=(), tier_len=120, profiler=None, segments=None, quantizers=None,
+               defer_load=False, store=None, name=None, tier_segments=None):
+    self.fields = fields
+    self.interval_secs = interval_secs
+    self.max_len = max_len
+    quantizers = quantizers or [None] * len(fields)
+    self.quantizers = quantizers
+    self.all_channels = list(range(len(fields)))
+    self.encoders = [quantizer and quantizer.encode for quantizer in quantizers]
+    self.times = array.array('l', [0] * max_len)
+    self.columns = [make_column(quantizer, max_len) for quantizer in quantizers]
+    # Slot that the next sample will be written to, and number of valid samples.
+    self.head = 0
+    self.count = 0
+    # Views are built once so that fetch_data doesn't allocate.
+    self.time_view = RingView(self, self.times)
+    self.column_views = make_views(self, self.columns, quantizers)
+    self.registered_displays = []
+    self.filename = filename
+    # Samples at the end of the ring not yet written to the file.  They are
+    # written in batches according to flush_policy.
+    self.unsaved_lines = 0
+    self.flush_policy = flush_policy or FlushPolicy()
+    self.last_flush_secs = None
+    # Flash wear accounting.
+    self.bytes_written = 0
+    self.flush_count = 0
+    profiler = profiler or NO_PROFILER
+    self.log_span = profiler.span('log')
+    self.save_span = profiler.span('save')
+    # A ".bin" filename selects the packed binary format, anything else is CSV.
+    self.store = store
+    if segments:
+      segments, tier_segments = segments.split(tier_secs)
+    tier_segments = tier_segments or [None] * len(tier_secs)
+    if self.filename and store is None:
+      self.store = open_log_file(filename, fields, interval_secs, segments)
+    tier_base = filename
+    if filename and name:
+      tier_base = tier_filename(filename, name)
+    self.tiers = []
+    for span_secs, span_segments in zip(tier_secs, tier_segments):
+      self.tiers.append(ConsolidatedTier(span_secs, fields, tier_len,
+                                         tier_base and tier_filename(tier_base, span_secs), span_segments,
+                                         quantizers))
+    self.history_loaded = False
+    if not defer_load:
+      for _ in self.load_steps():
+        pass
+
+  def load_steps(self):
+    """Read the saved history, yielding after each file."""
+    if self.history_loaded:
+      return
+    self.history_loaded = True
+    if not self.filename:
+      return
+    for tier in self.tiers:
+      tier.load()
+      yield
+    # Raw samples newer than the last committed span refill the tiers' accumulators.
+    self.load(self.filename)
+    yield
+
+  def __len__(self):
+    return self.count
+
+  def append(self, time_secs, values):
+    """Store one sample in the ring, overwriting the oldest if full."""
+    index = self.head
+    self.times[index] = time_secs
+    for channel in range(len(self.columns)):
+      value = values[channel]
+      encode = self.encoders[channel]
+      self.columns[channel][index] = encode(value) if encode else value
+    self.head = (index + 1) % self.max_len
+    if self.count < self.max_len:
+      self.count += 1
+    for tier in self.tiers:
+      tier.add(time_secs, values)
+
+  def clear(self):
+    self.head = 0
+    self.count = 0
+
+  def load(self, filename):
+    """Read-in the most recent max_len previously-saved records, if any."""
+    num_lines = 0
+    try:
+      for time_secs, values in self.store.read_tail(self.max_len):
+        self.append(time_secs, values)
+        num_lines += 1
+      if self.store.bad_records:
+        log(str(self.store.bad_records) + " bad records skipped in " + filename)
+    except (OSError, ValueError) as e:  # e.g. file not found, or wrong fields
+      log("Cannot read " + filename + ": " + str(e))
+    log(str(num_lines) + " lines read from " + filename)
+    self.unsaved_lines = 0
+
+  def save(self, filename):
+    """Attempt to write the new data so far to file."""
+    num_lines_added = 0
+    if self.unsaved_lines > self.count:
+      if filename:
+        log(str(self.unsaved_lines - self.count) + " unsaved lines overwritten")
+      self.unsaved_lines = self.count
+    if not filename:
+      return
+    try:
+      first_datum_index = self.count - self.unsaved_lines
+      log("starting from datum " + str(first_datum_index))
+      with self.save_span:
+        self.bytes_written += self.store.append(self.time_view, self.column_views, first_datum_index, self.count)
+      self.flush_count += 1
+      num_lines_added = self.unsaved_lines
+      self.unsaved_lines = 0
+    except OSError as e:  # Typically when the filesystem isn't writeable...
+      log("Cannot write " + filename)
+    log(str(num_lines_added) + " lines added to " + filename + "; "
+        + str(self.bytes_written) + " B in " + str(self.flush_count) + " flushes total")
+
+  def save_tiers(self):
+    """Write the tiers' committed spans; return bytes written."""
+    num_bytes = 0
+    for tier in self.tiers:
+      num_bytes += tier.save()
+    return num_bytes
+
+  def flush(self, time_secs=None):
+    """Write out any pending samples now, e.g. before a reset."""
+    if self.unsaved_lines:
+      self.save(self.filename)
+    # The tiers' spans go in the same flush as the samples.
+    self.bytes_written += self.save_tiers()
+    if time_secs is not None:
+      self.last_flush_secs = time_secs
+
+  def maybe_flush(self, time_secs):
+    """Write pending samples if the flush policy says it's time."""
+    if self.last_flush_secs is None:
+      self.last_flush_secs = time_secs
+    if self.flush_policy.due(self.unsaved_lines, self.max_len, time_secs - self.last_flush_secs):
+      self.flush(time_secs)
+
+  def last_time(self):
+    """Time of the most recent sample, or None if there are none."""
+    if self.count:
+      return self.times[(self.head - 1) % self.max_len]
+    return None
+
+  def time_to_log(self, time_secs):
+    # If we submitted a datum at this time, would it be logged?
+    if self.count:
+      last_time_step = self.last_time() // self.interval_secs
+    else:
+      last_time_step = -1
+    new_time_step = time_secs // self.interval_secs
+    return new_time_step != last_time_step
+
+  def channels_to_log(self, time_secs):
+    """The channels that a datum at this time would log (all of them), or None."""
+    if self.time_to_log(time_secs):
+      return self.all_channels
+    return None
+
+  def log_data(self, values, time_secs):
+    if self.time_to_log(time_secs):
+      with self.log_span:
+        # We have new data to log; the ring drops the earliest sample when full.
+        self.append(time_secs, values)
+        self.unsaved_lines += 1
+        # Update dependent displays
+        self.update_displays()
+        # Maybe save to disk.
+        self.maybe_flush(time_secs)
+
+  def update_displays(self):
+      for data_display in self.registered_displays:
+        data_display.display_log()
+
+  def tier_for(self, secs_per_pixel):
+    """Coarsest tier whose span fits within one pixel, or None for raw data."""
+    best = None
+    for tier in self.tiers:
+      if self.interval_secs < tier.span_secs <= secs_per_pixel:
+        if best is None or tier.span_secs > best.span_secs:
+          best = tier
+    return best
+
+  def fetch_data(self, channel, secs_per_pixel=None):
+    """Return chronological (times, values) views; no copies are made.
+
+    With secs_per_pixel, the means from the best-matching tier are returned
+    in place of raw samples when that tier exists.
+    """
+    if secs_per_pixel is not None:
+      tier = self.tier_for(secs_per_pixel)
+      if tier is not None:
+        return tier.time_view, tier.mean_views[channel]
+    return self.time_view, self.column_views[channel]
+
+  def range(self, t0, t1, channels=None, step=None):
+    """Yield (time_secs, values) for t0 <= time_secs < t1, oldest first.
+
+    values holds the given channels (all by default).  With step, at most
+    one sample is returned per step seconds, using the means of the
+    coarsest tier that fits, as fetch_data does.  Samples are found by
+    binary search, in the ring and then in the file for times before the
+    ring's oldest, so nothing outside [t0, t1) is read or copied.
+    """
+    if channels is None:
+      channels = range(len(self.fields))
+    source = self
+    columns = self.column_views
+    file_columns = channels
+    if step is not None:
+      tier = self.tier_for(step)
+      if tier is not None:
+        source = tier
+        columns = tier.mean_views
+        # Tier files hold min, mean and max of each channel.
+        file_columns = [3 * channel + 1 for channel in channels]
+    times = source.time_view
+    next_secs = t0
+    if source.store and (not len(times) or t0 < times[0]):
+      file_t1 = min(t1, times[0]) if len(times) else t1
+      try:
+        for time_secs, values in source.store.iter_range(t0, file_t1):
+          if time_secs < next_secs:
+            continue
+          if step:
+            next_secs = (time_secs // step + 1) * step
+          yield time_secs, [values[column] for column in file_columns]
+      except (OSError, ValueError) as e:
+        log("Cannot read " + source.store.filename + ": " + str(e))
+    for index in range(bisect_left(times, max(t0, next_secs)), bisect_left(times, t1)):
+      time_secs = times[index]
+      if time_secs < next_secs:
+        continue
+      if step:
+        next_secs = (time_secs // step + 1) * step
+      yield time_secs, [columns[channel][index] for channel in channels]
+
+  def register_display(self, data_display):
+    self.registered_displays.append(data_display)
+
+
+def gcd(a, b):
+  while b:
+    a, b = b, a % b
+  return a
+
+
+def has_value(values):
+  """Whether any of values isn't NaN."""
+  for value in values:
+    if value == value:
+      return True
+  return False
+
+
+class StreamStore(object):
+  """One MultiRateLog stream's records, read out of the shared store.
+
+  Records in the shared file hold every field, with NaN for channels that
+  weren't due, so a record belongs to the stream when none of its channels
+  are NaN; values are returned in the stream's channel order.
+  read_tail(n) reads the shared store backwards until it has the stream's
+  last n records, holding them in arrays rather than as records; the
+  other streams' records in between are passed over without converting
+  their values, and at most twice as many as n of its intervals would
+  hold are read.
+  """
+  def __init__(self, store, channels, interval_secs):
+    self.store = store
+    self.channels = channels
+    self.interval_secs = interval_secs
+    self.filename = store.filename
+    self.bad_records = 0
+
+  def select(self, records):
+    self.bad_records = 0
+    for time_secs, values in records:
+      stream_values = [values[channel] for channel in self.channels]
+      for value in stream_values:
+        if value != value:
+          break
+      else:
+        yield time_secs, stream_values
+    self.bad_records = self.store.bad_records
+
+  def read_tail(self, num_records):
+    num_channels = len(self.channels)
+    times = array.array('l', [0] * num_records)
+    values = array.array('f', [0.0] * (num_records * num_channels))
+    count = 0
+    limit = 2 * num_records * max(1, self.interval_secs // (self.store.interval_secs or self.interval_secs))
+    records = self.store.iter_reverse(self.channels)
+    for time_secs, record in records:
+      limit -= 1
+      if limit < 0:
+        break
+      if record is None:
+        continue
+      index = num_records - 1 - count
+      times[index] = time_secs
+      for position in range(num_channels):
+        values[index * num_channels + position] = record[self.channels[position]]
+      count += 1
+      if count == num_records:
+        break
+    records.close()
+    self.bad_records = self.store.bad_records
+    for index in range(num_records - count, num_records):
+      yield times[index], values[index * num_channels:(index + 1) * num_channels]
+
+  def iter_range(self, t0, t1):
+    return self.select(self.store.iter_range(t0, t1))
+
+
+class Stream(object):
+  """What one MultiRateLog stream logs: channels (indexes into its fields),
+  every interval_secs, keeping max_len samples in RAM, plus tiers as for
+  LogData.  name tells apart the stream's tier files (data-NAME-3600.csv);
+  without one (for at most one stream) they are named as a LogData's would
+  be, and tier files left by a LogData of every field are cut down to the
+  stream's channels when the MultiRateLog is made.
+  """
+  def __init__(self, channels, interval_secs, max_len=120, tier_secs=(), tier_len=120, name=None):
+    self.channels = channels
+    self.interval_secs = interval_secs
+    self.max_len = max_len
+    self.tier_secs = tier_secs
+    self.tier_len = tier_len
+    self.name = name
+
+
+class MultiRateLog(object):
+  """Several streams of fields, each logged at its own interval, in one file.
+
+  Each entry of streams (a Stream) becomes a LogData over its channels, in
+  self.streams, for DataDisplays to plot; its fields are means over its own
+  interval, which SensorSampler.take_interval(channels) keeps separately
+  per channel from the same readings.  Whenever any stream is due, the due
+  streams' values are merged into one record of every field, NaN where a
+  channel isn't due, and records are written to the one store (a file or
+  segment set, as for LogData) in batches per flush_policy; at most
+  max_pending wait in RAM.  A file written by a LogData of the same fields
+  reads back as records of every stream.
+
+  The interface is LogData's as far as ClockApp and ExportServer use it:
+  interval_secs (the streams' common divisor) and channels_to_log tell
+  the sampler when to wake and what to read, and range() returns whole
+  records, including NaNs, from the file and the pending ones.
+  """
+  def __init__(self, fields, streams, filename=None, flush_policy=None, max_pending=32,
+               profiler=None, segments=None, quantizers=None, defer_load=False):
+    self.fields = fields
+    self.all_channels = list(range(len(fields)))
+    quantizers = quantizers or [None] * len(fields)
+    self.interval_secs = 0
+    for spec in streams:
+      self.interval_secs = gcd(spec.interval_secs, self.interval_secs)
+    self.filename = filename
+    # The store and every stream's tiers share the budget.
+    all_tier_secs = [span_secs for spec in streams for span_secs in spec.tier_secs]
+    tier_segments = [None] * len(all_tier_secs)
+    if segments:
+      segments, tier_segments = segments.split(all_tier_secs)
+    self.store = None
+    if filename:
+      self.store = open_log_file(filename, fields, self.interval_secs, segments)
+    self.stream_channels = [spec.channels for spec in streams]
+    # Reused for each stream's share of a reading.
+    self.stream_values = [[0.0] * len(spec.channels) for spec in streams]
+    self.streams = []
+    for spec in streams:
+      stream_tier_segments = tier_segments[:len(spec.tier_secs)]
+      tier_segments = tier_segments[len(spec.tier_secs):]
+      if filename and not spec.name and len(spec.channels) < len(fields):
+        self.select_tier_fields(filename, fields, spec.channels, spec.tier_secs, stream_tier_segments)
+      self.streams.append(LogData([fields[channel] for channel in spec.channels], spec.interval_secs,
+                                  spec.max_len, filename, tier_secs=spec.tier_secs,
+                                  tier_len=spec.tier_len, profiler=profiler, tier_segments=stream_tier_segments,
+                                  quantizers=[quantizers[channel] for channel in spec.channels],
+                                  defer_load=True,
+                                  store=self.store and StreamStore(self.store, spec.channels,
+                                                                   spec.interval_secs),
+                                  name=spec.name))
+    # Channel lists by bitmask of due streams, built as they come up.
+    self.due_channels = {}
+    # Merged records not yet written.
+    self.max_pending = max_pending
+    self.times = array.array('l', [0] * max_pending)
+    self.columns = [array.array('f', [NAN] * max_pending) for _ in fields]
+    self.pending = 0
+    self.records_logged = 0
+    self.flush_policy = flush_policy or FlushPolicy()
+    self.last_flush_secs = None
+    self.bytes_written = 0
+    self.flush_count = 0
+    profiler = profiler or NO_PROFILER
+    self.log_span = profiler.span('log')
+    self.save_span = profiler.span('save')
+    self.history_loaded = False
+    if not defer_load:
+      for _ in self.load_steps():
+        pass
+
+  def select_tier_fields(self, filename, fields, channels, tier_secs, tier_segments):
+    """Cut tier files written when one LogData logged every field down to channels.
+
+    tier_segments are the tiers' policies, as for LogData.
+    """
+    tier_fields = []
+    for field in fields:
+      tier_fields.extend([field + ' min', field, field + ' max'])
+    tier_channels = []
+    for channel in channels:
+      tier_channels.extend([3 * channel, 3 * channel + 1, 3 * channel + 2])
+    for span_secs, segments in zip(tier_secs, tier_segments):
+      name = tier_filename(filename, span_secs)
+      num_records = select_fields(name, tier_fields, tier_channels, span_secs, segments)
+      if num_records:
+        log(str(num_records) + " records of " + name + " cut to " + str(len(channels)) + " fields")
+
+  def load_steps(self):
+    """Read each stream's saved history, yielding after each file."""
+    if self.history_loaded:
+      return
+    self.history_loaded = True
+    for stream in self.streams:
+      for _ in stream.load_steps():
+        yield
+
+  @property
+  def registered_displays(self):
+    displays = []
+    for stream in self.streams:
+      displays.extend(stream.registered_displays)
+    return displays
+
+  def update_displays(self):
+    for stream in self.streams:
+      stream.update_displays()
+
+  def last_time(self):
+    """Time of the most recent sample of any stream, or None if there are none."""
+    latest = None
+    for stream in self.streams:
+      time_secs = stream.last_time()
+      if time_secs is not None and (latest is None or time_secs > latest):
+        latest = time_secs
+    return latest
+
+  def time_to_log(self, time_secs):
+    for stream in self.streams:
+      if stream.time_to_log(time_secs):
+        return True
+    return False
+
+  def channels_to_log(self, time_secs):
+    """The channels of every stream due at this time (a list reused between calls), or None."""
+    mask = 0
+    for index in range(len(self.streams)):
+      if self.streams[index].time_to_log(time_secs):
+        mask |= 1 << index
+    if not mask:
+      return None
+    channels = self.due_channels.get(mask)
+    if channels is None:
+      channels = []
+      for index in range(len(self.streams)):
+        if mask & (1 << index):
+          channels.extend(self.stream_channels[index])
+      self.due_channels[mask] = channels
+    return channels
+
+  def log_data(self, values, time_secs):
+    """Log values (one per field) to each stream that is due; the others' values are ignored."""
+    with self.log_span:
+      for index in range(len(self.streams)):
+        stream = self.streams[index]
+        if not stream.time_to_log(time_secs):
+          continue
+        channels = self.stream_channels[index]
+        stream_values = self.stream_values[index]
+        for position in range(len(channels)):
+          stream_values[position] = values[channels[position]]
+        stream.append(time_secs, stream_values)
+        self.add_pending(time_secs, channels, stream_values)
+        stream.update_displays()
+      self.maybe_flush(time_secs)
+
+  def add_pending(self, time_secs, channels, stream_values):
+    """Merge one stream's sample into the pending record for its time."""
+    index = self.pending - 1
+    if index < 0 or self.times[index] != time_secs:
+      if self.pending == self.max_pending:
+        self.flush(time_secs)
+        if self.pending:
+          log(str(self.pending) + " unsaved records overwritten")
+          self.pending = 0
+      index = self.pending
+      self.times[index] = time_secs
+      for column in self.columns:
+        column[index] = NAN
+      self.pending += 1
+      self.records_logged += 1
+    for position in range(len(channels)):
+      self.columns[channels[position]][index] = stream_values[position]
+
+  def save(self):
+    """Attempt to write the pending records to file."""
+    if not self.store:
+      self.pending = 0
+      return
+    num_records = 0
+    try:
+      with self.save_span:
+        self.bytes_written += self.store.append(self.times, self.columns, 0, self.pending)
+      self.flush_count += 1
+      num_records = self.pending
+      self.pending = 0
+    except OSError as e:  # Typically when the filesystem isn't writeable...
+      log("Cannot write " + self.filename)
+    log(str(num_records) + " lines added to " + self.filename + "; "
+        + str(self.bytes_written) + " B in " + str(self.flush_count) + " flushes total")
+
+  def flush(self, time_secs=None):
+    """Write out any pending records, and the streams' tiers, now, e.g. before a reset."""
+    if self.pending:
+      self.save()
+    for stream in self.streams:
+      self.bytes_written += stream.save_tiers()
+    if time_secs is not None:
+      self.last_flush_secs = time_secs
+
+  def maybe_flush(self, time_secs):
+    """Write pending records if the flush policy says it's time."""
+    if self.last_flush_secs is None:
+      self.last_flush_secs = time_secs
+    if self.flush_policy.due(self.pending, self.max_pending, time_secs - self.last_flush_secs):
+      self.flush(time_secs)
+
+  def range(self, t0, t1, channels=None):
+    """Yield (time_secs, values) for t0 <= time_secs < t1, oldest first.
+
+    values holds the given channels (all by default), NaN where a record
+    doesn't cover a channel; records covering none of them are left out.
+    A stream's range() gives just its own samples, and decimated ones.
+    Records come from the file up to the oldest pending one, then from
+    RAM.  Records flushed part way through are picked up from the file, so
+    a long-running export misses none.
+    """
+    if channels is None:
+      channels = self.all_channels
+    next_secs = t0
+    while next_secs < t1:
+      pending_t0 = self.times[0] if self.pending else t1
+      if next_secs < pending_t0:
+        file_t1 = min(t1, pending_t0)
+        if self.store:
+          try:
+            for time_secs, values in self.store.iter_range(next_secs, file_t1):
+              values = [values[channel] for channel in channels]
+              if has_value(values):
+                yield time_secs, values
+          except (OSError, ValueError) as e:
+            log("Cannot read " + self.filename + ": " + str(e))
+        next_secs = file_t1
+        continue
+      index = bisect_left(self.times, next_secs, 0, self.pending)
+      if index == self.pending or self.times[index] >= t1:
+        return
+      next_secs = self.times[index] + 1
+      values = [self.columns[channel][index] for channel in channels]
+      if has_value(values):
+        yield self.times[index], values
@@ -0,0 +1,1031 @@
+# logstore.py
+#
+# On-flash storage formats for LogData history.
+#
+# Two interchangeable backends share the same small interface:
+#   read_tail(num_records) -> iterator of (time_secs, values)
+#   iter_records() -> iterator of (time_secs, values), oldest first
+#   iter_range(t0, t1) -> the same, for t0 <= time_secs < t1 only
+#   iter_reverse(channels=None) -> iterator of (time_secs, values), newest
+#       first; with channels, values is None (and left unparsed) for
+#       records with NaN in any of them
+#   append(times, columns, start, stop) -> bytes written
+# CsvLogFile is the original one-line-per-sample text format.  BinaryLogFile
+# is a header followed by fixed-size packed records (int32 time, float32 per
+# field), which is about a third the size and needs no text parsing.
+# SegmentedLog keeps either format in one file per month, listed in a
+# manifest, and holds the total within a SegmentPolicy's flash budget.
+# iter_range finds its start by binary search (over records, byte offsets
+# or the manifest), so it costs little more than the records it returns.
+#
+# Run on the host to migrate an existing file:
+#   python logstore.py data.csv data.bin "°F,%H,Pa,Go" 720
+#   python logstore.py data.bin data.csv
+
+import array
+import gc
+import os
+import struct
+
+from localclock import log
+from tz import civil_from_days
+
+BINARY_MAGIC = b'DLC1'
+# magic, header_len, record_size, interval_secs, len(names)
+HEADER_FORMAT = '<4sHHlH'
+HEADER_FIXED_SIZE = struct.calcsize(HEADER_FORMAT)
+NAN = float('nan')
+
+
+def read_tail_lines(fp, num_lines, block_size=512):
+    """Return up to the last num_lines complete lines of a binary file.
+
+    Blocks are read backwards from the end of the file only until enough line
+    breaks have been seen, so the cost depends on num_lines, not the file size.
+    """
+    pos = fp.seek(0, 2)
+    chunks = []
+    newlines = 0
+    # One more break than lines wanted marks the start of the earliest line.
+    while pos > 0 and newlines <= num_lines:
+        step = min(block_size, pos)
+        pos -= step
+        fp.seek(pos)
+        chunk = fp.read(step)
+        newlines += chunk.count(b'\n')
+        chunks.append(chunk)
+    chunks.reverse()
+    lines = b''.join(chunks).split(b'\n')
+    if pos > 0:
+        # First piece starts mid-line.
+        lines = lines[1:]
+    lines = [line.strip() for line in lines]
+    lines = [line for line in lines if line]
+    return lines[-num_lines:]
+
+
+def parse_csv_line(line, num_fields, channels=None):
+    """Split one CSV record into (time_secs, values); ValueError if malformed.
+
+    With channels, a record with nan for any of them gives (time_secs, None)
+    without converting its values.
+    """
+    fields = line.split(',')
+    if len(fields) != num_fields + 1:
+        raise ValueError("wrong number of fields")
+    if channels is not None:
+        for channel in channels:
+            if fields[channel + 1] == 'nan':
+                return int(fields[0]), None
+    # Make sure time is stored as a long int.
+    return int(fields[0]), [float(s) for s in fields[1:]]
+
+
+def format_value(value):
+    """Text for one float field; 7 digits is all a float32 carries."""
+    return '{:.7g}'.format(value)
+
+
+class CsvLogFile(object):
+    """One comma-separated line per sample: time,field0,field1,..."""
+
+    def __init__(self, filename, fields, interval_secs=None, block_size=512):
+        self.filename = filename
+        self.fields = fields
+        self.interval_secs = interval_secs
+        self.block_size = block_size
+        self.bad_records = 0
+
+    def read_tail(self, num_records):
+        """Yield (time_secs, values) for the last num_records lines."""
+        with open(self.filename, "rb") as fp:
+            lines = read_tail_lines(fp, num_records, self.block_size)
+        self.bad_records = 0
+        for line in lines:
+            try:
+                yield parse_csv_line(line.decode(), len(self.fields))
+            except ValueError:  # e.g. a torn final line
+                self.bad_records += 1
+
+    def iter_records(self):
+        """Yield every (time_secs, values) from the start, one line at a time."""
+        self.bad_records = 0
+        with open(self.filename, "r") as fp:
+            for line in fp:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield parse_csv_line(line, len(self.fields))
+                except ValueError:
+                    self.bad_records += 1
+
+    def iter_reverse(self, channels=None):
+        """Yield (time_secs, values) from the last line back, reading blocks backwards as needed."""
+        self.bad_records = 0
+        with open(self.filename, "rb") as fp:
+            pos = fp.seek(0, 2)
+            partial = b''
+            while pos > 0:
+                step = min(self.block_size, pos)
+                pos -= step
+                fp.seek(pos)
+                lines = (fp.read(step) + partial).split(b'\n')
+                # The first piece may start mid-line; it is finished by the block before.
+                partial = lines[0]
+                for index in range(len(lines) - 1, 0, -1):
+                    line = lines[index].strip()
+                    if not line:
+                        continue
+                    try:
+                        yield parse_csv_line(line.decode(), len(self.fields), channels)
+                    except ValueError:  # e.g. a torn final line
+                        self.bad_records += 1
+            line = partial.strip()
+            if line:
+                try:
+                    yield parse_csv_line(line.decode(), len(self.fields), channels)
+                except ValueError:
+                    self.bad_records += 1
+
+    def lines_after(self, pos):
+        """Count the line breaks after byte pos, a block at a time."""
+        num_lines = 0
+        with open(self.filename, "rb") as fp:
+            fp.seek(pos)
+            while True:
+                chunk = fp.read(self.block_size)
+                if not chunk:
+                    return num_lines
+                num_lines += chunk.count(b'\n')
+
+    def time_after(self, fp, pos):
+        """Time of the first whole line starting after byte pos, or None at the end."""
+        fp.seek(pos)
+        if pos:
+            fp.readline()
+        while True:
+            line = fp.readline()
+            if not line:
+                return None
+            try:
+                return parse_csv_line(line.decode().strip(), len(self.fields))[0]
+            except ValueError:  # Blank or torn; try the next.
+                pass
+
+    def iter_range(self, t0, t1):
+        """Yield (time_secs, values) for t0 <= time_secs < t1, oldest first.
+
+        Lines vary in length, so the start is found by bisecting byte offsets:
+        the line containing lo is always earlier than t0, until lo and hi are
+        within a block, and the rest is a short scan.
+        """
+        self.bad_records = 0
+        with open(self.filename, "rb") as fp:
+            lo = 0
+            hi = fp.seek(0, 2)
+            while hi - lo > self.block_size:
+                mid = (lo + hi) // 2
+                time_secs = self.time_after(fp, mid)
+                if time_secs is not None and time_secs < t0:
+                    lo = mid
+                else:
+                    hi = mid
+            fp.seek(lo)
+            if lo:
+                fp.readline()
+            for line in fp:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    time_secs, values = parse_csv_line(line.decode(), len(self.fields))
+                except ValueError:
+                    self.bad_records += 1
+                    continue
+                if time_secs >= t1:
+                    return
+                if time_secs >= t0:
+                    yield time_secs, values
+
+    def append(self, times, columns, start, stop):
+        """Write samples [start, stop) of the given views; return bytes written."""
+        num_bytes = 0
+        with open(self.filename, "a") as fp:
+            for index in range(start, stop):
+                num_bytes += fp.write(str(times[index]))
+                for column in columns:
+                    num_bytes += fp.write(',')
+                    num_bytes += fp.write(format_value(column[index]))
+                num_bytes += fp.write('\n')
+        return num_bytes
+
+
+class BinaryLogFile(object):
+    """Header plus fixed-size records of int32 time and float32 per field.
+
+    Because every record is the same size, the n-th record lives at a known
+    offset: the tail is one seek and one readinto, and a trailing partial
+    record left by an interrupted write is simply ignored (and overwritten by
+    the next append).
+    """
+
+    def __init__(self, filename, fields, interval_secs=0):
+        self.filename = filename
+        self.fields = fields
+        self.interval_secs = interval_secs
+        self.record_format = '<l' + 'f' * len(fields)
+        self.record_size = struct.calcsize(self.record_format)
+        self.names = ','.join(fields).encode()
+        self.header_len = HEADER_FIXED_SIZE + len(self.names)
+        self.bad_records = 0
+        self.buffer = None
+
+    def header(self):
+        return struct.pack(HEADER_FORMAT, BINARY_MAGIC, self.header_len, self.record_size,
+                           self.interval_secs, len(self.names)) + self.names
+
+    def check_header(self, fp):
+        """Validate an existing file's header against our record layout."""
+        fixed = fp.read(HEADER_FIXED_SIZE)
+        if len(fixed) < HEADER_FIXED_SIZE:
+            raise ValueError(self.filename + ": truncated header")
+        magic, header_len, record_size, interval_secs, names_len = struct.unpack(HEADER_FORMAT, fixed)
+        if magic != BINARY_MAGIC:
+            raise ValueError(self.filename + ": not a binary log")
+        names = fp.read(names_len)
+        if record_size != self.record_size or names != self.names:
+            raise ValueError(self.filename + ": fields " + names.decode() + " do not match")
+        self.header_len = header_len
+        self.interval_secs = interval_secs
+
+    def num_records(self):
+        """Count of complete records, ignoring any torn trailing bytes."""
+        try:
+            size = os.stat(self.filename)[6]
+        except OSError:
+            return 0
+        return max(0, (size - self.header_len) // self.record_size)
+
+    def record_offset(self, index):
+        return self.header_len + index * self.record_size
+
+    def read_record(self, index):
+        """Random access to the index-th record as (time_secs, values)."""
+        with open(self.filename, "rb") as fp:
+            self.check_header(fp)
+            fp.seek(self.record_offset(index))
+            data = fp.read(self.record_size)
+        if len(data) < self.record_size:
+            raise IndexError("record index out of range")
+        record = struct.unpack(self.record_format, data)
+        return record[0], record[1:]
+
+    def read_tail(self, num_records):
+        """Yield (time_secs, values) for the last num_records records."""
+        self.bad_records = 0
+        with open(self.filename, "rb") as fp:
+            self.check_header(fp)
+            total = self.num_records()
+            count = min(num_records, total)
+            # Reuse one buffer across calls; only grows if more records are asked for.
+            if self.buffer is None or len(self.buffer) < count * self.record_size:
+                self.buffer = bytearray(num_records * self.record_size)
+            view = memoryview(self.buffer)[:count * self.record_size]
+            fp.seek(self.record_offset(total - count))
+            fp.readinto(view)
+        for index in range(count):
+            record = struct.unpack_from(self.record_format, self.buffer, index * self.record_size)
+            yield record[0], record[1:]
+
+    def iter_records(self):
+        """Yield every (time_secs, values) from the start, one record at a time."""
+        self.bad_records = 0
+        data = bytearray(self.record_size)
+        with open(self.filename, "rb") as fp:
+            self.check_header(fp)
+            for _ in range(self.num_records()):
+                fp.readinto(data)
+                record = struct.unpack(self.record_format, data)
+                yield record[0], record[1:]
+
+    def iter_reverse(self, channels=None):
+        """Yield (time_secs, values) from the last record back, a block of records per read."""
+        self.bad_records = 0
+        block_records = max(1, 512 // self.record_size)
+        data = bytearray(block_records * self.record_size)
+        with open(self.filename, "rb") as fp:
+            self.check_header(fp)
+            end = self.num_records()
+            while end > 0:
+                start = max(0, end - block_records)
+                fp.seek(self.record_offset(start))
+                fp.readinto(memoryview(data)[:(end - start) * self.record_size])
+                for index in range(end - start - 1, -1, -1):
+                    record = struct.unpack_from(self.record_format, data, index * self.record_size)
+                    values = record[1:]
+                    if channels is not None:
+                        for channel in channels:
+                            if values[channel] != values[channel]:
+                                values = None
+                                break
+                    yield record[0], values
+                end = start
+
+    def iter_range(self, t0, t1):
+        """Yield (time_secs, values) for t0 <= time_secs < t1, oldest first.
+
+        The first record is found by bisecting record indexes, reading just
+        the time of each probe.
+        """
+        self.bad_records = 0
+        data = bytearray(self.record_size)
+        with open(self.filename, "rb") as fp:
+            self.check_header(fp)
+            lo = 0
+            hi = self.num_records()
+            total = hi
+            while lo < hi:
+                mid = (lo + hi) // 2
+                fp.seek(self.record_offset(mid))
+                fp.readinto(data)
+                if struct.unpack_from('<l', data)[0] < t0:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            fp.seek(self.record_offset(lo))
+            for _ in range(lo, total):
+                fp.readinto(data)
+                record = struct.unpack(self.record_format, data)
+                if record[0] >= t1:
+                    return
+                yield record[0], record[1:]
+
+    def append(self, times, columns, start, stop):
+        """Write samples [start, stop) of the given views; return bytes written."""
+        num_bytes = 0
+        record = bytearray(self.record_size)
+        try:
+            size = os.stat(self.filename)[6]
+        except OSError:
+            size = 0
+        if size == 0:
+            with open(self.filename, "wb") as fp:
+                num_bytes += fp.write(self.header())
+            size = self.header_len
+        with open(self.filename, "r+b") as fp:
+            self.check_header(fp)
+            # Start at the end of the last complete record, dropping any torn write.
+            fp.seek(self.record_offset((size - self.header_len) // self.record_size))
+            for index in range(start, stop):
+                struct.pack_into('<l', record, 0, times[index])
+                offset = 4
+                for column in columns:
+                    struct.pack_into('<f', record, offset, column[index])
+                    offset += 4
+                num_bytes += fp.write(record)
+        return num_bytes
+
+
+class FlushPolicy(object):
+    """Decide when buffered (unsaved) samples should be written to flash.
+
+    A flush is due when any of these is true:
+      - max_records samples are pending;
+      - max_secs have passed since the last flush;
+      - free heap has dropped below min_free_bytes (where gc.mem_free exists);
+      - the ring is about to overwrite samples that were never written.
+    max_records=1 reproduces the old write-every-sample behavior.
+    """
+
+    def __init__(self, max_records=10, max_secs=2 * 60 * 60, min_free_bytes=8 * 1024):
+        self.max_records = max_records
+        self.max_secs = max_secs
+        self.min_free_bytes = min_free_bytes
+
+    def due(self, pending, capacity, secs_since_flush):
+        if not pending:
+            return False
+        if pending >= self.max_records or pending >= capacity:
+            return True
+        if self.max_secs is not None and secs_since_flush >= self.max_secs:
+            return True
+        mem_free = getattr(gc, 'mem_free', None)
+        if self.min_free_bytes and mem_free is not None and mem_free() < self.min_free_bytes:
+            return True
+        return False
+
+
+def split_filename(filename):
+    """'dir/data.csv' -> ('dir/', 'data', '.csv'), without os.path."""
+    slash = filename.rfind('/') + 1
+    dot = filename.rfind('.')
+    if dot < slash:
+        dot = len(filename)
+    return filename[:slash], filename[slash:dot], filename[dot:]
+
+
+def bucket_means(records, step, num_fields):
+    """Yield (bucket_start, means) for (time_secs, values) grouped into step-second buckets.
+
+    NaN values (channels a MultiRateLog record doesn't cover) are left out
+    of the means; a channel with none in a bucket stays NaN.
+    """
+    sums = [0.0] * num_fields
+    counts = [0] * num_fields
+    count = 0
+    bucket = 0
+    for time_secs, values in records:
+        this_bucket = time_secs // step
+        if count and this_bucket != bucket:
+            yield bucket * step, [sums[channel] / counts[channel] if counts[channel] else NAN
+                                  for channel in range(num_fields)]
+            count = 0
+        if not count:
+            bucket = this_bucket
+            for channel in range(num_fields):
+                sums[channel] = 0.0
+                counts[channel] = 0
+        for channel in range(num_fields):
+            value = values[channel]
+            if value == value:
+                sums[channel] += value
+                counts[channel] += 1
+        count += 1
+    if count:
+        yield bucket * step, [sums[channel] / counts[channel] if counts[channel] else NAN
+                              for channel in range(num_fields)]
+
+
+class SegmentPolicy(object):
+    """How a SegmentedLog is kept within a flash budget.
+
+    Whenever a log's segments add up to more than budget_bytes, the oldest
+    segment (never the newest) that is still finer than compact_secs, if
+    set, and older than the last full_rate_secs of records is compacted to
+    one mean record per compact_secs.  Once there are none, the oldest
+    segment is deleted, or compacted first if it is still at full rate.
+    budget_bytes=None keeps everything.
+    A segment that reaches segment_bytes (by default a quarter of the
+    budget) is closed and the month continues in a new one, so that the
+    budget can always be met from closed segments however fast the log
+    grows.
+
+    For a log with tiers, split() gives tier_budget_bytes of the budget
+    (by default half) to the tiers and the rest to the log itself.
+    """
+
+    def __init__(self, budget_bytes=None, compact_secs=None, segment_bytes=None, full_rate_secs=None,
+                 tier_budget_bytes=None):
+        self.budget_bytes = budget_bytes
+        self.compact_secs = compact_secs
+        self.full_rate_secs = full_rate_secs
+        if segment_bytes is None and budget_bytes is not None:
+            segment_bytes = budget_bytes // 4
+        self.segment_bytes = segment_bytes
+        if tier_budget_bytes is None and budget_bytes is not None:
+            tier_budget_bytes = budget_bytes // 2
+        self.tier_budget_bytes = tier_budget_bytes
+
+    def split(self, tier_secs):
+        """Policies for a log and for each of its tiers (spanning tier_secs), within budget_bytes all told.
+
+        Each tier's share of tier_budget_bytes is in proportion to how often
+        it writes, so that the tiers hold about the same days of history.
+        """
+        if self.budget_bytes is None or not tier_secs:
+            return self, [SegmentPolicy() for _ in tier_secs]
+        log_policy = SegmentPolicy(self.budget_bytes - self.tier_budget_bytes, self.compact_secs,
+                                   full_rate_secs=self.full_rate_secs)
+        rate = 0.0
+        for span_secs in tier_secs:
+            rate += 1.0 / span_secs
+        tier_policies = [SegmentPolicy(int(self.tier_budget_bytes / (span_secs * rate))) for span_secs in tier_secs]
+        return log_policy, tier_policies
+
+
+class Segment(object):
+    """One manifest entry: a segment file and what it holds."""
+
+    def __init__(self, name, first=0, last=0, records=0, size=0, step=0):
+        self.name = name
+        self.first = first
+        self.last = last
+        self.records = records
+        self.size = size
+        # Seconds between records: the log's interval, or compact_secs once compacted.
+        self.step = step
+
+    def line(self):
+        return '{:s},{:d},{:d},{:d},{:d},{:d}\n'.format(
+            self.name, self.first, self.last, self.records, self.size, self.step)
+
+
+# Records per write while compacting.
+COMPACT_BATCH = 32
+
+
+def is_segment_name(stem, ext, name):
+    """stem-YYYY-MM.ext, optionally with -N and then -c; stem-c.ext for a compacted legacy file."""
+    if name == stem + '-c' + ext:
+        return True
+    prefix = stem + '-'
+    if not name.startswith(prefix) or not name.endswith(ext):
+        return False
+    rest = name[len(prefix):len(name) - len(ext)]
+    if rest.endswith('-c'):
+        rest = rest[:-2]
+    dash = rest.rfind('-')
+    if len(rest) > 7 and dash == 7 and rest[8:].isdigit():
+        rest = rest[:7]
+    return len(rest) == 7 and rest[4] == '-' and rest[:4].isdigit() and rest[5:].isdigit()
+
+
+def segment_files(filename):
+    """Names of filename's segment files, and of filename itself if left from before segmenting.
+
+    Only those, not the manifest or tier files, from a listing of the
+    directory rather than the manifest.
+    """
+    directory, stem, ext = split_filename(filename)
+    names = []
+    for name in os.listdir(directory[:-1] or '.'):
+        if is_segment_name(stem, ext, name) or name == stem + ext:
+            names.append(name)
+    return names
+
+
+class SegmentedLog(object):
+    """A log kept as one file per calendar month (UTC), plus a manifest.
+
+    For data.csv the segments are data-2022-05.csv and so on, in the same
+    format as data.csv would have been, and data-manifest.csv lists each
+    one's name, first and last record times, record count, size in bytes
+    and record spacing.  A month that outgrows the policy's segment_bytes
+    continues in data-2022-05-1.csv, data-2022-05-2.csv, ...  Because the
+    manifest says how many records each segment holds, read_tail opens
+    only the newest segment or two, however much history there is.  A
+    data.csv left from before segmenting is kept as the oldest segment.
+    After each append, policy (a SegmentPolicy) compacts or deletes the
+    oldest segments to stay within its budget.
+
+    The manifest is only rewritten when segments are added, compacted or
+    removed, not on every append; at startup the records appended to the
+    newest segment since then are counted from its line breaks or size.  Compaction
+    writes a new file (data-2022-05-c.csv) and records it in the manifest
+    before removing the old one, so a power loss leaves one or the other.
+    """
+
+    def __init__(self, filename, fields, interval_secs=0, policy=None):
+        self.filename = filename
+        self.fields = fields
+        self.interval_secs = interval_secs
+        self.policy = policy or SegmentPolicy()
+        self.directory, self.stem, self.ext = split_filename(filename)
+        self.manifest_name = self.directory + self.stem + '-manifest.csv'
+        # Oldest first.
+        self.segments = []
+        self.bad_records = 0
+        self.load_manifest()
+
+    def path(self, segment):
+        return self.directory + segment.name
+
+    def store(self, segment):
+        return open_log_file(self.path(segment), self.fields, segment.step or self.interval_secs)
+
+    def size_of(self, segment):
+        try:
+            return os.stat(self.path(segment))[6]
+        except OSError:
+            return 0
+
+    def segment_key(self, time_secs):
+        year, month, _, _ = civil_from_days(time_secs // 86400)
+        return year * 100 + month
+
+    def segment_name(self, key, part=0):
+        if part:
+            return '{:s}-{:04d}-{:02d}-{:d}{:s}'.format(self.stem, key // 100, key % 100, part, self.ext)
+        return '{:s}-{:04d}-{:02d}{:s}'.format(self.stem, key // 100, key % 100, self.ext)
+
+    def compacted_name(self, name):
+        """Where a segment's compacted records go: data-2022-05.csv <-> data-2022-05-c.csv."""
+        base = name[:len(name) - len(self.ext)]
+        if base.endswith('-c'):
+            return base[:-2] + self.ext
+        return base + '-c' + self.ext
+
+    def total_size(self):
+        return sum(segment.size for segment in self.segments)
+
+    def load_manifest(self):
+        try:
+            with open(self.manifest_name, "r") as fp:
+                for line in fp:
+                    parts = line.strip().split(',')
+                    if len(parts) == 6:
+                        self.segments.append(Segment(parts[0], *[int(part) for part in parts[1:]]))
+        except (OSError, ValueError):  # No manifest yet, or a damaged one.
+            self.segments = []
+            self.rebuild()
+            return
+        # The newest segment has usually been appended to since the manifest was written.
+        if self.segments and self.size_of(self.segments[-1]) != self.segments[-1].size:
+            self.scan_tail(self.segments[-1])
+
+    def write_manifest(self):
+        with open(self.manifest_name, "w") as fp:
+            for segment in self.segments:
+                fp.write(segment.line())
+
+    def rebuild(self):
+        """Recreate the manifest from the segment files themselves."""
+        names = segment_files(self.filename)
+        for name in names:
+            if name.endswith('-c' + self.ext) and self.compacted_name(name) in names:
+                # A compaction that never reached the manifest; the original is whole.
+                continue
+            step = self.interval_secs
+            if name.endswith('-c' + self.ext) and self.policy.compact_secs:
+                step = self.policy.compact_secs  # unless the file says otherwise
+            segment = Segment(name, step=step)
+            self.scan(segment)
+            if segment.records:
+                self.segments.append(segment)
+        self.segments.sort(key=lambda segment: segment.first)
+        if self.segments:
+            self.write_manifest()
+
+    def scan(self, segment):
+        """Read a whole segment to fill in its manifest entry."""
+        segment.records = 0
+        store = self.store(segment)
+        try:
+            for time_secs, values in store.iter_records():
+                if not segment.records:
+                    segment.first = time_secs
+                segment.last = time_secs
+                segment.records += 1
+            segment.step = store.interval_secs or segment.step
+        except (OSError, ValueError):  # e.g. missing file, or not our format
+            pass
+        segment.size = self.size_of(segment)
+
+    def scan_tail(self, segment):
+        """Count the records appended to a segment since its manifest entry was written.
+
+        Only the line breaks after the entry's size (CSV) or the file's size
+        (binary) are counted, and the last record read for its time, so this
+        parses nothing however much was appended.
+        """
+        size = self.size_of(segment)
+        if not segment.records or size < segment.size:
+            self.scan(segment)
+            return
+        store = self.store(segment)
+        last_time = None
+        try:
+            # Two, in case the last line is torn.
+            for last_time, _ in store.read_tail(2):
+                pass
+            if isinstance(store, BinaryLogFile):
+                records = store.num_records()
+            else:
+                records = segment.records + store.lines_after(segment.size)
+        except (OSError, ValueError):
+            last_time = None
+        if last_time is None:
+            self.scan(segment)
+            return
+        segment.last = last_time
+        segment.records = records
+        segment.size = size
+
+    def read_tail(self, num_records):
+        """Yield (time_secs, values) for the last num_records records, from as few segments as possible."""
+        chosen = []
+        needed = num_records
+        for segment in reversed(self.segments):
+            if needed <= 0:
+                break
+            take = min(needed, segment.records)
+            chosen.append((segment, take))
+            needed -= take
+        chosen.reverse()
+        self.bad_records = 0
+        for segment, take in chosen:
+            store = self.store(segment)
+            for record in store.read_tail(take):
+                yield record
+            self.bad_records += store.bad_records
+
+    def iter_records(self):
+        self.bad_records = 0
+        for segment in self.segments:
+            store = self.store(segment)
+            for record in store.iter_records():
+                yield record
+            self.bad_records += store.bad_records
+
+    def iter_reverse(self, channels=None):
+        self.bad_records = 0
+        for segment in reversed(self.segments):
+            store = self.store(segment)
+            for record in store.iter_reverse(channels):
+                yield record
+            self.bad_records += store.bad_records
+
+    def iter_range(self, t0, t1):
+        """Records for t0 <= time_secs < t1 from just the segments the manifest says overlap."""
+        self.bad_records = 0
+        for segment in self.segments:
+            if segment.last < t0:
+                continue
+            if segment.first >= t1:
+                break
+            store = self.store(segment)
+            for record in store.iter_range(t0, t1):
+                yield record
+            self.bad_records += store.bad_records
+
+    def append(self, times, columns, start, stop):
+        """Write samples [start, stop) into their months' segments; return bytes written."""
+        num_bytes = 0
+        changed = False
+        index = start
+        while index < stop:
+            key = self.segment_key(times[index])
+            run_end = index + 1
+            while run_end < stop and self.segment_key(times[run_end]) == key:
+                run_end += 1
+            newest = self.segments[-1] if self.segments else None
+            if newest is None or (newest.name != self.segment_name(key)
+                                  and key > self.segment_key(newest.last)):
+                self.segments.append(Segment(self.segment_name(key), step=self.interval_secs))
+                changed = True
+            elif (self.policy.segment_bytes and newest.size >= self.policy.segment_bytes
+                  and key >= self.segment_key(newest.last)):
+                # The month goes on in a new part, numbered after the newest.
+                part = self.segment_part(newest.name) + 1 if key == self.segment_key(newest.last) else 1
+                while (self.find_segment(self.segment_name(key, part)) is not None
+                       or self.find_segment(self.compacted_name(self.segment_name(key, part))) is not None):
+                    part += 1
+                self.segments.append(Segment(self.segment_name(key, part), step=self.interval_secs))
+                changed = True
+            # Anything older than the newest segment (a clock set back) goes in the newest.
+            segment = self.segments[-1]
+            num_bytes += self.store(segment).append(times, columns, index, run_end)
+            if not segment.records:
+                segment.first = times[index]
+            segment.last = times[run_end - 1]
+            segment.records += run_end - index
+            segment.size = self.size_of(segment)
+            index = run_end
+        if self.enforce_budget() or changed:
+            self.write_manifest()
+        return num_bytes
+
+    def segment_part(self, name):
+        """N for stem-YYYY-MM-N.ext (compacted or not), else 0."""
+        rest = name[len(self.stem) + 1:len(name) - len(self.ext)]
+        if rest.endswith('-c'):
+            rest = rest[:-2]
+        if len(rest) > 8 and rest[8:].isdigit():
+            return int(rest[8:])
+        return 0
+
+    def find_segment(self, name):
+        for segment in self.segments:
+            if segment.name == name:
+                return segment
+        return None
+
+    def enforce_budget(self):
+        """Compact or delete the oldest segments while over budget; return whether any changed."""
+        budget = self.policy.budget_bytes
+        compact_secs = self.policy.compact_secs
+        changed = False
+        while budget is not None and len(self.segments) > 1 and self.total_size() > budget:
+            changed = True
+            finer = None
+            if compact_secs:
+                keep_after = self.segments[-1].last - (self.policy.full_rate_secs or 0)
+                for segment in self.segments[:-1]:
+                    if segment.step < compact_secs and segment.last < keep_after:
+                        finer = segment
+                        break
+                if finer is None and self.segments[0].step < compact_secs:
+                    # Nothing coarser left to delete: full-rate records become means rather than go.
+                    finer = self.segments[0]
+            if finer is not None:
+                self.compact(finer, compact_secs)
+            else:
+                try:
+                    os.remove(self.path(self.segments[0]))
+                except OSError:
+                    pass
+                del self.segments[0]
+        if budget is not None and self.segments and self.segments[-1].size > budget:
+            log(self.path(self.segments[-1]) + " alone is over the " + str(budget) + " B budget")
+        return changed
+
+    def compact(self, segment, step):
+        """Replace a segment's records with one mean record per step seconds.
+
+        The means go to a new file, which the manifest then lists in place
+        of the old one; only then is the old one removed.
+        """
+        old_name = segment.name
+        temp = Segment(self.compacted_name(old_name), step=step)
+        try:
+            os.remove(self.path(temp))
+        except OSError:
+            pass
+        out = self.store(temp)
+        times = array.array('l', [0] * COMPACT_BATCH)
+        columns = [array.array('f', [0.0] * COMPACT_BATCH) for _ in self.fields]
+        pending = 0
+        for time_secs, means in bucket_means(self.store(segment).iter_records(), step, len(self.fields)):
+            if not temp.records:
+                temp.first = time_secs
+            temp.last = time_secs
+            temp.records += 1
+            times[pending] = time_secs
+            for channel in range(len(columns)):
+                columns[channel][pending] = means[channel]
+            pending += 1
+            if pending == COMPACT_BATCH:
+                out.append(times, columns, 0, pending)
+                pending = 0
+        if pending:
+            out.append(times, columns, 0, pending)
+        segment.name = temp.name
+        segment.first = temp.first
+        segment.last = temp.last
+        segment.records = temp.records
+        segment.step = step
+        segment.size = self.size_of(segment)
+        if not segment.records:
+            self.segments.remove(segment)
+        self.write_manifest()
+        os.remove(self.directory + old_name)
+        if not segment.records:
+            try:
+                os.remove(self.path(segment))
+            except OSError:
+                pass
+
+
+def open_log_file(filename, fields, interval_secs=0, segments=None):
+    """Pick the storage backend from the file extension.
+
+    With segments (a SegmentPolicy), the log is a SegmentedLog of that format.
+    """
+    if segments is not None:
+        return SegmentedLog(filename, fields, interval_secs, segments)
+    if filename.endswith('.bin'):
+        return BinaryLogFile(filename, fields, interval_secs)
+    return CsvLogFile(filename, fields, interval_secs)
+
+
+def csv_to_binary(csv_filename, bin_filename, fields, interval_secs=0):
+    """Convert a CSV log to binary, COMPACT_BATCH records per write; return records written."""
+    store = BinaryLogFile(bin_filename, fields, interval_secs)
+    times = array.array('l', [0] * COMPACT_BATCH)
+    columns = [array.array('f', [0.0] * COMPACT_BATCH) for _ in fields]
+    num_records = 0
+    pending = 0
+    with open(csv_filename, "r") as fp:
+        for line in fp:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                times[pending], values = parse_csv_line(line, len(fields))
+            except ValueError:
+                continue
+            for channel, value in enumerate(values):
+                columns[channel][pending] = value
+            pending += 1
+            if pending == COMPACT_BATCH:
+                store.append(times, columns, 0, pending)
+                num_records += pending
+                pending = 0
+    if pending:
+        store.append(times, columns, 0, pending)
+        num_records += pending
+    return num_records
+
+
+def select_file_fields(filename, fields, channels, interval_secs=0):
+    """Rewrite one log file of fields in place to hold only channels (indexes into fields).
+
+    A file in any other layout, e.g. one already rewritten, is left alone.
+    The copy is written beside the original, which is then replaced; if
+    power is lost in between, the next call finishes the job.  Returns
+    the records written.
+    """
+    directory, stem, ext = split_filename(filename)
+    temp = directory + stem + '-tmp' + ext
+    try:
+        os.stat(filename)
+    except OSError:
+        try:
+            os.rename(temp, filename)
+        except OSError:
+            pass
+        return 0
+    old = open_log_file(filename, fields, interval_secs)
+    try:
+        with open(filename, "rb") as fp:
+            if isinstance(old, BinaryLogFile):
+                old.check_header(fp)
+            else:
+                parse_csv_line(fp.readline().decode().strip(), len(fields))
+    except (OSError, ValueError):
+        return 0
+    try:
+        os.remove(temp)
+    except OSError:
+        pass
+    out = open_log_file(temp, [fields[channel] for channel in channels], old.interval_secs)
+    times = array.array('l', [0] * COMPACT_BATCH)
+    columns = [array.array('f', [0.0] * COMPACT_BATCH) for _ in channels]
+    num_records = 0
+    pending = 0
+    for time_secs, values in old.iter_records():
+        times[pending] = time_secs
+        for position in range(len(channels)):
+            columns[position][pending] = values[channels[position]]
+        pending += 1
+        if pending == COMPACT_BATCH:
+            out.append(times, columns, 0, pending)
+            num_records += pending
+            pending = 0
+    if pending:
+        out.append(times, columns, 0, pending)
+        num_records += pending
+    os.remove(filename)
+    os.rename(temp, filename)
+    return num_records
+
+
+def select_fields(filename, fields, channels, interval_secs=0, segments=None):
+    """Rewrite a log of fields to hold only channels, e.g. once a log's fields are split up.
+
+    With segments, each segment file in the directory is rewritten and the
+    manifest removed, so that the next SegmentedLog to open it rebuilds it
+    from the files.  Whether a file needs it is told from its first line or
+    header alone, so a log already rewritten costs an open per file.
+    Returns the records written; 0 when there was nothing to rewrite.
+    """
+    if segments is None:
+        return select_file_fields(filename, fields, channels, interval_secs)
+    directory, stem, ext = split_filename(filename)
+    names = segment_files(filename)
+    for name in os.listdir(directory[:-1] or '.'):
+        # A copy whose original was removed just before power was lost; select_file_fields renames it.
+        if name.endswith('-tmp' + ext):
+            original = name[:len(name) - len(ext) - 4] + ext
+            if original not in names and (is_segment_name(stem, ext, original) or original == stem + ext):
+                names.append(original)
+    num_records = 0
+    for name in names:
+        num_records += select_file_fields(directory + name, fields, channels, interval_secs)
+    if num_records:
+        try:
+            os.remove(directory + stem + '-manifest.csv')
+        except OSError:
+            pass
+    return num_records
+
+
+def binary_to_csv(bin_filename, csv_filename):
+    """Convert a binary log back to CSV; return records written."""
+    with open(bin_filename, "rb") as fp:
+        fixed = fp.read(HEADER_FIXED_SIZE)
+        names_len = struct.unpack(HEADER_FORMAT, fixed)[4]
+        fields = fp.read(names_len).decode().split(',')
+    store = BinaryLogFile(bin_filename, fields)
+    num_records = 0
+    with open(csv_filename, "w") as out:
+        with open(bin_filename, "rb") as fp:
+            store.check_header(fp)
+            for _ in range(store.num_records()):
+                record = struct.unpack(store.record_format, fp.read(store.record_size))
+                out.write(','.join([str(record[0])] + [format_value(x) for x in record[1:]]))
+                out.write('\n')
+                num_records += 1
+    return num_records
+
+
+if __name__ == '__main__':
+    import sys
+    if len(sys.argv) == 5:
+        print(csv_to_binary(sys.argv[1], sys.argv[2], sys.argv[3].split(','), int(sys.argv[4])), "records written")
+    elif len(sys.argv) == 3:
+        print(binary_to_csv(sys.argv[1], sys.argv[2]), "records written")
+    else:
+        print("usage: logstore.py IN.csv OUT.bin FIELD,FIELD,... INTERVAL_SECS")
+        print("       logstore.py IN.bin OUT.csv")
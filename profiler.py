@@ -0,0 +1,188 @@
+# profiler.py
+#
+# Named timing spans for the hot paths, cheap enough to leave on.
+#
+# Each Span is created once, at setup, and then wrapped around its code:
+#
+#   self.save_span = profiler.span('save')
+#   ...
+#   with self.save_span:
+#     ...
+#
+# Entering and leaving a span reads the millisecond tick counter and
+# gc.mem_alloc() and updates a few integers and a fixed histogram, so it
+# allocates nothing.  Every report_secs the Profiler's task prints one
+# compact line over serial (and, if filename is given, appends the full
+# histograms there) and starts a new window.
+
+import array
+import gc
+import time
+
+try:
+    import asyncio
+except ImportError:  # Only Profiler.task needs it.
+    asyncio = None
+
+# supervisor.ticks_ms wraps at 2**29 and is a small int, so reading it doesn't allocate.
+TICKS_MASK = (1 << 29) - 1
+
+if hasattr(time, 'monotonic_ns'):
+    monotonic_ns = time.monotonic_ns
+else:
+    def monotonic_ns():
+        """Float fallback for ports without monotonic_ns."""
+        return int(time.monotonic() * 1000000000)
+
+try:
+    from supervisor import ticks_ms
+except ImportError:
+    def ticks_ms():
+        """Host fallback with the same 29-bit wraparound."""
+        return (monotonic_ns() // 1000000) & TICKS_MASK
+
+if hasattr(gc, 'mem_alloc'):
+    mem_alloc = gc.mem_alloc
+else:
+    def mem_alloc():
+        return 0
+
+# Histogram bins: 0 ms, 1 ms, 2-3 ms, 4-7 ms, ... and a last one for 256 ms and up.
+NUM_BINS = 10
+
+
+def bin_for(ms):
+    """Histogram bin for a duration: its bit length, capped."""
+    index = 0
+    while ms and index < NUM_BINS - 1:
+        ms >>= 1
+        index += 1
+    return index
+
+
+class Span(object):
+    """Counts, total and maximum duration, histogram and allocation of one code path."""
+
+    def __init__(self, name):
+        self.name = name
+        self.hist = array.array('L', [0] * NUM_BINS)
+        self.start_ms = 0
+        self.start_alloc = 0
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.total_ms = 0
+        self.max_ms = 0
+        self.alloc_bytes = 0
+        self.max_alloc = 0
+        for index in range(NUM_BINS):
+            self.hist[index] = 0
+
+    def start(self):
+        self.start_alloc = mem_alloc()
+        self.start_ms = ticks_ms()
+
+    def stop(self):
+        ms = (ticks_ms() - self.start_ms) & TICKS_MASK
+        # Negative if a collection ran inside the span.
+        alloc = mem_alloc() - self.start_alloc
+        self.count += 1
+        self.total_ms += ms
+        if ms > self.max_ms:
+            self.max_ms = ms
+        self.hist[bin_for(ms)] += 1
+        if alloc > 0:
+            self.alloc_bytes += alloc
+            if alloc > self.max_alloc:
+                self.max_alloc = alloc
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def summary(self):
+        """Compact text: name count mean/max ms +bytes."""
+        return "{:s} {:d}x {:.1f}/{:d}ms +{:d}B".format(
+            self.name, self.count, self.total_ms / self.count, self.max_ms, self.alloc_bytes)
+
+    def histogram(self):
+        return "{:s},{:d},{:d},{:d},{:d},{:d},{:s}".format(
+            self.name, self.count, self.total_ms, self.max_ms, self.alloc_bytes, self.max_alloc,
+            ",".join(str(n) for n in self.hist))
+
+
+class NullSpan(object):
+    """What a disabled Profiler hands out."""
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+
+class Profiler(object):
+    """Registry of Spans, reported every report_secs through log and to filename.
+
+    With enabled=False, span() returns a shared no-op span and the task
+    does nothing, so instrumented code costs only a method call.
+    """
+
+    def __init__(self, enabled=True, report_secs=10 * 60, filename=None, log=None, now=None):
+        self.enabled = enabled
+        self.report_secs = report_secs
+        self.filename = filename
+        self.log = log
+        self.now = now
+        self.spans = []
+
+    def span(self, name):
+        if not self.enabled:
+            return NULL_SPAN
+        for span in self.spans:
+            if span.name == name:
+                return span
+        span = Span(name)
+        self.spans.append(span)
+        return span
+
+    def report(self):
+        """Print the window's stats, append them to filename, and start a new window."""
+        active = [span for span in self.spans if span.count]
+        if self.log and active:
+            self.log("prof " + "; ".join(span.summary() for span in active))
+        if self.filename and active:
+            stamp = str(self.now()) if self.now else ""
+            try:
+                with open(self.filename, "a") as fp:
+                    for span in active:
+                        fp.write(stamp + "," + span.histogram() + "\n")
+            except OSError as e:  # Typically when the filesystem isn't writeable...
+                if self.log:
+                    self.log("Cannot write " + self.filename)
+        for span in active:
+            span.reset()
+
+    async def task(self):
+        if not self.enabled:
+            return
+        while True:
+            await asyncio.sleep(self.report_secs)
+            self.report()
+
+
+# Shared disabled profiler, for code built without one.
+NO_PROFILER = Profiler(enabled=False)
@@ -0,0 +1,63 @@
+# quantize.py
+#
+# Per-field 16-bit encodings for LogData's in-RAM history.
+#
+# A float32 array costs 4 bytes per value; with a quantizer per field the
+# columns are array('h') at 2 bytes, and values are encoded as they are
+# stored and decoded as they are read.  Each field's step is chosen from
+# the precision it needs, e.g.
+#   Linear(0.01)                 °F or %RH to 0.01, within +/-327
+#   Linear(0.01, offset=1000.0)  hPa to 1 Pa, from 673 to 1327 hPa
+#   LogScale(0.001)              gas ohms to 0.1% (3 significant figures)
+# Values outside an encoding's range are clamped to its ends.
+
+import math
+
+Q_MIN = -32767
+Q_MAX = 32767
+
+
+def clamp(q):
+    if q < Q_MIN:
+        return Q_MIN
+    if q > Q_MAX:
+        return Q_MAX
+    return q
+
+
+class Linear(object):
+    """value = offset + step * q: absolute error at most step / 2."""
+
+    def __init__(self, step, offset=0.0):
+        self.step = step
+        self.offset = offset
+
+    def encode(self, value):
+        return clamp(round((value - self.offset) / self.step))
+
+    def decode(self, q):
+        return self.offset + self.step * q
+
+    def max_error(self, value):
+        return self.step / 2
+
+
+class LogScale(object):
+    """value = exp(step * q), for positive values spanning decades.
+
+    The relative error is at most about step / 2.  Values below min_value
+    (e.g. 0 before a sensor's first reading) are stored as min_value.
+    """
+
+    def __init__(self, step, min_value=1.0):
+        self.step = step
+        self.min_value = min_value
+
+    def encode(self, value):
+        return clamp(round(math.log(max(value, self.min_value)) / self.step))
+
+    def decode(self, q):
+        return math.exp(self.step * q)
+
+    def max_error(self, value):
+        return abs(value) * (math.exp(self.step / 2) - 1)
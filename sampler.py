@@ -0,0 +1,242 @@
+# sampler.py
+#
+# Oversampled, non-blocking sensor acquisition.
+#
+# Instead of one blocking read per log interval, SensorSampler takes a
+# reading every sample_secs and keeps running per-channel count, sum, min and
+# max until the logger collects the interval's means.  With the BME680, each
+# reading is started in forced mode and collected once the sensor reports new
+# data, so the heater cycle is spent asleep rather than polling inside the
+# driver.
+
+import array
+import struct
+import time
+
+from profiler import NO_PROFILER, monotonic_ns
+
+try:
+    import asyncio
+except ImportError:  # Only SensorSampler.task needs it.
+    asyncio = None
+
+# BME680 registers, as used by adafruit_bme680.
+_REG_CTRL_GAS = 0x71
+_REG_CTRL_HUM = 0x72
+_REG_CTRL_MEAS = 0x74
+_REG_CONFIG = 0x75
+_REG_MEAS_STATUS = 0x1D
+_RUNGAS = 0x10
+
+
+def temp_c_to_f(temp_c):
+    return 1.8*temp_c + 32.0
+
+
+def _read24(arr):
+    return (arr[0] << 16) | (arr[1] << 8) | arr[2]
+
+
+class BME680Reader(object):
+    """Split-phase reads of an adafruit_bme680 sensor: start(), then poll().
+
+    start() programs one forced-mode measurement of all four channels, and
+    poll() returns True once the sensor has new data, after loading it into
+    the driver exactly as its own (blocking) _perform_reading would.  The
+    driver's properties then return the new values without another
+    measurement, because its refresh interval has not elapsed.
+    """
+
+    # A measurement with gas heating takes about this long.
+    measure_secs = 0.2
+
+    def __init__(self, sensor):
+        self.sensor = sensor
+        self.num_channels = 4
+
+    def start(self):
+        s = self.sensor
+        s._write(_REG_CONFIG, [s._filter << 2])
+        s._write(_REG_CTRL_MEAS, [(s._temp_oversample << 5) | (s._pressure_oversample << 2)])
+        s._write(_REG_CTRL_HUM, [s._humidity_oversample])
+        run_gas = getattr(s, '_run_gas', _RUNGAS) & _RUNGAS
+        if getattr(s, '_chip_variant', 0) == 0x01:
+            s._write(_REG_CTRL_GAS, [run_gas << 1])
+        else:
+            s._write(_REG_CTRL_GAS, [run_gas])
+        ctrl = s._read_byte(_REG_CTRL_MEAS)
+        # Single shot.
+        s._write(_REG_CTRL_MEAS, [(ctrl & 0xFC) | 0x01])
+
+    def poll(self):
+        s = self.sensor
+        data = s._read(_REG_MEAS_STATUS, 17)
+        if not data[0] & 0x80:
+            return False
+        s._last_reading = time.monotonic()
+        s._adc_pres = _read24(data[2:5]) / 16
+        s._adc_temp = _read24(data[5:8]) / 16
+        s._adc_hum = struct.unpack(">H", bytes(data[8:10]))[0]
+        if getattr(s, '_chip_variant', 0) == 0x01:
+            s._adc_gas = int(struct.unpack(">H", bytes(data[15:17]))[0] / 64)
+            s._gas_range = data[16] & 0x0F
+        else:
+            s._adc_gas = int(struct.unpack(">H", bytes(data[13:15]))[0] / 64)
+            s._gas_range = data[14] & 0x0F
+        var1 = (s._adc_temp / 8) - (s._temp_calibration[0] * 2)
+        var2 = (var1 * s._temp_calibration[1]) / 2048
+        var3 = ((var1 / 2) * (var1 / 2)) / 4096
+        var3 = (var3 * s._temp_calibration[2] * 16) / 16384
+        s._t_fine = int(var2 + var3)
+        return True
+
+    def read(self, values):
+        """Fill values with the channels logged by data_logger_clock."""
+        s = self.sensor
+        values[0] = temp_c_to_f(s.temperature)
+        values[1] = s.humidity
+        values[2] = s.pressure
+        values[3] = s.gas
+
+
+class BlockingReader(object):
+    """Adapter for any sensor read by one blocking call returning all channels."""
+
+    measure_secs = 0
+
+    def __init__(self, read_values, num_channels):
+        self.read_values = read_values
+        self.num_channels = num_channels
+
+    def start(self):
+        pass
+
+    def poll(self):
+        return True
+
+    def read(self, values):
+        for channel, value in enumerate(self.read_values()):
+            values[channel] = value
+
+
+class IntervalStats(object):
+    """Running count, sum, min and max per channel; no allocation per sample.
+
+    Each channel has its own count, so channels logged at different
+    intervals can be reset separately.
+    """
+
+    def __init__(self, num_channels):
+        self.counts = array.array('l', [0] * num_channels)
+        self.sums = array.array('f', [0.0] * num_channels)
+        self.mins = array.array('f', [0.0] * num_channels)
+        self.maxs = array.array('f', [0.0] * num_channels)
+
+    def reset(self, channels):
+        for channel in channels:
+            self.counts[channel] = 0
+
+    def add(self, values):
+        for channel in range(len(self.sums)):
+            value = values[channel]
+            if not self.counts[channel]:
+                self.sums[channel] = value
+                self.mins[channel] = value
+                self.maxs[channel] = value
+            else:
+                self.sums[channel] += value
+                if value < self.mins[channel]:
+                    self.mins[channel] = value
+                if value > self.maxs[channel]:
+                    self.maxs[channel] = value
+            self.counts[channel] += 1
+
+    def means(self, out, channels):
+        for channel in channels:
+            out[channel] = self.sums[channel] / self.counts[channel]
+        return out
+
+
+class SensorSampler(object):
+    """Reads the sensor every sample_secs and aggregates until take_interval().
+
+    One reading feeds every channel; take_interval(channels) collects and
+    restarts just the channels that are due.
+
+    The synchronous cost of each reading (I2C traffic and conversion, not
+    the time spent waiting for the sensor) is tracked in microseconds, and
+    each poll is timed as profiler span 'sensor'.
+    """
+
+    def __init__(self, reader, sample_secs=30, log=None, profiler=None):
+        self.reader = reader
+        self.sample_secs = sample_secs
+        self.log = log
+        self.stats = IntervalStats(reader.num_channels)
+        self.values = [0.0] * reader.num_channels
+        self.means = [0.0] * reader.num_channels
+        self.all_channels = list(range(reader.num_channels))
+        self.samples = 0
+        self.last_cost_us = 0
+        self.max_cost_us = 0
+        self.total_cost_us = 0
+        self.span = (profiler or NO_PROFILER).span('sensor')
+
+    def sample_once(self):
+        """Blocking reading, for when the interval has no samples yet."""
+        self.reader.start()
+        time.sleep(self.reader.measure_secs)
+        while not self.reader.poll():
+            time.sleep(0.01)
+        self.reader.read(self.values)
+        self.stats.add(self.values)
+
+    def _account(self, cost_ns):
+        cost_us = cost_ns // 1000
+        self.last_cost_us = cost_us
+        self.total_cost_us += cost_us
+        if cost_us > self.max_cost_us:
+            self.max_cost_us = cost_us
+        self.samples += 1
+
+    async def task(self):
+        while True:
+            started = time.monotonic()
+            t0 = monotonic_ns()
+            self.reader.start()
+            cost_ns = monotonic_ns() - t0
+            await asyncio.sleep(self.reader.measure_secs)
+            while True:
+                t0 = monotonic_ns()
+                with self.span:
+                    ready = self.reader.poll()
+                    if ready:
+                        self.reader.read(self.values)
+                        self.stats.add(self.values)
+                cost_ns += monotonic_ns() - t0
+                if ready:
+                    break
+                await asyncio.sleep(0.01)
+            self._account(cost_ns)
+            await asyncio.sleep(max(0, self.sample_secs - (time.monotonic() - started)))
+
+    def take_interval(self, channels=None):
+        """Means over the interval so far (a list reused between calls); starts a new interval.
+
+        With channels, only those channels' means are updated and only their
+        intervals restart; the others keep accumulating, e.g. for a stream
+        logged at a longer interval.
+        """
+        if channels is None:
+            channels = self.all_channels
+        count = self.stats.counts[channels[0]]
+        if not count:
+            self.sample_once()
+            count = 1
+        if self.log:
+            self.log("sensor: {:d} samples, cost {:d} us last, {:d} us max, {:d} us mean".format(
+                count, self.last_cost_us, self.max_cost_us,
+                self.total_cost_us // max(1, self.samples)))
+        self.stats.means(self.means, channels)
+        self.stats.reset(channels)
+        return self.means
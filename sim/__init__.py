@@ -0,0 +1,43 @@
+# sim
+#
+# Host-side stand-ins for the CircuitPython hardware and display libraries,
+# so the application modules (app, displays, logdata, ...) can run and be
+# measured on a desktop Python.
+#
+#   import sim
+#   sim.install()          # before importing app / displays
+#   from sim.runner import Simulation
+#   s = Simulation()
+#   s.run(24 * 60 * 60)    # one simulated day, in a second or two of wall time
+#
+# sim.fakes.STATS counts pixel writes, tile writes, label text changes and
+# display objects created, so rendering cost can be compared without a board.
+
+import gc
+import sys
+import tracemalloc
+
+# Heap size reported by the fake gc.mem_free().
+HEAP_BYTES = 192 * 1024
+
+
+def mem_alloc():
+    """Bytes in use: traced Python allocations, if tracemalloc is running."""
+    if tracemalloc.is_tracing():
+        return tracemalloc.get_traced_memory()[0]
+    return 0
+
+
+def mem_free():
+    return HEAP_BYTES - mem_alloc()
+
+
+def install():
+    """Make the fake display libraries importable under their real names."""
+    from sim import fakes
+    for name, module in fakes.modules().items():
+        sys.modules[name] = module
+    # CircuitPython's gc extensions.
+    if not hasattr(gc, 'mem_free'):
+        gc.mem_free = mem_free
+        gc.mem_alloc = mem_alloc
@@ -0,0 +1,264 @@
+# fakes.py
+#
+# Minimal, counting replacements for displayio, bitmaptools, terminalio,
+# adafruit_display_text.label, adafruit_display_shapes.rect and
+# adafruit_bitmap_font.bitmap_font.  They implement only what this
+# project uses, and record in STATS what that use would cost on a device.
+
+import types
+
+STATS = {
+    'pixel_reads': 0,
+    'pixel_writes': 0,
+    'region_fills': 0,
+    'region_pixels': 0,
+    'tile_writes': 0,
+    'label_texts': 0,
+    'objects': 0,
+}
+
+
+def reset_stats():
+    for key in STATS:
+        STATS[key] = 0
+
+
+########## displayio ##########
+
+class Bitmap(object):
+    def __init__(self, width, height, value_count):
+        STATS['objects'] += 1
+        self.width = width
+        self.height = height
+        self.value_count = value_count
+        self.data = bytearray(width * height)
+
+    def _index(self, key):
+        if isinstance(key, tuple):
+            x, y = key
+            if not (0 <= x < self.width and 0 <= y < self.height):
+                raise IndexError("pixel out of range")
+            return y * self.width + x
+        return key
+
+    def __getitem__(self, key):
+        STATS['pixel_reads'] += 1
+        return self.data[self._index(key)]
+
+    def __setitem__(self, key, value):
+        STATS['pixel_writes'] += 1
+        if value >= self.value_count:
+            raise ValueError("pixel value out of range")
+        self.data[self._index(key)] = value
+
+    def fill(self, value):
+        STATS['pixel_writes'] += len(self.data)
+        for i in range(len(self.data)):
+            self.data[i] = value
+
+
+########## bitmaptools ##########
+
+def fill_region(dest_bitmap, x1, y1, x2, y2, value):
+    """One call, however many pixels; each also counts as a write."""
+    STATS['region_fills'] += 1
+    if value >= dest_bitmap.value_count:
+        raise ValueError("pixel value out of range")
+    x1 = max(0, x1)
+    y1 = max(0, y1)
+    x2 = min(dest_bitmap.width, x2)
+    y2 = min(dest_bitmap.height, y2)
+    for y in range(y1, y2):
+        for x in range(x1, x2):
+            STATS['pixel_writes'] += 1
+            STATS['region_pixels'] += 1
+            dest_bitmap.data[y * dest_bitmap.width + x] = value
+
+
+class Palette(object):
+    def __init__(self, color_count):
+        STATS['objects'] += 1
+        self.colors = [0] * color_count
+
+    def __len__(self):
+        return len(self.colors)
+
+    def __getitem__(self, index):
+        return self.colors[index]
+
+    def __setitem__(self, index, color):
+        self.colors[index] = color
+
+    def make_transparent(self, index):
+        pass
+
+
+class TileGrid(object):
+    def __init__(self, bitmap, pixel_shader=None, width=1, height=1, tile_width=None, tile_height=None,
+                 default_tile=0, x=0, y=0):
+        STATS['objects'] += 1
+        self.bitmap = bitmap
+        self.pixel_shader = pixel_shader
+        self.width = width
+        self.height = height
+        self.tile_width = tile_width or bitmap.width
+        self.tile_height = tile_height or bitmap.height
+        self.tiles = [default_tile] * (width * height)
+        self.x = x
+        self.y = y
+        self.hidden = False
+
+    def _index(self, key):
+        if isinstance(key, tuple):
+            return key[1] * self.width + key[0]
+        return key
+
+    def __getitem__(self, key):
+        return self.tiles[self._index(key)]
+
+    def __setitem__(self, key, tile):
+        STATS['tile_writes'] += 1
+        self.tiles[self._index(key)] = tile
+
+
+class Group(object):
+    def __init__(self, scale=1, x=0, y=0):
+        STATS['objects'] += 1
+        self.items = []
+        self.scale = scale
+        self.x = x
+        self.y = y
+        self.hidden = False
+
+    def append(self, layer):
+        self.items.append(layer)
+
+    def insert(self, index, layer):
+        self.items.insert(index, layer)
+
+    def remove(self, layer):
+        self.items.remove(layer)
+
+    def pop(self, index=-1):
+        return self.items.pop(index)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, index):
+        return self.items[index]
+
+    def __setitem__(self, index, layer):
+        self.items[index] = layer
+
+    def __delitem__(self, index):
+        del self.items[index]
+
+
+def release_displays():
+    pass
+
+
+########## fonts ##########
+
+class Glyph(object):
+    """A 3x5 glyph whose pixels are a fixed function of its code point."""
+
+    def __init__(self, code, width=3, height=5):
+        self.width = width
+        self.height = height
+        self.dx = 0
+        self.dy = 0
+        self.shift_x = width + 1
+        self.shift_y = 0
+        self.bitmap = Bitmap.__new__(Bitmap)
+        self.bitmap.width = width
+        self.bitmap.height = height
+        self.bitmap.value_count = 2
+        self.bitmap.data = bytearray(((code * 7 + i * 5) >> 2) & 1 for i in range(width * height))
+
+
+class Font(object):
+    def __init__(self, path=None):
+        self.path = path
+        self.glyphs = {}
+
+    def get_glyph(self, code):
+        glyph = self.glyphs.get(code)
+        if glyph is None:
+            glyph = self.glyphs[code] = Glyph(code)
+        return glyph
+
+    def load_glyphs(self, codes):
+        for code in codes:
+            self.get_glyph(code if isinstance(code, int) else ord(code))
+
+    def get_bounding_box(self):
+        return 3, 5, 0, 0
+
+
+def load_font(path, bitmap_class=None):
+    return Font(path)
+
+
+########## labels and shapes ##########
+
+class Label(Group):
+    def __init__(self, font, text='', x=0, y=0, anchored_position=None, anchor_point=None, color=0xFFFFFF,
+                 **kwargs):
+        super().__init__(x=x, y=y)
+        self.font = font
+        self._text = text
+        self.anchored_position = anchored_position
+        self.anchor_point = anchor_point
+        self.color = color
+
+    @property
+    def text(self):
+        return self._text
+
+    @text.setter
+    def text(self, text):
+        STATS['label_texts'] += 1
+        self._text = text
+
+
+class Rect(TileGrid):
+    def __init__(self, x, y, width, height, fill=None, outline=None, stroke=1):
+        super().__init__(Bitmap(width, height, 2), width=1, height=1, x=x, y=y)
+        self.fill = fill
+        self.outline = outline
+
+
+def modules():
+    """name -> module for everything sim.install() puts in sys.modules."""
+    displayio = types.ModuleType('displayio')
+    for obj in (Bitmap, Palette, TileGrid, Group, release_displays):
+        setattr(displayio, obj.__name__, obj)
+    bitmaptools = types.ModuleType('bitmaptools')
+    bitmaptools.fill_region = fill_region
+    terminalio = types.ModuleType('terminalio')
+    terminalio.FONT = Font('terminalio')
+    label_module = types.ModuleType('adafruit_display_text.label')
+    label_module.Label = Label
+    display_text = types.ModuleType('adafruit_display_text')
+    display_text.label = label_module
+    rect_module = types.ModuleType('adafruit_display_shapes.rect')
+    rect_module.Rect = Rect
+    shapes = types.ModuleType('adafruit_display_shapes')
+    shapes.rect = rect_module
+    bitmap_font_module = types.ModuleType('adafruit_bitmap_font.bitmap_font')
+    bitmap_font_module.load_font = load_font
+    bitmap_font_package = types.ModuleType('adafruit_bitmap_font')
+    bitmap_font_package.bitmap_font = bitmap_font_module
+    return {
+        'displayio': displayio,
+        'bitmaptools': bitmaptools,
+        'terminalio': terminalio,
+        'adafruit_display_text': display_text,
+        'adafruit_display_text.label': label_module,
+        'adafruit_display_shapes': shapes,
+        'adafruit_display_shapes.rect': rect_module,
+        'adafruit_bitmap_font': bitmap_font_package,
+        'adafruit_bitmap_font.bitmap_font': bitmap_font_module,
+    }
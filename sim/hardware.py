@@ -0,0 +1,235 @@
+# hardware.py
+#
+# Stand-ins for the boards' peripherals, all driven by one SimTime.
+#
+# SimTime is virtual monotonic time.  It also stands in for the `time`
+# module inside clock.py and sampler.py (see Simulation), so their sleeps
+# and monotonic reads are virtual too, and mktime is UTC as on CircuitPython.
+
+import calendar
+import fcntl
+import math
+import os
+import struct
+import termios
+import time
+import tty
+
+from sampler import temp_c_to_f
+
+
+class SimTime(object):
+    """Virtual monotonic seconds; sleep() advances it instead of waiting."""
+
+    def __init__(self, start=1000.0):
+        self.secs = float(start)
+
+    def monotonic(self):
+        return self.secs
+
+    def monotonic_ns(self):
+        return int(self.secs * 1000000000)
+
+    def sleep(self, secs):
+        self.secs += secs
+
+    def advance(self, secs):
+        self.secs += secs
+
+    # Pass-throughs for the rest of what the device modules use from `time`.
+    mktime = staticmethod(calendar.timegm)
+    gmtime = staticmethod(time.gmtime)
+    localtime = staticmethod(time.gmtime)
+
+
+class FakeRTC(object):
+    """A DS3231 whose .datetime is derived from the SimTime.
+
+    It reads epoch_secs at the moment of construction and then runs fast by
+    drift_ppm relative to the virtual monotonic clock.  Set .datetime (a
+    struct_time) to step it, as the real driver allows.
+    """
+
+    def __init__(self, sim_time, epoch_secs, drift_ppm=0.0):
+        self.sim_time = sim_time
+        self.drift_ppm = drift_ppm
+        self.reads = 0
+        self._set(epoch_secs)
+
+    def _set(self, epoch_secs):
+        self.base_epoch = epoch_secs
+        self.base_mono = self.sim_time.secs
+
+    def secs(self):
+        elapsed = self.sim_time.secs - self.base_mono
+        return int(math.floor(self.base_epoch + elapsed * (1 + self.drift_ppm * 1e-6)))
+
+    @property
+    def datetime(self):
+        self.reads += 1
+        return time.gmtime(self.secs())
+
+    @datetime.setter
+    def datetime(self, value):
+        self._set(calendar.timegm(value))
+
+
+def daily_wave(secs, mean, swing, peak_hour=15, noise=0.0):
+    """A diurnal sinusoid peaking at peak_hour UTC, plus deterministic ripple."""
+    phase = 2 * math.pi * ((secs / 3600.0 - peak_hour) / 24.0)
+    ripple = noise * math.sin(secs * 0.0137) * math.sin(secs * 0.00071)
+    return mean + swing * math.cos(phase) + ripple
+
+
+class FakeBME680(object):
+    """Scripted BME680 readings: each property is waveform(epoch_secs).
+
+    waveforms maps 'temperature' (C), 'humidity' (%), 'pressure' (hPa) and
+    'gas' (ohms) to functions of UTC seconds; the defaults are daily cycles.
+    """
+
+    def __init__(self, now, waveforms=None):
+        self.now = now
+        self.waveforms = {
+            'temperature': lambda t: daily_wave(t, 21.0, 3.0, noise=0.3),
+            'humidity': lambda t: daily_wave(t, 45.0, -8.0, noise=1.0),
+            'pressure': lambda t: daily_wave(t / 3.7, 1013.0, 6.0, noise=0.5),
+            'gas': lambda t: daily_wave(t, 60000.0, 25000.0, peak_hour=4, noise=4000.0),
+        }
+        if waveforms:
+            self.waveforms.update(waveforms)
+        self.readings = 0
+
+    @property
+    def temperature(self):
+        self.readings += 1
+        return self.waveforms['temperature'](self.now())
+
+    @property
+    def humidity(self):
+        return self.waveforms['humidity'](self.now())
+
+    @property
+    def pressure(self):
+        return self.waveforms['pressure'](self.now())
+
+    @property
+    def gas(self):
+        return int(self.waveforms['gas'](self.now()))
+
+
+class FakeBME680Reader(object):
+    """The sampler.BME680Reader interface over a FakeBME680.
+
+    A measurement started at start() is ready measure_secs of SimTime later,
+    and stays ready until the next start(), like the sensor's new-data flag.
+    """
+
+    measure_secs = 0.2
+
+    def __init__(self, sensor, sim_time):
+        self.sensor = sensor
+        self.sim_time = sim_time
+        self.num_channels = 4
+        self.ready_at = None
+
+    def start(self):
+        self.ready_at = self.sim_time.secs + self.measure_secs
+
+    def poll(self):
+        return self.ready_at is not None and self.sim_time.secs >= self.ready_at
+
+    def read(self, values):
+        s = self.sensor
+        values[0] = temp_c_to_f(s.temperature)
+        values[1] = s.humidity
+        values[2] = s.pressure
+        values[3] = s.gas
+
+
+class FakeDisplay(object):
+    """Counts show() and refresh() calls; keeps the group last shown."""
+
+    def __init__(self, width=256, height=64):
+        self.width = width
+        self.height = height
+        self.root_group = None
+        self.shows = 0
+        self.refreshes = 0
+
+    def show(self, group):
+        self.shows += 1
+        self.root_group = group
+
+    def refresh(self):
+        self.refreshes += 1
+        return True
+
+
+class FakeButton(object):
+    """A Debouncer whose presses happen at the given SimTime seconds."""
+
+    def __init__(self, sim_time, press_times=()):
+        self.sim_time = sim_time
+        self.press_times = sorted(press_times)
+        self.next_press = 0
+        self.rose = False
+
+    def update(self):
+        self.rose = False
+        if self.next_press < len(self.press_times) and self.press_times[self.next_press] <= self.sim_time.secs:
+            self.next_press += 1
+            self.rose = True
+
+
+class FakePin(object):
+    """A digital input that reads True during the given (start, stop) SimTime windows."""
+
+    def __init__(self, sim_time, active=()):
+        self.sim_time = sim_time
+        self.active = sorted(active)
+
+    @property
+    def value(self):
+        t = self.sim_time.secs
+        for start, stop in self.active:
+            if start <= t < stop:
+                return True
+            if start > t:
+                break
+        return False
+
+
+class PtySerial(object):
+    """A usb_cdc.Serial with timeout=0 and write_timeout=0, on a pseudo-terminal.
+
+    The app end is the pty's device end; a client opens the other end (or
+    the device's name) as if it were the board's serial port.
+    """
+
+    def __init__(self, fd):
+        self.fd = fd
+        tty.setraw(fd)
+        os.set_blocking(fd, False)
+
+    @classmethod
+    def open(cls):
+        """Returns (PtySerial on the device end, file descriptor of the client end)."""
+        client_fd, device_fd = os.openpty()
+        return cls(device_fd), client_fd
+
+    @property
+    def in_waiting(self):
+        return struct.unpack('i', fcntl.ioctl(self.fd, termios.FIONREAD, b'\0\0\0\0'))[0]
+
+    def readinto(self, buf):
+        try:
+            return os.readv(self.fd, [buf])
+        except BlockingIOError:
+            return 0
+
+    def write(self, buf):
+        try:
+            return os.write(self.fd, buf)
+        except BlockingIOError:
+            return 0
@@ -0,0 +1,32 @@
+# loop.py
+#
+# An asyncio event loop that runs on SimTime.
+#
+# asyncio decides how long to wait from loop.time() and then blocks in
+# selector.select(timeout).  Here time() reads the SimTime and select()
+# only polls, then advances the SimTime by the timeout, so every sleep in
+# every task completes immediately, in order, at its virtual deadline.
+
+import asyncio
+import selectors
+
+
+class VirtualTimeSelector(selectors.DefaultSelector):
+    def __init__(self, sim_time):
+        super().__init__()
+        self.sim_time = sim_time
+
+    def select(self, timeout=None):
+        events = super().select(0)
+        if not events and timeout is not None and timeout > 0:
+            self.sim_time.advance(timeout)
+        return events
+
+
+class SimEventLoop(asyncio.SelectorEventLoop):
+    def __init__(self, sim_time):
+        self.sim_time = sim_time
+        super().__init__(VirtualTimeSelector(sim_time))
+
+    def time(self):
+        return self.sim_time.secs
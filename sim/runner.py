@@ -0,0 +1,169 @@
+# runner.py
+#
+# Runs the whole application (app.build_app and ClockApp's tasks) on the
+# host against sim.hardware, on a SimEventLoop, at thousands of simulated
+# seconds per wall second.
+#
+#   python -m sim.runner --days 7
+#
+# Importing this module installs the fake display libraries, and a
+# Simulation patches clock.py and sampler.py to use its SimTime, so only
+# one Simulation should be live per process.
+
+import argparse
+import asyncio
+import calendar
+import os
+import tempfile
+import time
+
+import sim
+sim.install()
+
+import clock as clock_module  # noqa: E402
+import localclock  # noqa: E402
+import sampler  # noqa: E402
+from profiler import Profiler  # noqa: E402
+from sim import fakes  # noqa: E402
+from sim.hardware import (FakeBME680, FakeBME680Reader, FakeButton, FakeDisplay, FakePin, FakeRTC,  # noqa: E402
+                          SimTime)
+from sim.loop import SimEventLoop  # noqa: E402
+
+DEFAULT_START = calendar.timegm((2022, 5, 18, 12, 0, 0, 0, 0, 0))
+
+
+class Simulation(object):
+    """One device: fake RTC, sensor, display, button and PIR around build_app.
+
+    filename is the log file (by default data.csv in a fresh temporary
+    directory; use a .bin name for the binary format), and segments a
+    logstore.SegmentPolicy to split it by month.  export_port (e.g. a
+    sim.hardware.PtySerial) is served by the app's ExportServer.  The
+    startup metrics count host milliseconds from the start of the
+    constructor, so they include build_app.  press_times and
+    pir_active are in seconds from the start of the simulation.  The
+    button and PIR are polled every poll_secs rather than the device's
+    20 and 50 ms, which would dominate the host's run time.
+    """
+
+    def __init__(self, start_secs=DEFAULT_START, filename=None, drift_ppm=0.0, waveforms=None,
+                 press_times=(), pir_active=(), poll_secs=1.0, quiet=True, sample_secs=30, profiler=None,
+                 reset_free_bytes=None, segments=None, export_port=None, staged_boot=True):
+        # Imported here so sim.install() has run first whoever imports us.
+        from app import build_app
+        from profiler import ticks_ms
+        boot_ms = ticks_ms()
+
+        self.sim_time = SimTime()
+        t0 = self.sim_time.secs
+        clock_module.time = self.sim_time
+        clock_module.monotonic_ns = self.sim_time.monotonic_ns
+        sampler.time = self.sim_time
+        localclock.DO_LOG = not quiet
+
+        if filename is None:
+            self.tempdir = tempfile.mkdtemp(prefix='dlc-sim-')
+            filename = os.path.join(self.tempdir, 'data.csv')
+        self.filename = filename
+        self.rtc = FakeRTC(self.sim_time, start_secs, drift_ppm=drift_ppm)
+        self.sensor = FakeBME680(self.rtc.secs, waveforms=waveforms)
+        self.display = FakeDisplay()
+        self.button = FakeButton(self.sim_time, [t0 + t for t in press_times])
+        self.pir = FakePin(self.sim_time, [(t0 + a, t0 + b) for a, b in pir_active])
+        self.resets = 0
+
+        self.loop = SimEventLoop(self.sim_time)
+        asyncio.set_event_loop(self.loop)
+        self.clock = clock_module.RtcClock(self.rtc, log=localclock.log)
+        localclock.set_clock(self.clock)
+        self.app = build_app(self.clock, FakeBME680Reader(self.sensor, self.sim_time), self.display,
+                             self.button, self.pir, reset=self._reset, filename=filename,
+                             sample_secs=sample_secs, profiler=profiler, reset_free_bytes=reset_free_bytes,
+                             segments=segments, export_port=export_port, staged_boot=staged_boot,
+                             boot_ms=boot_ms)
+        self.app.button_poll_secs = poll_secs
+        self.app.pir_poll_secs = poll_secs
+        self.start_mono = self.sim_time.secs
+        self.main_task = self.loop.create_task(self.app.main())
+
+    def _reset(self):
+        # microcontroller.reset() would reboot; here the app just carries on.
+        self.resets += 1
+
+    @property
+    def elapsed_secs(self):
+        """Simulated seconds since the app started."""
+        return self.sim_time.secs - self.start_mono
+
+    def run(self, secs):
+        """Advance the simulation by secs of virtual time."""
+        self.loop.run_until_complete(asyncio.sleep(secs))
+        if self.main_task.done():
+            # A task raised; surface it.
+            self.main_task.result()
+
+    def close(self):
+        self.main_task.cancel()
+        try:
+            self.loop.run_until_complete(self.main_task)
+        except asyncio.CancelledError:
+            pass
+        self.loop.close()
+
+    def summary(self):
+        data_log = self.app.data_log
+        sensor_sampler = self.app.sensor_sampler
+        return [
+            ("simulated secs", int(self.elapsed_secs)),
+            ("records logged", data_log.records_logged),
+            ("bytes written", data_log.bytes_written),
+            ("flushes", data_log.flush_count),
+            ("sensor samples", sensor_sampler.samples),
+            ("RTC reads", self.clock.rtc_reads),
+            ("clock syncs", self.clock.syncs),
+            ("last sync error ms", self.clock.last_error_ms),
+            ("measured drift ppm", round(self.clock.drift_ppm, 3)),
+            ("display refreshes", self.display.refreshes),
+            ("watchdog resets", self.resets),
+            ("first frame ms", self.app.first_frame_ms),
+            ("full UI ms", self.app.full_ui_ms),
+            ("pixel writes", fakes.STATS['pixel_writes']),
+            ("tile writes", fakes.STATS['tile_writes']),
+            ("label text sets", fakes.STATS['label_texts']),
+        ]
+
+
+def print_stats(msg):
+    """Profiler output, shown even when the app's own logging is off."""
+    print(localclock.format_time(localclock.now()), ":", msg)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run data_logger_clock on simulated hardware.")
+    parser.add_argument('--days', type=float, default=1.0)
+    parser.add_argument('--file', default=None, help="log file (default: a temporary data.csv)")
+    parser.add_argument('--drift-ppm', type=float, default=0.0, help="how fast the fake RTC runs")
+    parser.add_argument('--poll-secs', type=float, default=1.0, help="button and PIR polling period")
+    parser.add_argument('--verbose', action='store_true', help="print the app's log lines")
+    parser.add_argument('--profile', type=float, default=0, metavar='MINUTES',
+                        help="print profiler stats every MINUTES (host timings) of simulated time")
+    args = parser.parse_args()
+
+    profiler = None
+    if args.profile:
+        profiler = Profiler(report_secs=args.profile * 60, log=print_stats)
+    s = Simulation(filename=args.file, drift_ppm=args.drift_ppm, poll_secs=args.poll_secs,
+                   quiet=not args.verbose, profiler=profiler)
+    started = time.perf_counter()
+    s.run(args.days * 24 * 60 * 60)
+    wall = time.perf_counter() - started
+    s.close()
+    for name, value in s.summary():
+        print("{:22s} {}".format(name, value))
+    print("{:22s} {:.2f}".format("wall secs", wall))
+    print("{:22s} {:.0f}".format("simulated secs/sec", s.elapsed_secs / wall))
+    print("log file", s.filename)
+
+
+if __name__ == '__main__':
+    main()
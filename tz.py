@@ -0,0 +1,155 @@
+# tz.py
+#
+# UTC -> local wall-clock conversion with daylight saving, using integer
+# arithmetic only.  A year's DST start and end instants are computed once
+# and cached, and consecutive calls within the same minute reuse the fields
+# already worked out, so the per-second cost is a compare and a tuple (or,
+# through second_of_minute, just the compare).
+
+import time
+
+dayname = ["Sun", "Mon", "Tue", "Wed", "Thu", "Fri", "Sat"]
+days_in_month = [31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
+# Days before the first of each month in a non-leap year.
+days_before_month = [0, 31, 59, 90, 120, 151, 181, 212, 243, 273, 304, 334]
+
+# A DST rule is (start, end), each (month, week, secs_after_midnight, utc):
+# week is 1-4 for the nth Sunday of the month or -1 for the last Sunday.
+# With utc False the time is local wall-clock time, i.e. standard time for
+# the start and daylight time for the end.
+RULES = {
+    # Second Sunday in March to first Sunday in November, 02:00 local.
+    'US': ((3, 2, 2 * 3600, False), (11, 1, 2 * 3600, False)),
+    # Last Sunday in March to last Sunday in October, 01:00 UTC.
+    'EU': ((3, -1, 3600, True), (10, -1, 3600, True)),
+    None: None,
+}
+
+
+def is_leap(year):
+    return (year % 4) == 0 and ((year % 100) != 0 or (year % 400) == 0)
+
+
+def days_from_civil(year, month, day):
+    """Days since 1970-01-01 for a Gregorian date."""
+    days = 365 * (year - 1970) + (year - 1969) // 4 - (year - 1901) // 100 + (year - 1601) // 400
+    days += days_before_month[month - 1] + day - 1
+    if month > 2 and is_leap(year):
+        days += 1
+    return days
+
+
+def civil_from_days(days):
+    """(year, month, day, yday) for days since 1970-01-01; yday starts at 1."""
+    # Shift to a March-based era so the leap day is the last of the year.
+    days += 719468
+    era = days // 146097
+    doe = days - era * 146097
+    yoe = (doe - doe // 1460 + doe // 36524 - doe // 146096) // 365
+    doy = doe - (365 * yoe + yoe // 4 - yoe // 100)
+    mp = (5 * doy + 2) // 153
+    day = doy - (153 * mp + 2) // 5 + 1
+    month = mp + 3 if mp < 10 else mp - 9
+    year = yoe + era * 400 + (1 if month <= 2 else 0)
+    if mp < 10:
+        yday = doy + 60 + (1 if is_leap(year) else 0)
+    else:
+        yday = doy - 305
+    return year, month, day, yday
+
+
+def day_of_week(year, month, day):
+    """0 = Sunday."""
+    # 1970-01-01 was a Thursday (4)
+    return (4 + days_from_civil(year, month, day)) % 7
+
+
+def nth_sunday(year, month, week):
+    """Day-of-month of the week-th Sunday (or the last one, for week -1)."""
+    if week > 0:
+        return 1 + ((7 - day_of_week(year, month, 1)) % 7) + 7 * (week - 1)
+    last = days_in_month[month - 1] + (1 if month == 2 and is_leap(year) else 0)
+    return last - day_of_week(year, month, last)
+
+
+def first_sunday(year, month):
+    """Return day-of-month of first Sunday in specified month."""
+    return nth_sunday(year, month, 1)
+
+
+class TimeZone(object):
+    """A fixed standard offset plus an optional DST rule from RULES."""
+
+    def __init__(self, std_hours=0, rule=None, dst_hours=1):
+        self.std_secs = int(3600 * std_hours)
+        self.dst_secs = int(3600 * dst_hours)
+        self.rule = RULES[rule] if (rule is None or isinstance(rule, str)) else rule
+        # (start_utc, end_utc) of DST for cache_year, which spans
+        # [year_start, year_end) in UTC.
+        self.cache_year = None
+        self.year_start = 0
+        self.year_end = 0
+        self.dst_start = 0
+        self.dst_end = 0
+        # Fields for the local minute beginning at minute_utc.
+        self.minute_utc = None
+        self.minute_fields = None
+
+    def _transition(self, year, spec, offset_secs):
+        month, week, secs, utc = spec
+        day = nth_sunday(year, month, week)
+        instant = days_from_civil(year, month, day) * 86400 + secs
+        if not utc:
+            instant -= offset_secs
+        return instant
+
+    def transitions(self, year):
+        """UTC instants (start, end) of DST in year; cached for the last year asked."""
+        if year != self.cache_year:
+            start, end = self.rule
+            self.dst_start = self._transition(year, start, self.std_secs)
+            self.dst_end = self._transition(year, end, self.std_secs + self.dst_secs)
+            self.year_start = days_from_civil(year, 1, 1) * 86400 - self.std_secs
+            self.year_end = days_from_civil(year + 1, 1, 1) * 86400 - self.std_secs
+            self.cache_year = year
+        return self.dst_start, self.dst_end
+
+    def is_dst(self, secs_in_utc):
+        if self.rule is None:
+            return False
+        # Only work out the year when we leave the cached one.
+        if self.cache_year is None or not self.year_start <= secs_in_utc < self.year_end:
+            self.transitions(civil_from_days((secs_in_utc + self.std_secs) // 86400)[0])
+        return self.dst_start <= secs_in_utc < self.dst_end
+
+    def utc_offset(self, secs_in_utc):
+        """Seconds to add to UTC to get local time."""
+        if self.is_dst(secs_in_utc):
+            return self.std_secs + self.dst_secs
+        return self.std_secs
+
+    def second_of_minute(self, secs_in_utc):
+        """Local seconds past the minute; minute_fields then describes that minute.
+
+        minute_fields is (year, month, day, hour, minute, wday, yday, isdst),
+        rebuilt only when the minute changes, so a caller ticking every
+        second allocates nothing here.
+        """
+        secs_in_minute = secs_in_utc - self.minute_utc if self.minute_utc is not None else -1
+        if not 0 <= secs_in_minute < 60:
+            dst = self.is_dst(secs_in_utc)
+            local = secs_in_utc + self.std_secs + (self.dst_secs if dst else 0)
+            days, secs_of_day = divmod(local, 86400)
+            year, month, day, yday = civil_from_days(days)
+            hour, secs_of_hour = divmod(secs_of_day, 3600)
+            minute, secs_in_minute = divmod(secs_of_hour, 60)
+            # tm_wday is 0 for Monday; 1970-01-01 was a Thursday.
+            self.minute_fields = (year, month, day, hour, minute, (days + 3) % 7, yday, 1 if dst else 0)
+            self.minute_utc = secs_in_utc - secs_in_minute
+        return secs_in_minute
+
+    def localtime(self, secs_in_utc):
+        """Local time as a time.struct_time, like time.localtime()."""
+        secs_in_minute = self.second_of_minute(secs_in_utc)
+        f = self.minute_fields
+        return time.struct_time((f[0], f[1], f[2], f[3], f[4], secs_in_minute, f[5], f[6], f[7]))